@@ -1,17 +1,27 @@
-from resources import model_funcs, app_funcs, app_classes
+import os
+import time
+launch_time = time.perf_counter()
+
+from resources import app_funcs, app_classes, backend_funcs, cache_funcs, label_funcs, log_funcs, plot_funcs
 
 from pyautogui import size
 
-import PIL.Image
-import PIL.ImageTk
-import time
 from tkinter import *
 from tkinter import ttk
 
 
-unique_labels = model_funcs.unique_labels_maker("./data/labels.csv")
-identibreed = model_funcs.load_model("./models/20230511-14531683809630-full-image-set-MobileNetV2-Adam-v2.h5")
+app_funcs.startup_times["launch"] = launch_time
 app_version = "0.3.0"
+config_dict = app_funcs.config_reader(app_version)
+model_path = config_dict["model"]
+if not os.path.exists(model_path):
+    print(f"There is no {model_path}, using the original model instead.")
+    model_path = label_funcs.DEFAULT_MODEL
+unique_labels = label_funcs.load_label_index(model_path, "./data/labels.csv")["names"]
+backend = backend_funcs.available_backend(model_path, config_dict["backend"])
+identibreed = app_classes.LazyModel(model_path, backend)
+# The TFLite backends give slightly different probabilities, so the cache belongs to the file the predictions come from
+prediction_cache = cache_funcs.PredictionCache("./user/cache", backend_funcs.results_path(model_path, backend))
 
 root = Tk()
 root.title(f"IdentiBreed v. {app_version}")
@@ -22,7 +32,9 @@ save_method = StringVar()
 width, height = size()
 width_multiplier = int(width)/1440
 height_multiplier = int(height)/900
-config_dict = app_funcs.config_reader(app_version)
+image_writer = plot_funcs.ImageWriter(plot_funcs.export_settings(config_dict))
+# Evaluations of a session that didn't get to write its log are turned into one now
+log_funcs.recover_journals("./user/evaluation_logs")
 
 # Frames
 mainframe = ttk.Frame(root,width=1090, height=900)
@@ -31,12 +43,12 @@ display = ttk.Frame(mainframe, width=200)
 input_source_frame = app_classes.InputSource(sidebar)
 make_predictions_frame = LabelFrame(sidebar, text="Predict Breeds", height=50, width=200)
 save_method_frame = LabelFrame(sidebar, text="Select Save Method")
-prediction_frame = app_classes.PredictionImage(display)
+prediction_frame = app_classes.PredictionImage(display, prediction_cache, image_writer=image_writer)
 navigation_frame = app_classes.NavigationFrame(sidebar, prediction_frame)
 
 
 # Test Button - Use only when experimenting with new functions!!
-# test_button = ttk.Button(sidebar, text="Test", command=lambda: print(navigation_frame.evaluation_frame.log_file))
+# test_button = ttk.Button(sidebar, text="Test", command=lambda: print(navigation_frame.evaluation_frame.journal.journal_path))
 # test_button.grid(column=7, row=0)
 
 # Widgets
@@ -51,7 +63,9 @@ save_separator = ttk.Separator(save_method_frame, orient="horizontal")
 output_folder_label = ttk.Label(save_method_frame, text="Saved Images Directory")
 output_folder_label["anchor"] = "center"
 output_folder = ttk.Button(save_method_frame, text="Output Folder", width=10, command=lambda: app_funcs.open_directory("output"))
-predict_button = ttk.Button(make_predictions_frame, text="Make Predictions", default="active", command=lambda: app_funcs.predict_button_command(input_source_frame, save_method, prediction_frame, unique_labels, identibreed, predict_label, [save_all_button, save_none_button, save_manually_button], navigation_frame, sidebar, app_version))
+export_all_button = ttk.Button(save_method_frame, text="Export All", width=10, command=lambda: app_funcs.export_all_command(prediction_frame, predict_label, export_all_button))
+predict_button = ttk.Button(make_predictions_frame, text="Make Predictions", default="active", command=lambda: app_funcs.predict_button_command(input_source_frame, save_method, prediction_frame, unique_labels, identibreed, predict_label, [save_all_button, save_none_button, save_manually_button], navigation_frame, sidebar, app_version, [predict_button, cancel_button]))
+cancel_button = ttk.Button(make_predictions_frame, text="Cancel", state=["disabled"], command=lambda: prediction_frame.cancel_prediction())
 
 # Grid settings
 mainframe.grid(column=0, row=0, sticky=(N, S, E, W))
@@ -62,7 +76,8 @@ make_predictions_frame.grid(column=1, row=0, columnspan=3, sticky=(N, S, E, W))
 navigation_frame.grid(column=0, row=2, columnspan=2, sticky=(N, S, E, W))
 prediction_frame.grid(column=0, row=0, columnspan=3, rowspan=2, sticky=(N, S, E, W))
 predict_label.grid(column=0, row=0, columnspan= 3, sticky=(N,S,E,W))
-predict_button.grid(column=0, row=1, columnspan=3, sticky=(N,S,E,W))
+predict_button.grid(column=0, row=1, columnspan=2, sticky=(N,S,E,W))
+cancel_button.grid(column=2, row=1, sticky=(N,S,E,W))
 save_method_frame.grid(column= 0, row= 1, columnspan=4, sticky=(N,S,E,W))
 save_method_label.grid(column= 0, row= 0, columnspan=3, sticky=(N,S,E,W))
 save_all_button.grid(column= 0, row= 1, sticky=(N,S,E,W))
@@ -71,6 +86,7 @@ save_manually_button.grid(column= 2, row= 1, sticky=(N,S,E,W))
 output_folder_label.grid(column=4, row=0, sticky=(N,S,E,W))
 save_separator.grid(column=3, row=0, rowspan=2, sticky=(N,S,E,W))
 output_folder.grid(column=4, row=1, sticky=(N,S,E,W))
+export_all_button.grid(column=4, row=2, sticky=(N,S,E,W))
 
 
 
@@ -104,7 +120,12 @@ for frame in frames:
 root.minsize(width=int(round(1090*width_multiplier)), height=int(round(450*height_multiplier)))
 root.maxsize(width=int(round(1090*width_multiplier)), height=int(round(900*height_multiplier)))
 
+# The window shows up first, the model loads in the background afterwards
+root.after_idle(lambda: (app_funcs.log_startup_time("window shown"), identibreed.load_async()))
 root.mainloop()
 
 
 
+
+# Predictions still queued for saving get written before the app quits
+image_writer.wait()
\ No newline at end of file
@@ -0,0 +1,125 @@
+import argparse
+import contextlib
+import csv
+import fnmatch
+import json
+import os
+import sys
+import time
+
+from resources import backend_funcs, cache_funcs, image_funcs, label_funcs, predict_funcs
+
+DEFAULT_INCLUDE = ["*" + extension for extension in image_funcs.IMAGE_EXTENSIONS]
+
+
+def find_images(directory, include=DEFAULT_INCLUDE, exclude=(), max_bytes=200 * 1024 * 1024):
+    """
+    This function takes a directory, a list of glob patterns of files to include and a list of glob patterns to exclude.
+    Patterns are matched (case insensitive) against both the file name and the path relative to 'directory'.
+    Hidden files, empty files and files bigger than 'max_bytes' are skipped (see 'image_funcs.scan_images').
+
+    Returns a sorted list of image paths found in the whole directory tree
+    """
+    def matches(rel_path, patterns):
+        return any(fnmatch.fnmatch(rel_path.lower(), pattern.lower()) or
+                   fnmatch.fnmatch(os.path.basename(rel_path).lower(), pattern.lower()) for pattern in patterns)
+
+    img_paths = []
+    # The globs do the filtering here, so the scanner itself doesn't filter by extension
+    for img_path in image_funcs.scan_images(directory, extensions=None, max_bytes=max_bytes):
+        rel_path = os.path.relpath(img_path, directory)
+        if matches(rel_path, include) and not matches(rel_path, exclude):
+            img_paths.append(img_path)
+
+    return img_paths
+
+class ResultWriter:
+    def __init__(self, output, output_format, top_k):
+        """
+        This creates a writer that streams prediction results into 'output' (an opened file) as they come, either as
+        CSV rows or as JSON Lines, with the 'top_k' predicted labels and confidences for each image.
+        """
+        self.output = output
+        self.output_format = output_format
+        self.top_k = top_k
+        if output_format == "csv":
+            self.csv_writer = csv.writer(output)
+            header = ["path"]
+            for rank in range(1, top_k+1):
+                header += [f"label_{rank}", f"confidence_{rank}"]
+            self.csv_writer.writerow(header)
+
+    def write(self, results):
+        for img_path, pred_dict, _ in results:
+            labels = [str(label) for label in pred_dict["top_5_labels"][:self.top_k]]
+            confidences = [round(float(confidence), 6) for confidence in pred_dict["top_5_confidences"][:self.top_k]]
+            if self.output_format == "csv":
+                row = [img_path]
+                for label, confidence in zip(labels, confidences):
+                    row += [label, confidence]
+                self.csv_writer.writerow(row)
+            else:
+                record = {"path": img_path, "top_k": [{"label": label, "confidence": confidence} for label, confidence in zip(labels, confidences)]}
+                self.output.write(json.dumps(record) + "\n")
+        self.output.flush()
+
+def classify(args):
+    """
+    Classifies every image found under 'args.directory' and streams the results into 'args.output'.
+    """
+    max_bytes = args.max_size_mb * 1024 * 1024
+    if args.manifest:
+        img_paths = image_funcs.read_manifest(args.manifest, max_bytes=max_bytes)
+        print(f"Found {len(img_paths)} images listed in {args.manifest}", file=sys.stderr)
+    else:
+        img_paths = find_images(args.directory, args.include or DEFAULT_INCLUDE, args.exclude, max_bytes)
+        print(f"Found {len(img_paths)} images in {args.directory}", file=sys.stderr)
+
+    output_format = args.format or ("csv" if str(args.output).endswith(".csv") else "jsonl")
+    output = sys.stdout if args.output == "-" else open(args.output, "w", newline="")
+    writer = ResultWriter(output, output_format, args.top_k)
+
+    # Everything the prediction functions print goes to stderr, so it doesn't mix with results streamed to stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        # The model (and TensorFlow, unless it's a TFLite backend) is only loaded once we know there is something to classify
+        unique_labels = label_funcs.load_label_index(args.model, args.labels)["names"]
+        backend = backend_funcs.available_backend(args.model, args.backend)
+        model = backend_funcs.load_backend(args.model, backend)
+        model_file = backend_funcs.results_path(args.model, backend)
+        cache = cache_funcs.PredictionCache(args.cache_dir, model_file, args.cache_size_mb * 1024 * 1024) if args.cache_dir else None
+
+        # Results are written as each batch comes out of the model, none of them are kept around
+        start, n_classified = time.perf_counter(), 0
+        for done, total, results in predict_funcs.iter_prediction_batches(img_paths, unique_labels, model, args.batch_size, keep_images=False, cache=cache):
+            writer.write(results)
+            n_classified += len(results)
+            print(f"{done}/{total} files", file=sys.stderr, end="\r")
+        elapsed = time.perf_counter() - start
+    if output is not sys.stdout:
+        output.close()
+
+    print(f"Classified {n_classified} images ({len(img_paths) - n_classified} skipped) in {elapsed:.1f}s - "
+          f"{n_classified / max(elapsed, 1e-9):.1f} images/sec", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Classify dog breeds in a whole directory tree without the app window")
+    parser.add_argument("directory", nargs="?", default=None, help="directory with images, searched recursively")
+    parser.add_argument("--manifest", default=None, help="text file listing the images to classify (one path per line) instead of a directory")
+    parser.add_argument("-o", "--output", default="-", help="output file (.csv or .jsonl), '-' for stdout")
+    parser.add_argument("--format", choices=["csv", "jsonl"], default=None, help="defaults to the output file extension")
+    parser.add_argument("--include", action="append", default=None, help="glob of files to classify, can be repeated")
+    parser.add_argument("--exclude", action="append", default=[], help="glob of files to skip, can be repeated")
+    parser.add_argument("--max-size-mb", type=int, default=200, help="files bigger than this are skipped without being opened")
+    parser.add_argument("--top-k", type=int, choices=range(1, 6), default=5, help="how many labels to report per image")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--model", default=label_funcs.DEFAULT_MODEL)
+    parser.add_argument("--backend", choices=backend_funcs.BACKENDS, default="compiled", help="the TFLite backends have to be exported with model_tools.py first")
+    parser.add_argument("--cache-dir", default=None, help="keep predictions here, so unchanged images skip the model next time")
+    parser.add_argument("--cache-size-mb", type=int, default=256)
+    parser.add_argument("--labels", default="./data/labels.csv", help="used only if the model's label index has to be rebuilt")
+
+    args = parser.parse_args()
+    if (args.directory is None) == (args.manifest is None):
+        parser.error("give either a directory or a --manifest")
+    classify(args)
@@ -0,0 +1,270 @@
+import tensorflow as tf
+import pandas as pd
+import numpy as np
+import argparse
+import http.client
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import PIL.Image
+
+from resources import backend_funcs, image_funcs, label_funcs, model_funcs, predict_funcs
+
+
+def training_files(labels_csv_path="./data/labels.csv", limit=None):
+    """
+    This function takes a path to the Kaggle 'labels.csv' file and optionally a limit of images.
+    It recreates the training file paths and boolean labels the same way the 'IdentiBreed.ipynb' notebook does.
+
+    Returns list of image paths and list of boolean labels
+    """
+    labels_csv = pd.read_csv(labels_csv_path)
+    unique_labels = np.unique(np.array(labels_csv["breed"]))
+    file_paths = [f"./data/train/{id}.jpg" for id in labels_csv["id"]]
+    bool_labels = [label == unique_labels for label in labels_csv["breed"]]
+
+    return file_paths[:limit], bool_labels[:limit]
+
+def images_per_second(data_batch, epochs=1):
+    """
+    This function takes a batched dataset and iterates over it 'epochs' times without any model attached.
+
+    Returns a list with the images/sec measured for each epoch
+    """
+    results = []
+    for _ in range(epochs):
+        n_images = 0
+        start = time.perf_counter()
+        for images, _labels in data_batch:
+            n_images += int(images.shape[0])
+        results.append(n_images / (time.perf_counter() - start))
+
+    return results
+
+def pipeline_benchmark(args):
+    """
+    Compares the input pipeline as it used to be (single threaded decoding, no prefetching) with 'minibatch_maker'.
+    """
+    X, y = training_files(args.labels, args.limit)
+    print(f"Benchmarking the input pipeline on {len(X)} training images, batch size {args.batch_size}")
+
+    # The pipeline as it was before - one core decoding, no prefetch and no cache
+    data = tf.data.Dataset.from_tensor_slices((tf.constant(X), tf.constant(y)))
+    data = data.shuffle(buffer_size=len(X)).map(model_funcs.create_tensor_img_tuple).batch(args.batch_size)
+    before = images_per_second(data, args.epochs)
+
+    after = images_per_second(model_funcs.minibatch_maker(X, args.batch_size, y=y, cache=args.cache), args.epochs)
+
+    for epoch, (old, new) in enumerate(zip(before, after)):
+        print(f"Epoch {epoch+1}: before {old:.1f} images/sec, after {new:.1f} images/sec ({new/old:.2f}x)")
+
+def server_benchmark(args):
+    """
+    Load-tests a running 'inference_server.py' with concurrent clients, each one keeping its own connection open.
+    """
+    if os.path.isdir(args.images):
+        img_paths = sorted(os.path.join(args.images, file) for file in os.listdir(args.images) if not file.startswith("."))
+    else:
+        img_paths = [args.images]
+    bodies = []
+    for img_path in img_paths[:64]:
+        with open(img_path, "rb") as file:
+            bodies.append(file.read())
+
+    latencies, statuses = [], []
+    lock = threading.Lock()
+    def client(client_idx):
+        connection = http.client.HTTPConnection("127.0.0.1", args.port, timeout=60)
+        for request_idx in range(client_idx, args.requests, args.concurrency):
+            body = bodies[request_idx % len(bodies)]
+            start = time.perf_counter()
+            connection.request("POST", "/predict", body=body, headers={"Content-Type": "application/octet-stream"})
+            response = connection.getresponse()
+            response.read()
+            with lock:
+                latencies.append((time.perf_counter() - start) * 1000)
+                statuses.append(response.status)
+        connection.close()
+
+    print(f"Sending {args.requests} requests from {args.concurrency} clients to http://127.0.0.1:{args.port}/predict")
+    start = time.perf_counter()
+    clients = [threading.Thread(target=client, args=(idx,)) for idx in range(args.concurrency)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    ok = statuses.count(200)
+    print(f"{ok}/{len(statuses)} OK, {statuses.count(503)} rejected (queue full)")
+    print(f"p50 {np.percentile(latencies, 50):.1f} ms, p99 {np.percentile(latencies, 99):.1f} ms, {len(statuses) / elapsed:.1f} requests/sec")
+
+def peak_rss_mb():
+    """
+    Returns the peak resident memory of this process in MB
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+def synthetic_photos(directory, n_images, width=4000, height=3000):
+    """
+    Fills 'directory' with 'n_images' random noise JPEGs of width x height pixels (12 MP by default), like phone photos.
+    """
+    rng = np.random.default_rng(7821)
+    # Noise compresses badly, so a smaller tile is scaled up to keep the files realistically sized
+    for idx in range(n_images):
+        tile = rng.integers(0, 255, size=(height // 8, width // 8, 3), dtype="uint8")
+        PIL.Image.fromarray(tile).resize((width, height)).save(os.path.join(directory, f"photo_{idx:04d}.jpg"), quality=90)
+
+def decode_benchmark(args):
+    """
+    Measures how many milliseconds it takes to decode a 12 MP JPEG into the RGB pixels the model input is made from,
+    decoding the full resolution (as it used to be) versus the reduced-size decoding of 'image_funcs.decode_rgb'.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        directory = args.directory
+        if directory is None:
+            print(f"Creating {args.synthetic} synthetic 12 MP photos...")
+            synthetic_photos(temp_dir, args.synthetic)
+            directory = temp_dir
+        img_paths = sorted(os.path.join(directory, file) for file in os.listdir(directory) if file.lower().endswith((".jpg", ".jpeg")))
+
+        def full_decode(img_path):
+            with PIL.Image.open(img_path) as image_file:
+                return np.asarray(image_file.convert("RGB"))
+
+        for name, decode in (("before (full resolution)", full_decode), ("after (reduced-size DCT)", image_funcs.decode_rgb)):
+            timings = []
+            for img_path in img_paths:
+                start = time.perf_counter()
+                decode(img_path)
+                timings.append((time.perf_counter() - start) * 1000)
+            print(f"{name}: {np.mean(timings):.1f} ms per image on average, p50 {np.percentile(timings, 50):.1f} ms, p99 {np.percentile(timings, 99):.1f} ms")
+
+def memory_benchmark(args):
+    """
+    Measures the peak memory of 'predict_user_images' over a whole folder.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        directory = args.directory
+        if directory is None:
+            print(f"Creating {args.synthetic} synthetic 12 MP photos...")
+            synthetic_photos(temp_dir, args.synthetic)
+            directory = temp_dir
+
+        # What the same folder used to cost - a full resolution int32 array and a float32 224x224 Tensor per image
+        old_bytes = 0
+        for file in os.listdir(directory):
+            try:
+                with PIL.Image.open(os.path.join(directory, file)) as image_file:
+                    old_bytes += image_file.width * image_file.height * len(image_file.getbands()) * 4 + 224 * 224 * 3 * 4
+            except OSError:
+                pass
+
+        unique_labels = label_funcs.load_label_index(args.model, args.labels)["names"]
+        model = model_funcs.load_model(args.model)
+        rss_before = peak_rss_mb()
+        dir_list, predicted_files, image_arrays, _ = predict_funcs.predict_user_images(directory, unique_labels, model, args.batch_size)
+        # The evaluation goes through all full resolution images, which is the worst case for the ImageArrays store
+        image_arrays.max_bytes = args.memory_limit_mb * 1024 * 1024
+        for _ in image_arrays:
+            pass
+        rss_after = peak_rss_mb()
+
+    kept_bytes = sum(pred_dict["image"].nbytes for pred_dict in predicted_files) + image_arrays.cached_bytes
+    print(f"{len(dir_list)} images predicted")
+    print(f"Images kept in memory: {kept_bytes / 1024 / 1024:.1f} MB (previously {old_bytes / 1024 / 1024:.1f} MB)")
+    print(f"Peak RSS: {rss_before:.1f} MB after loading the model, {rss_after:.1f} MB after predicting and evaluating")
+
+def startup_launch(args):
+    """
+    One launch of the 'startup' benchmark, run in a fresh process: loads the model with a single backend, predicts the
+    first batch and then 'args.batches' more. The last line printed is the result as JSON.
+    """
+    rng = np.random.default_rng(7821)
+    # The last batch of a folder is usually smaller than the rest, which is exactly where Keras sets itself up again
+    batch_sizes = [args.batch_size, args.batch_size, args.batch_size // 2 + 1, args.batch_size, 1]
+    start = time.perf_counter()
+    model = backend_funcs.load_backend(args.model, args.launch)
+    load_seconds = time.perf_counter() - start
+
+    timings = []
+    for batch_idx in range(args.batches + 1):
+        images = rng.random((batch_sizes[batch_idx % len(batch_sizes)], 224, 224, 3), dtype="float32")
+        start = time.perf_counter()
+        model.predict(images, verbose=0)
+        timings.append((time.perf_counter() - start) * 1000)
+    print(json.dumps({"load_s": load_seconds, "first_ms": timings[0], "steady_ms": timings[1:]}))
+
+def startup_benchmark(args):
+    """
+    Measures the cold first prediction and the steady state milliseconds per batch of each backend. Every launch is a
+    fresh process, the way the app starts. The compiled backends are launched twice - the first launch traces and saves
+    the function, the second one loads it.
+    """
+    for backend in args.backends:
+        for launch in range(2 if backend.startswith("compiled") else 1):
+            command = [sys.executable, __file__, "startup", "--launch", backend, "--model", args.model,
+                       "--batch-size", str(args.batch_size), "--batches", str(args.batches)]
+            output = subprocess.run(command, capture_output=True, text=True)
+            if output.returncode != 0:
+                print(f"{backend}: failed\n{output.stderr[-2000:]}")
+                continue
+            result = json.loads(output.stdout.strip().splitlines()[-1])
+            name = f"{backend} ({'first' if launch == 0 else 'later'} launch)" if backend.startswith("compiled") else backend
+            print(f"{name}: loaded in {result['load_s']:.1f} s, first prediction {result['first_ms']:.0f} ms, "
+                  f"then {np.mean(result['steady_ms']):.1f} ms per batch on average (p50 {np.percentile(result['steady_ms'], 50):.1f} ms, "
+                  f"p99 {np.percentile(result['steady_ms'], 99):.1f} ms)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="IdentiBreed performance benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    pipeline_parser = subparsers.add_parser("pipeline", help="images/sec of the training input pipeline")
+    pipeline_parser.add_argument("--labels", default="./data/labels.csv")
+    pipeline_parser.add_argument("--limit", type=int, default=None, help="only use the first N images")
+    pipeline_parser.add_argument("--batch-size", type=int, default=32)
+    pipeline_parser.add_argument("--epochs", type=int, default=2)
+    pipeline_parser.add_argument("--cache", default=None, help="'memory' or a path to a cache file")
+    pipeline_parser.set_defaults(func=pipeline_benchmark)
+
+    server_parser = subparsers.add_parser("server", help="p50/p99 latency and requests/sec of a running inference_server.py")
+    server_parser.add_argument("images", help="an image or a directory of images to send")
+    server_parser.add_argument("--port", type=int, default=8321)
+    server_parser.add_argument("--requests", type=int, default=500)
+    server_parser.add_argument("--concurrency", type=int, default=16)
+    server_parser.set_defaults(func=server_benchmark)
+
+    decode_parser = subparsers.add_parser("decode", help="milliseconds to decode a 12 MP JPEG, before and after")
+    decode_parser.add_argument("--directory", default=None, help="folder of JPEGs, synthetic photos are used if not given")
+    decode_parser.add_argument("--synthetic", type=int, default=50, help="how many synthetic 12 MP photos to create")
+    decode_parser.set_defaults(func=decode_benchmark)
+
+    memory_parser = subparsers.add_parser("memory", help="peak memory of predicting a whole folder")
+    memory_parser.add_argument("--directory", default=None, help="folder of images, synthetic photos are used if not given")
+    memory_parser.add_argument("--synthetic", type=int, default=500, help="how many synthetic 12 MP photos to create")
+    memory_parser.add_argument("--memory-limit-mb", type=int, default=256, help="memory ceiling of the full resolution images")
+    memory_parser.add_argument("--batch-size", type=int, default=32)
+    memory_parser.add_argument("--model", default=label_funcs.DEFAULT_MODEL)
+    memory_parser.add_argument("--labels", default="./data/labels.csv")
+    memory_parser.set_defaults(func=memory_benchmark)
+
+    startup_parser = subparsers.add_parser("startup", help="cold first prediction and steady state ms per batch of each backend")
+    startup_parser.add_argument("--backends", nargs="+", choices=backend_funcs.BACKENDS, default=["keras", "compiled", "compiled-xla"])
+    startup_parser.add_argument("--batch-size", type=int, default=32)
+    startup_parser.add_argument("--batches", type=int, default=50, help="how many batches to time after the first one")
+    startup_parser.add_argument("--model", default=label_funcs.DEFAULT_MODEL)
+    startup_parser.add_argument("--launch", choices=backend_funcs.BACKENDS, default=None, help=argparse.SUPPRESS)
+    startup_parser.set_defaults(func=startup_benchmark)
+
+    args = parser.parse_args()
+    if getattr(args, "launch", None):
+        args.func = startup_launch
+    args.func(args)
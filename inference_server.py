@@ -0,0 +1,244 @@
+import numpy as np
+import argparse
+import bisect
+import json
+import queue
+import threading
+import time
+
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from resources import backend_funcs, label_funcs, predict_funcs
+
+
+# The server only ever listens on the loopback interface
+HOST = "127.0.0.1"
+MAX_UPLOAD_BYTES = 20 * 1024 * 1024
+
+
+class Histogram:
+    def __init__(self, buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000), unit="ms"):
+        """
+        This creates a thread safe histogram, by default of request latencies in milliseconds. Every bucket counts the 
+        values that were at most that large, the last one counts everything above the largest bucket.
+        """
+        self.buckets = list(buckets)
+        self.unit = unit
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        with self.lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.total += 1
+
+    def percentile(self, q):
+        """
+        Returns the upper bound of the bucket the q-th percentile falls into (None if nothing was recorded yet)
+        """
+        with self.lock:
+            if self.total == 0:
+                return None
+            threshold = q / 100 * self.total
+            seen = 0
+            for bucket, count in zip(self.buckets + [float("inf")], self.counts):
+                seen += count
+                if seen >= threshold:
+                    return bucket
+
+    def summary(self):
+        with self.lock:
+            buckets = {f"<={bucket}{self.unit}": count for bucket, count in zip(self.buckets, self.counts)}
+            buckets[f">{self.buckets[-1]}{self.unit}"] = self.counts[-1]
+            total = self.total
+        return {"count": total, "p50": self.percentile(50), "p99": self.percentile(99), "buckets": buckets}
+
+class MicroBatcher:
+    def __init__(self, model, unique_labels, max_batch_size=32, max_wait_ms=10, max_queue=256):
+        """
+        This creates a micro-batcher that sits between the HTTP handlers and the model. The handlers decode the images in
+        their own threads and put the ready image Tensors in a bounded queue. A single worker thread takes them out in
+        batches of at most 'max_batch_size', waiting no longer than 'max_wait_ms' for the batch to fill up, before calling
+        'model.predict' once for the whole batch. So the decoding runs as concurrently as the requests come in and the
+        worker does nothing but predict.
+        """
+        self.model = model
+        self.unique_labels = unique_labels
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.requests = queue.Queue(maxsize=max_queue)
+        self.batch_sizes = Histogram(buckets=[1, 2, 4, 8, 16, 32, 64, 128], unit="")
+        threading.Thread(target=self.worker, daemon=True).start()
+
+    def submit(self, image_tensor):
+        """
+        This method takes a decoded image Tensor (see 'decode').
+        If the queue is full it raises queue.Full right away, so that the caller can tell the client to back off.
+
+        Returns a Future, which result is the prediction dictionary
+        """
+        future = Future()
+        self.requests.put_nowait((image_tensor, future))
+        return future
+
+    def worker(self):
+        while True:
+            batch = [self.requests.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            image_tensors = [image_tensor for image_tensor, _ in batch]
+            futures = [future for _, future in batch]
+            self.batch_sizes.observe(len(futures))
+            try:
+                predictions = self.model.predict(np.stack(image_tensors), verbose=0)
+            except Exception as error:
+                for future in futures:
+                    future.set_exception(error)
+                continue
+            for future, pred_dict in zip(futures, predict_funcs.prediction_dicts(predictions, self.unique_labels)):
+                future.set_result(pred_dict)
+
+def decode(source):
+    """
+    This function takes a path to an image or its raw bytes.
+
+    Returns the image as a model input Tensor. Raises ValueError if it can't be read
+    """
+    from resources import model_funcs
+
+    try:
+        return model_funcs.load_image(source)
+    except Exception as error:
+        raise ValueError(f"Could not read the image: {error}")
+
+def make_handler(batcher, latencies, model_path, request_timeout):
+    """
+    This function takes the MicroBatcher, a latency Histogram, the path to the model and a timeout in seconds.
+
+    Returns a request handler class for the HTTP server
+    """
+    class PredictionHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def send_json(self, status, content):
+            body = json.dumps(content).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self.send_json(200, {"status": "ok", "model": model_path, "queued": batcher.requests.qsize()})
+            elif self.path == "/metrics":
+                self.send_json(200, {"latency": latencies.summary(), "batch_size": batcher.batch_sizes.summary()})
+            else:
+                self.send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/predict":
+                self.send_json(404, {"error": "not found"})
+                return
+            start = time.perf_counter()
+            try:
+                self.predict_request()
+            finally:
+                # Every answer counts, the rejected and failed requests too
+                latencies.observe((time.perf_counter() - start) * 1000)
+
+        def predict_request(self):
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+            except ValueError:
+                # Without a length there is no telling where the body ends, so this connection can't be reused either
+                self.close_connection = True
+                self.send_json(400, {"error": "malformed Content-Length header"})
+                return
+            if length <= 0 or length > MAX_UPLOAD_BYTES:
+                # The body is left unread, so this connection can't be reused
+                self.close_connection = True
+                self.send_json(413 if length else 400, {"error": f"send an image of at most {MAX_UPLOAD_BYTES} bytes"})
+                return
+            body = self.rfile.read(length)
+
+            # Either a JSON body {"path": "..."} pointing at a local file, or the image file itself
+            if self.headers.get("Content-Type", "").startswith("application/json"):
+                try:
+                    source = json.loads(body)["path"]
+                except (ValueError, KeyError, TypeError):
+                    self.send_json(400, {"error": "expected {\"path\": \"...\"}"})
+                    return
+            else:
+                source = body
+
+            try:
+                # Decoded here, in the thread of this request, so many uploads get decoded at once
+                future = batcher.submit(decode(source))
+            except ValueError as error:
+                self.send_json(400, {"error": str(error)})
+                return
+            except queue.Full:
+                self.send_response(503)
+                self.send_header("Retry-After", "1")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            try:
+                pred_dict = future.result(timeout=request_timeout)
+            except Exception as error:
+                self.send_json(500, {"error": str(error)})
+                return
+
+            self.send_json(200, {
+                "prediction": str(pred_dict["prediction"]),
+                "accuracy": pred_dict["accuracy"],
+                "top_5_labels": [str(label) for label in pred_dict["top_5_labels"]],
+                "top_5_confidences": [float(confidence) for confidence in pred_dict["top_5_confidences"]]
+            })
+
+        def log_message(self, format, *args):
+            pass
+
+    return PredictionHandler
+
+def serve(args):
+    """
+    Loads the model once and serves predictions on http://127.0.0.1:<port> until interrupted.
+    """
+    unique_labels = label_funcs.load_label_index(args.model, args.labels)["names"]
+    model = backend_funcs.load_backend(args.model, backend_funcs.available_backend(args.model, args.backend))
+    batcher = MicroBatcher(model, unique_labels, args.max_batch_size, args.max_wait_ms, args.max_queue)
+    handler = make_handler(batcher, Histogram(), args.model, args.timeout)
+
+    server = ThreadingHTTPServer((HOST, args.port), handler)
+    print(f"IdentiBreed is listening on http://{HOST}:{args.port} (POST /predict, GET /health, GET /metrics)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local IdentiBreed prediction server")
+    parser.add_argument("--port", type=int, default=8321)
+    parser.add_argument("--model", default=label_funcs.DEFAULT_MODEL)
+    parser.add_argument("--backend", choices=backend_funcs.BACKENDS, default="compiled", help="the TFLite backends have to be exported with model_tools.py first")
+    parser.add_argument("--labels", default="./data/labels.csv", help="used only if the model's label index has to be rebuilt")
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=10)
+    parser.add_argument("--max-queue", type=int, default=256, help="requests waiting above this get a 503")
+    parser.add_argument("--timeout", type=float, default=30, help="seconds a request may wait for its prediction")
+
+    serve(parser.parse_args())
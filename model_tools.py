@@ -0,0 +1,295 @@
+import pandas as pd
+import numpy as np
+import argparse
+import gc
+import os
+import time
+
+from resources import backend_funcs, embedding_funcs, label_funcs, retrain_funcs
+
+
+DEFAULT_STORE = "./data/embeddings"
+
+
+def labeled_files(labels_csv_path="./data/labels.csv"):
+    """
+    This function takes a path to the Kaggle 'labels.csv' file.
+
+    Returns a list of the training image paths and a list of their breeds, the same way the 'IdentiBreed.ipynb' notebook makes them
+    """
+    labels_csv = pd.read_csv(labels_csv_path)
+    return [f"./data/train/{id}.jpg" for id in labels_csv["id"]], list(labels_csv["breed"])
+
+def validation_split(labels_csv_path="./data/labels.csv", limit=None):
+    """
+    This function takes a path to the 'labels.csv' file and optionally a limit of images.
+    The split is the same as the one the model was validated on in the notebook, so none of these images were trained on.
+
+    Returns a list of the validation image paths and a list of their breeds
+    """
+    from sklearn.model_selection import train_test_split
+
+    img_paths, breeds = labeled_files(labels_csv_path)
+    _, X_val, _, y_val = train_test_split(img_paths, breeds, test_size=0.2, random_state=7821)
+    return X_val[:limit], y_val[:limit]
+
+def export_tflite(args):
+    """
+    Converts the .h5 model to a .tflite file next to it, which the 'tflite-dynamic' or 'tflite-int8' backend then picks up.
+    """
+    from resources import model_funcs
+
+    model = model_funcs.load_model(args.model)
+    output_path = backend_funcs.backend_path(args.model, f"tflite-{args.quantization}")
+    calibration_paths = None
+    if args.quantization == "int8":
+        # Calibrating on the training part of the split keeps the validation images out of it, so 'compare' stays honest
+        img_paths, _ = labeled_files(args.labels)
+        X_val, _ = validation_split(args.labels)
+        calibration_paths = sorted(set(img_paths) - set(X_val))
+    backend_funcs.export_tflite(model, output_path, args.quantization, calibration_paths, args.calibration)
+
+def rss_mb():
+    """
+    Returns the current resident memory of this process in MB
+    """
+    import psutil
+    return psutil.Process().memory_info().rss / 1024 / 1024
+
+def compare_backends(args):
+    """
+    Predicts the validation split with every backend that has been exported and compares them with the float Keras model:
+    top-1 and top-5 agreement, accuracy, milliseconds per batch, memory taken by the loaded model and the model file size.
+    """
+    from resources import model_funcs
+
+    label_idxs = label_funcs.load_label_index(args.model, args.labels)["index"]
+    X_val, y_val = validation_split(args.labels, args.limit)
+    print(f"Comparing the backends on {len(X_val)} validation images, batch size {args.batch_size}")
+    # The images are prepared once up front, so only the model itself gets timed
+    images = np.stack([np.asarray(model_funcs.load_image(img_path), dtype="float32") for img_path in X_val])
+    true_idxs = np.array([label_idxs[breed] for breed in y_val])
+
+    reference = None
+    # The compiled backends run the very same model as 'keras' (see 'benchmark.py startup' for their latency)
+    for backend in ("keras", "tflite-dynamic", "tflite-int8"):
+        model_path = backend_funcs.backend_path(args.model, backend)
+        if not os.path.exists(model_path):
+            print(f"{backend}: no {model_path}, skipped (see 'python model_tools.py export-tflite')")
+            continue
+
+        rss_before = rss_mb()
+        model = backend_funcs.load_backend(args.model, backend)
+        # The first batch pays for the setup of the model, so it's left out of the timings
+        model.predict(images[:args.batch_size], verbose=0)
+        rss_loaded = rss_mb()
+
+        timings, probabilities = [], []
+        for start in range(0, len(images), args.batch_size):
+            batch_start = time.perf_counter()
+            probabilities.append(model.predict(images[start:start+args.batch_size], verbose=0))
+            timings.append((time.perf_counter() - batch_start) * 1000)
+        probabilities = np.concatenate(probabilities)
+        top_5 = np.argsort(probabilities, axis=1)[:, ::-1][:, :5]
+        if reference is None:
+            reference = top_5
+
+        top_1_agreement = np.mean(top_5[:, 0] == reference[:, 0])
+        # How many of the float model's top 5 breeds are also in the top 5 of this backend
+        top_5_agreement = np.mean([len(set(row) & set(reference_row)) / 5 for row, reference_row in zip(top_5, reference)])
+        accuracy = np.mean(top_5[:, 0] == true_idxs)
+        print(f"{backend}: top-1 agreement {top_1_agreement:.2%}, top-5 agreement {top_5_agreement:.2%}, accuracy {accuracy:.2%}, "
+              f"{np.mean(timings):.1f} ms per batch (p50 {np.percentile(timings, 50):.1f} ms), "
+              f"{rss_loaded - rss_before:.0f} MB of memory, {os.path.getsize(model_path) / 1024 / 1024:.1f} MB file")
+
+        del model
+        gc.collect()
+
+def stored_embeddings(args):
+    """
+    Loads the model and returns it along with the embeddings of every training image (running the backbone only over
+    the images that aren't in the store yet), their breeds and the indices of the validation split.
+    """
+    from resources import model_funcs
+    from sklearn.model_selection import train_test_split
+
+    model = model_funcs.load_model(args.model)
+    store = embedding_funcs.EmbeddingStore(args.store, embedding_funcs.backbone_handle(model))
+    img_paths, breeds = labeled_files(args.labels)
+    embeddings = embedding_funcs.embed_files(store, model, img_paths, args.batch_size)
+    # The same split as 'validation_split', only of the indices
+    _, val_idxs = train_test_split(np.arange(len(img_paths)), test_size=0.2, random_state=7821)
+
+    return model, embeddings, np.array(breeds), val_idxs
+
+def embed(args):
+    """
+    Runs the backbone once over every training image that isn't in the embedding store yet.
+    """
+    _, embeddings, _, _ = stored_embeddings(args)
+    print(f"{len(embeddings)} embeddings stored in {args.store}")
+
+def train_head(args):
+    """
+    Trains a new 'OutputLayer' on the stored embeddings and saves it under the backbone of the model as a new .h5 file.
+    The backbone never changes, so it's only the Dense layer being trained, which takes seconds instead of hours.
+    """
+    from resources import model_funcs
+    import tensorflow as tf
+
+    model, embeddings, breeds, val_idxs = stored_embeddings(args)
+    unique_labels = np.unique(breeds)
+    one_hot = (breeds[:, None] == unique_labels).astype("float32")
+    head = embedding_funcs.build_head(len(unique_labels))
+
+    if args.full_set:
+        # Just like the full model in the notebook - trained on every image, stopped once the accuracy stops improving
+        head.fit(embeddings, one_hot, batch_size=args.batch_size, epochs=args.epochs,
+                 callbacks=[tf.keras.callbacks.EarlyStopping(monitor="accuracy", patience=3)], verbose=2)
+    else:
+        train_idxs = np.setdiff1d(np.arange(len(breeds)), val_idxs)
+        head.fit(embeddings[train_idxs], one_hot[train_idxs], batch_size=args.batch_size, epochs=args.epochs,
+                 validation_data=(embeddings[val_idxs], one_hot[val_idxs]),
+                 callbacks=[tf.keras.callbacks.EarlyStopping(monitor="val_accuracy", patience=3, restore_best_weights=True)], verbose=2)
+        _, accuracy = head.evaluate(embeddings[val_idxs], one_hot[val_idxs], verbose=0)
+        print(f"Validation accuracy: {accuracy:.2%}")
+
+    model_path = model_funcs.save_model(embedding_funcs.attach_head(model, head), args.suffix)
+    label_funcs.build_label_index(model_path, unique_labels, args.labels)
+
+def evaluate_head(args):
+    """
+    Predicts the validation split with the 'OutputLayer' of the model alone, straight from the stored embeddings.
+    """
+    model, embeddings, breeds, val_idxs = stored_embeddings(args)
+    # Retrained models keep their new breeds after the original ones, so the names aren't necessarily sorted
+    label_idxs = label_funcs.load_label_index(args.model, args.labels)["index"]
+    head = embedding_funcs.head_from_model(model)
+    probabilities = head.predict(embeddings[val_idxs], batch_size=256, verbose=0)
+    top_5 = np.argsort(probabilities, axis=1)[:, ::-1][:, :5]
+    true_idxs = np.array([label_idxs[breed] for breed in breeds[val_idxs]])
+    print(f"{len(val_idxs)} validation images: top-1 accuracy {np.mean(top_5[:, 0] == true_idxs):.2%}, "
+          f"top-5 accuracy {np.mean(np.any(top_5 == true_idxs[:, None], axis=1)):.2%}")
+
+def retrain(args):
+    """
+    Fine-tunes the output layer of the model on the user feedback - the user submissions and the predictions confirmed
+    or corrected in the evaluation logs - together with a replay buffer of the original training images, so the model learns the new
+    samples without forgetting the rest. The backbone stays frozen, so only the new images ever go through it.
+    Accepted user submitted breeds get new output units. The result is saved as a new version of the model.
+    The label index of every retrained model lists the samples it has been trained on (including those of the models it
+    was retrained from), so retraining it again only uses the feedback that came after.
+    """
+    from resources import model_funcs
+    from sklearn.model_selection import train_test_split
+
+    model = model_funcs.load_model(args.model)
+    label_index = label_funcs.load_label_index(args.model, args.labels)
+    known_breeds = list(label_index["names"])
+    consumed = set(label_index.get("details", {}).get("consumed_samples", []))
+    if consumed:
+        print(f"{args.model} was already trained on {len(consumed)} samples, only newer feedback is used")
+    accepted = [breed.strip().lower().replace(" ", "_") for breed in args.accept]
+    new_breeds = [breed for breed in dict.fromkeys(accepted) if breed not in known_breeds]
+    names = known_breeds + new_breeds
+    store = embedding_funcs.EmbeddingStore(args.store, embedding_funcs.backbone_handle(model))
+
+    submission_paths, submission_breeds, left_out = retrain_funcs.submission_samples(args.submissions, known_breeds, new_breeds, consumed)
+    log_ids, log_hashes, log_breeds, log_arrays, log_left_out = retrain_funcs.evaluation_samples(args.evaluation_logs, known_breeds, new_breeds, consumed)
+    for breed, count in log_left_out.items():
+        left_out[breed] = left_out.get(breed, 0) + count
+    for breed, count in sorted(left_out.items()):
+        print(f"Left out {count} images of '{breed}', it's not an accepted breed (see --accept)")
+    if not submission_paths and not log_ids:
+        print("There is no new feedback to retrain on.")
+        return
+    print(f"Retraining on {len(submission_paths)} user submissions and {len(log_ids)} confirmed or corrected predictions"
+          + (f", adding {len(new_breeds)} new breeds: {', '.join(new_breeds)}" if new_breeds else ""))
+
+    embeddings = [embedding_funcs.embed_files(store, model, submission_paths, args.batch_size),
+                  embedding_funcs.embed_arrays(store, model, log_ids, log_hashes, log_arrays, args.batch_size)]
+    breeds = submission_breeds + log_breeds
+    # Every new sample counts 'new_weight' times as much as a replayed one, so a handful of them still gets noticed
+    sample_weights = [np.full(len(breeds), args.new_weight, dtype="float32")]
+
+    val_embeddings = val_breeds = None
+    if os.path.exists(args.labels) and args.replay:
+        img_paths, train_breeds = labeled_files(args.labels)
+        _, val_idxs = train_test_split(np.arange(len(img_paths)), test_size=0.2, random_state=7821)
+        replay_idxs = retrain_funcs.replay_indices(train_breeds, args.replay, exclude=val_idxs)
+        print(f"Replaying {len(replay_idxs)} of the original training images")
+        embeddings.append(embedding_funcs.embed_files(store, model, [img_paths[idx] for idx in replay_idxs], args.batch_size))
+        breeds += [train_breeds[idx] for idx in replay_idxs]
+        sample_weights.append(np.ones(len(replay_idxs), dtype="float32"))
+        val_embeddings = embedding_funcs.embed_files(store, model, [img_paths[idx] for idx in val_idxs], args.batch_size)
+        val_breeds = np.array([train_breeds[idx] for idx in val_idxs])
+    else:
+        print(f"No {args.labels} to replay the original images from, retraining on the new samples only")
+
+    embeddings = np.concatenate(embeddings)
+    one_hot = (np.array(breeds)[:, None] == np.array(names)).astype("float32")
+    head = embedding_funcs.head_from_model(model, len(new_breeds), args.learning_rate)
+    if val_embeddings is not None:
+        val_one_hot = (val_breeds[:, None] == np.array(names)).astype("float32")
+        _, accuracy_before = head.evaluate(val_embeddings, val_one_hot, verbose=0)
+    head.fit(embeddings, one_hot, sample_weight=np.concatenate(sample_weights), batch_size=args.batch_size,
+             epochs=args.epochs, shuffle=True, verbose=2)
+    if val_embeddings is not None:
+        _, accuracy_after = head.evaluate(val_embeddings, val_one_hot, verbose=0)
+        print(f"Validation accuracy on the original breeds: {accuracy_before:.2%} before, {accuracy_after:.2%} after")
+
+    model_path = retrain_funcs.versioned_path(args.model)
+    print(f"Saving model to: {model_path}...")
+    embedding_funcs.attach_head(model, head).save(model_path)
+    label_funcs.build_label_index(model_path, names, args.labels, source="retrained", details={
+        "base_model": os.path.basename(args.model),
+        "new_breeds": new_breeds,
+        "user_submissions": len(submission_paths),
+        "evaluated_predictions": len(log_ids),
+        "replayed": len(breeds) - len(submission_paths) - len(log_ids),
+        "consumed_samples": sorted(consumed | {retrain_funcs.submission_id(os.path.basename(img_path)) for img_path in submission_paths} | set(log_ids))
+    })
+    print(f"Set 'model:{model_path}' in ./resources/config.ini to use it in the app.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="IdentiBreed model tools")
+    subparsers = parser.add_subparsers(dest="tool", required=True)
+
+    export_parser = subparsers.add_parser("export-tflite", help="convert the model to a quantized .tflite file next to it")
+    export_parser.add_argument("--quantization", choices=("dynamic", "int8"), default="dynamic")
+    export_parser.add_argument("--calibration", type=int, default=200, help="how many training images calibrate the int8 model")
+    export_parser.add_argument("--model", default=label_funcs.DEFAULT_MODEL)
+    export_parser.add_argument("--labels", default="./data/labels.csv")
+    export_parser.set_defaults(func=export_tflite)
+
+    compare_parser = subparsers.add_parser("compare", help="agreement, accuracy, latency and memory of every exported backend")
+    compare_parser.add_argument("--limit", type=int, default=512, help="only use the first N validation images")
+    compare_parser.add_argument("--batch-size", type=int, default=32)
+    compare_parser.add_argument("--model", default=label_funcs.DEFAULT_MODEL)
+    compare_parser.add_argument("--labels", default="./data/labels.csv")
+    compare_parser.set_defaults(func=compare_backends)
+
+    embed_parser = subparsers.add_parser("embed", help="store the backbone embeddings of every training image")
+    train_head_parser = subparsers.add_parser("train-head", help="train a new output layer on the stored embeddings")
+    train_head_parser.add_argument("--epochs", type=int, default=100)
+    train_head_parser.add_argument("--full-set", action="store_true", help="train on every image, without holding out the validation split")
+    train_head_parser.add_argument("--suffix", default="head-MobileNetV2-Adam", help="attached to the name of the saved model")
+    evaluate_parser = subparsers.add_parser("evaluate-head", help="accuracy of the model's output layer on the stored validation embeddings")
+    retrain_parser = subparsers.add_parser("retrain", help="fine-tune the output layer on user submissions and evaluation logs")
+    retrain_parser.add_argument("--accept", nargs="*", default=[], help="user submitted ('US_') breeds to add to the model")
+    retrain_parser.add_argument("--replay", type=int, default=2400, help="how many original training images to replay, 0 for none")
+    retrain_parser.add_argument("--new-weight", type=float, default=3.0, help="how much more a new sample counts than a replayed one")
+    retrain_parser.add_argument("--epochs", type=int, default=10)
+    retrain_parser.add_argument("--learning-rate", type=float, default=0.0003)
+    retrain_parser.add_argument("--submissions", default="./data/user_submissions")
+    retrain_parser.add_argument("--evaluation-logs", default="./user/evaluation_logs")
+    for store_parser, func in ((embed_parser, embed), (train_head_parser, train_head), (evaluate_parser, evaluate_head), (retrain_parser, retrain)):
+        store_parser.add_argument("--store", default=DEFAULT_STORE, help="directory of the embedding store")
+        store_parser.add_argument("--batch-size", type=int, default=64)
+        store_parser.add_argument("--model", default=label_funcs.DEFAULT_MODEL)
+        store_parser.add_argument("--labels", default="./data/labels.csv")
+        store_parser.set_defaults(func=func)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -1,24 +1,81 @@
-import matplotlib.pyplot as plt
-import pandas  as pd
 import datetime
 import webbrowser
 import os
-from resources import app_funcs
+import queue
+import threading
+from resources import app_funcs, backend_funcs, fetch_funcs, log_funcs, plot_funcs, predict_funcs
 
 from tkinter import *
 from tkinter import ttk, filedialog
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from PIL import Image
+from PIL import Image, ImageTk
+from collections import OrderedDict
+
+class LazyModel:
+    def __init__(self, model_path, backend="keras"):
+        """
+        This creates a stand-in for the model saved under 'model_path', loaded with the 'backend' (see 'backend_funcs.BACKENDS'). 
+        TensorFlow and the model itself are only loaded when 'load_async' is called or when the first prediction is 
+        requested, so the app window can show up right away.
+
+        It can be used anywhere the model is expected, since it passes the 'predict' calls to the loaded model.
+        """
+        self.model_path = model_path
+        self.backend = backend
+        self.model = None
+        self.lock = threading.Lock()
+
+    def load_async(self):
+        """
+        This method starts loading the model in a background thread.
+        """
+        threading.Thread(target=self.get, daemon=True).start()
+
+    def get(self):
+        """
+        This method loads the model, unless it has already been loaded. If another thread is loading it, it waits for it.
+
+        Returns the loaded model
+        """
+        with self.lock:
+            if self.model is None:
+                self.model = backend_funcs.load_backend(self.model_path, self.backend)
+                app_funcs.log_startup_time("model loaded")
+        return self.model
+
+    def predict(self, *args, **kwargs):
+        return self.get().predict(*args, **kwargs)
 
 class PredictionImage(Label):
-    def __init__(self, parent):
+    def __init__(self, parent, prediction_cache=None, image_memory_limit=256 * 1024 * 1024, render_ahead=2, render_cache_bytes=64 * 1024 * 1024, image_writer=None):
         """
         This creates a tk Label that initially shows the app logo and when predictions are made can display each figure.
-        For initialization it requires only the 'parent' Frame in which it will be displayed. 
+        For initialization it requires only the 'parent' Frame in which it will be displayed. Optionally it takes:
+         - prediction_cache - a 'cache_funcs.PredictionCache', so that images predicted before don't go through the model again
+         - image_memory_limit - how many bytes of full resolution images can be kept in memory for the evaluation
+         - render_ahead - how many next and previous predictions get rendered in advance, while the app is idle
+         - render_cache_bytes - how many bytes of rendered predictions can be kept, least recently shown ones go first
+         - image_writer - a 'plot_funcs.ImageWriter' that saves the predictions in the background, with the export settings
         Has to be placed in a grid manually.
         """
         Label.__init__(self, parent, height=200, width=400)
-        self.figure, self.axs = plt.subplots(1, 2, figsize=(4, 2.5))
+        self.prediction_cache = prediction_cache
+        self.image_memory_limit = image_memory_limit
+        self.render_ahead = render_ahead
+        self.render_cache_bytes = render_cache_bytes
+        self.image_writer = image_writer or plot_funcs.ImageWriter()
+        # The figures are made once and reused for every prediction. Plain Figures (and not pyplot) are used, so that 
+        # pyplot doesn't keep track of them. 'figure' always shows the displayed prediction, 'prerender_figure' is used for 
+        # rendering the neighbouring predictions in advance
+        self.figure, self.axs = plot_funcs.new_figure()
+        self.figure_idx = None
+        self.prerender_figure, self.prerender_axs = plot_funcs.new_figure()
+        self.render_settings = (None, None, None)
+        self.rendered_frames = OrderedDict()
+        self.rendered_bytes = 0
+        self.prerender_queue = []
+        self.prerender_scheduled = False
+        self.displayed_idx = None
+        self.display_label = None
         self.image_frame = ttk.Frame(self)
         self.image_frame.grid(column=0, row=0)
         self.parent = parent
@@ -34,30 +91,115 @@ class PredictionImage(Label):
         Optionally it can be given an idx, which will show another picture from the predictions list.
         
         Replaces the IdentiBreed logo with a figure containing the subplots, one of which is the image and the other top 5 breeds.
+        Each prediction is rendered into a bitmap once (or in advance, see 'schedule_prerender') and kept in a bounded
+        cache, so paging back and forth through predictions doesn't have to redraw anything.
         
         Returns 'label_string' - a string that is either empty or contains the path to saved image. 
         The 'label_string' can be used to display the path details in the navigation bar.
         """
         
-        self.figure, self.axs = plt.subplots(1, 2)
         self.label_string = ""
-        self.figure, self.breed, self.accuracy = app_funcs.show_user_images(predicted_list, self.figure, self.axs, width_multiplier, height_multiplier, idx)
-        self.image_frame.destroy()
-        self.image_frame = ttk.Frame(self)
-        self.image_frame.grid(column=0, row=0)
-        prediction_image = FigureCanvasTkAgg(self.figure, self.image_frame)
-        prediction_image.get_tk_widget().grid(column=0, row=0)
+        if predicted_list is not self.render_settings[0] or (width_multiplier, height_multiplier) != self.render_settings[1:]:
+            self.clear_rendered()
+            self.render_settings = (predicted_list, width_multiplier, height_multiplier)
+        self.displayed_idx = idx
+        self.breed, self.accuracy = predicted_list[idx]["prediction"], predicted_list[idx]["accuracy"]
+
+        # Predictions rendered in advance are shown right away, others get rendered now
+        if idx in self.rendered_frames:
+            self.rendered_frames.move_to_end(idx)
+        else:
+            self.store_rendered(idx, self.render_frame(self.figure_for(idx)))
+        self.photo_image = ImageTk.PhotoImage(self.rendered_frames[idx])
+        if self.display_label is None:
+            self.image_frame.destroy()
+            self.image_frame = ttk.Frame(self)
+            self.image_frame.grid(column=0, row=0)
+            self.display_label = ttk.Label(self.image_frame)
+            self.display_label.grid(column=0, row=0)
+        self.display_label["image"] = self.photo_image
+        self.schedule_prerender(idx)
         if save_method == "all":
             self.save_image(idx)
         else:
             pass
 
         return self.label_string
-        
 
-    def prediction(self, file_paths, unique_labels, model):
+    def figure_for(self, idx):
+        """
+        This method makes sure that 'figure' shows the prediction under idx.
+
+        Returns the figure
+        """
+        if self.figure_idx != idx:
+            predicted_list, width_multiplier, height_multiplier = self.render_settings
+            plot_funcs.show_user_images(predicted_list, self.figure, self.axs, width_multiplier, height_multiplier, idx)
+            self.figure_idx = idx
+        return self.figure
+
+    def render_frame(self, figure):
+        """
+        This method draws the figure and returns it as a PIL Image.
+        """
+        figure.canvas.draw()
+        width, height = figure.canvas.get_width_height()
+        return Image.frombuffer("RGBA", (width, height), figure.canvas.buffer_rgba(), "raw", "RGBA", 0, 1).copy()
+
+    def store_rendered(self, idx, frame):
+        """
+        This method keeps the rendered frame under idx. If all the frames together take more than 'render_cache_bytes', 
+        the least recently shown ones are dropped.
+        """
+        self.rendered_frames[idx] = frame
+        self.rendered_bytes += frame.width * frame.height * 4
+        while self.rendered_bytes > self.render_cache_bytes and len(self.rendered_frames) > 1:
+            _, dropped = self.rendered_frames.popitem(last=False)
+            self.rendered_bytes -= dropped.width * dropped.height * 4
+
+    def clear_rendered(self):
+        self.rendered_frames.clear()
+        self.rendered_bytes = 0
+        self.prerender_queue = []
+        self.figure_idx = None
+
+    def schedule_prerender(self, idx):
+        """
+        This method queues the 'render_ahead' next and previous predictions around idx (closest first) for rendering.
+        They are rendered one by one whenever the tk main loop is idle, so the app stays responsive.
+        Matplotlib isn't thread safe, that's why this doesn't happen in a background thread.
+        """
+        predicted_list = self.render_settings[0]
+        self.prerender_queue = []
+        for distance in range(1, self.render_ahead+1):
+            for neighbour in (idx+distance, idx-distance):
+                if 0 <= neighbour < len(predicted_list) and neighbour not in self.rendered_frames:
+                    self.prerender_queue.append(neighbour)
+        if self.prerender_queue and not self.prerender_scheduled:
+            self.prerender_scheduled = True
+            self.after_idle(self.prerender_next)
+
+    def prerender_next(self):
+        self.prerender_scheduled = False
+        if not self.prerender_queue:
+            return
+        idx = self.prerender_queue.pop(0)
+        if idx not in self.rendered_frames:
+            predicted_list, width_multiplier, height_multiplier = self.render_settings
+            plot_funcs.show_user_images(predicted_list, self.prerender_figure, self.prerender_axs, width_multiplier, height_multiplier, idx)
+            # The frame about to be rendered mustn't push out the one on the screen
+            if self.displayed_idx in self.rendered_frames:
+                self.rendered_frames.move_to_end(self.displayed_idx)
+            self.store_rendered(idx, self.render_frame(self.prerender_figure))
+        if self.prerender_queue:
+            self.prerender_scheduled = True
+            # A short pause between frames lets clicks and key presses through
+            self.after(10, lambda: self.after_idle(self.prerender_next))
+
+    def prediction(self, file_paths, unique_labels, model, batch_size=32):
         """
         This method takes a path to the directory containing the files, list of unique_labels and the model. 
+        Optionally it takes a batch_size that is passed on to 'predict_funcs.predict_user_images'.
         
         It makes predictions on the files in the directory and creates two lists - saved_idxs and saved_label_texts. 
         Those variables, when given to 'app_funcs.save_image' function and then to navigation bar prevent the app from making
@@ -66,26 +208,127 @@ class PredictionImage(Label):
         Returns 'folder_state' - string either 'empty' or 'filled', that is used to prevent app from crashing in case the user
         provided incorrect or empty path/url.
         """
-        self.dir_list, self.predicted_list, self.image_arrays, folder_state = app_funcs.predict_user_images(file_paths, unique_labels, model)
+        self.dir_list, self.predicted_list, self.image_arrays, folder_state = predict_funcs.predict_user_images(file_paths, unique_labels, model, batch_size, cache=self.prediction_cache)
+        self.clear_rendered()
         self.saved_idxs = []
         self.saved_label_texts = []
 
         return folder_state
 
+    def start_prediction(self, file_paths, unique_labels, model, on_progress, on_done, batch_size=32):
+        """
+        This method takes the same arguments as the 'prediction' method and two functions:
+         - on_progress - called with the number of processed files and the number of all files after every batch
+         - on_done - called with the 'folder_state' and a boolean telling whether the predictions were cancelled
+        Instead of a directory 'file_paths' can also be a list of image paths and (name, bytes) tuples, or a function
+        that returns such a list when given the cancel event. The function is called in the background thread, which 
+        is where i.e. the images from the web get downloaded.
+
+        Instead of blocking the app until all images are classified, it makes the predictions in a background thread.
+        Results are passed back through a queue and appended to 'dir_list', 'predicted_list' and 'image_arrays' on the
+        tk main loop as soon as each batch is done, so the first predictions can be displayed while the rest are still running.
+        """
+        self.cancel_prediction()
+        self.dir_list, self.predicted_list, self.image_arrays = [], [], predict_funcs.ImageArrays(self.image_memory_limit)
+        self.clear_rendered()
+        self.saved_idxs = []
+        self.saved_label_texts = []
+        self.cancel_event = threading.Event()
+        self.results_queue = queue.Queue()
+        self.on_progress = on_progress
+        self.on_done = on_done
+        worker = threading.Thread(
+            target=self.prediction_worker, 
+            args=(file_paths, unique_labels, model, batch_size, self.results_queue, self.cancel_event), 
+            daemon=True
+        )
+        worker.start()
+        self.after(50, self.poll_results, self.results_queue)
+
+    def predict_images(self, images, unique_labels, model, on_progress, on_done, batch_size=32):
+        """
+        This method takes a path to a single image, the raw bytes of an image file, or a list of those and the same 
+        arguments as 'start_prediction'.
+
+        It predicts the images straight from the original files (or from memory), without copying them anywhere first.
+        """
+        self.start_prediction(predict_funcs.image_sources(images), unique_labels, model, on_progress, on_done, batch_size)
+
+    def prediction_worker(self, file_paths, unique_labels, model, batch_size, results_queue, cancel_event):
+        """
+        This method runs in the background thread. It must not touch any tk widgets, everything it has to say goes through 
+        the 'results_queue'.
+        """
+        # Each batch goes straight to the tk main loop, the worker itself doesn't keep any of the results
+        folder_state = "empty"
+        try:
+            if callable(file_paths):
+                sources = file_paths(cancel_event)
+            elif isinstance(file_paths, str):
+                sources = predict_funcs.list_directory(file_paths)
+            else:
+                sources = predict_funcs.image_sources(file_paths)
+            predictions = predict_funcs.iter_prediction_batches(
+                sources, 
+                unique_labels, 
+                model, 
+                batch_size, 
+                cancel_event=cancel_event,
+                cache=self.prediction_cache
+            )
+            for done, total, results in predictions:
+                results_queue.put(("progress", done, total, results))
+                if results:
+                    folder_state = "filled"
+        except Exception as error:
+            print(f"Predicting failed: {error}")
+            folder_state = "empty"
+        results_queue.put(("done", folder_state))
+
+    def poll_results(self, results_queue):
+        """
+        This method drains the 'results_queue' on the tk main loop and schedules itself again until the worker is done.
+        Queues left over from previous (cancelled) predictions are ignored.
+        """
+        while results_queue is self.results_queue:
+            try:
+                message = results_queue.get_nowait()
+            except queue.Empty:
+                break
+            if message[0] == "progress":
+                _, done, total, results = message
+                for img_path, pred_dict, image_source in results:
+                    self.dir_list.append(img_path)
+                    self.predicted_list.append(pred_dict)
+                    self.image_arrays.append(image_source)
+                self.on_progress(done, total)
+            else:
+                self.on_done(message[1], self.cancel_event.is_set())
+                return
+        if results_queue is self.results_queue:
+            self.after(50, self.poll_results, results_queue)
+
+    def cancel_prediction(self):
+        """
+        This method asks the background worker to stop after the batch it is currently working on.
+        """
+        try:
+            self.cancel_event.set()
+        except AttributeError:
+            pass
+
     def save_image(self, idx=0):
         """
         This method saves the image under idx. 
 
-        It first checks if the images of this idx has already been saved. If not it saves the image, then appends the 
-        'saved_idxs' with the idx and the 'saved_label_texts' with the path to the saved image.
+        It first checks if the images of this idx has already been saved. If not it hands the prediction over to the
+        'image_writer', then appends the 'saved_idxs' with the idx and the 'saved_label_texts' with the path to the saved image.
+        The image is written in the background, so this returns right away.
         If the particular prediction has already been saved it sets the 'label_string' to the correct path.
         """
         if idx not in self.saved_idxs:
-            self.label_string = app_funcs.image_saver(
-                image= self.figure, 
-                breed_label= self.breed, 
-                accuracy= self.accuracy
-            )
+            predicted_list, width_multiplier, height_multiplier = self.render_settings
+            self.label_string = self.image_writer.save(predicted_list[idx], width_multiplier, height_multiplier)
             self.saved_idxs.append(idx)
             self.saved_label_texts.append(self.label_string)   
         else:
@@ -109,6 +352,9 @@ class NavigationFrame(LabelFrame):
         self.parent = parent
         self.idx = 0
         self.y = 0
+        self.active = False
+        # Whether all predictions are in, the evaluation can only be uploaded once they are
+        self.finished = False
         self.evaluation_frame = False
         self.prediction_frame = prediction_frame
         self.previous = ttk.Button(self, text="< Prev", command=lambda: self.previous_image(prediction_frame), state="disabled")
@@ -135,6 +381,7 @@ class NavigationFrame(LabelFrame):
             self.disable_buttons()
         self.width_multiplier = width_multiplier
         self.height_multiplier = height_multiplier
+        self.active = True
         self.idx = 0
         self.y = y
         self.counter["text"] = f"{self.idx+1}/{self.y}"
@@ -147,7 +394,7 @@ class NavigationFrame(LabelFrame):
             self.text_label["anchor"] = "center"
         
         if save_method == "manual":
-            self.save_button = ttk.Button(self, text="Save Image", command=lambda: app_funcs.manual_save(self.prediction_frame.figure, self.prediction_frame.breed, self.prediction_frame.accuracy, self.idx, self.manually_saved_idxs, self.manually_saved_texts, self.text_label, self.save_button))
+            self.save_button = ttk.Button(self, text="Save Image", command=lambda: app_funcs.manual_save(self.prediction_frame, self.idx, self.manually_saved_idxs, self.manually_saved_texts, self.text_label, self.save_button))
             self.save_button.grid(column=0, row=2, columnspan=3, sticky=(N,S,E,W))
             self.save_button.grid_configure(padx=5, pady=2)
             self.manually_saved_idxs = []
@@ -160,6 +407,7 @@ class NavigationFrame(LabelFrame):
         The deactivate method takes no arguments and its only job is to reset the coutner to '0/0', disable the previous and
         next buttons and attempt to destroy the 'text_label' and 'save_button' tk widgets.
         """
+        self.active = False
         self.counter["text"] = "0/0"
         self.next.state(["disabled"])
         self.previous.state(["disabled"])
@@ -169,6 +417,21 @@ class NavigationFrame(LabelFrame):
         except:
             pass
        
+    def update_count(self, y):
+        """
+        This method takes 'y' - the amount of predictions made so far. It is used while the predictions are still running
+        in the background, so the counter and the navigation buttons follow the newly arrived predictions.
+        """
+        if not self.active:
+            return
+        self.y = y
+        self.counter["text"] = f"{self.idx+1}/{self.y}"
+        if not self.evaluation_frame:
+            self.disable_buttons()
+        elif self.idx in self.evaluation_frame.evaluated_idxs:
+            # i.e. the user answered the last prediction that had arrived and is waiting for the next one
+            self.evaluation_frame.navigation_controls(self.idx)
+
     def next_image(self, prediction_frame): 
         """
         This method is one of the crucial parts of the 'NavigationFrame' object. As an argument it takes only the 'prediction_frame'
@@ -177,7 +440,10 @@ class NavigationFrame(LabelFrame):
         Depending on the previously specified save_method it will either ask the user if they want to save the displayed image
         or will print the path to the saved image under the controls.
         It also handles the behaviour of the 'next' and 'previous' buttons, depending on the idx of displayed image.
+        If the next prediction hasn't arrived yet it does nothing, 'update_count' enables the 'next' button once it does.
         """
+        if self.idx+1 >= len(prediction_frame.predicted_list):
+            return
         self.idx += 1
         try:
             self.evaluation_frame.evaluate(self.prediction_frame.image_arrays, self.prediction_frame.predicted_list, self.idx)
@@ -320,23 +586,41 @@ class InputSource(LabelFrame):
         This method takes a 'notebook' argument, which is a tk Notebook widget. 
 
         It creates a tk Frame object that will be displayed under a tab titled 'Web Image'. This object contains a 
-        'web_image_label' that instructs the user what the tab does and a tk Entry widget. User is meant to paste the URL
-        to a singular image into this Entry field.
+        'web_image_label' that instructs the user what the tab does, a tk Text widget and a 'load_button'. User is meant 
+        to paste the URLs of images into the Text field (one per line) or load them from a text file with the button.
 
         After the whole setup it adds the tab to the 'notebook' specified.
         """
         web_image_frame = ttk.Frame(notebook)
-        web_image_label = ttk.Label(web_image_frame, text="Paste the URL to an image")
+        web_image_label = ttk.Label(web_image_frame, text="Paste URLs of images, one per line")
         web_image_label["anchor"] = "center"
-        self.image_url = StringVar()
-        url_entry = ttk.Entry(web_image_frame, textvariable=self.image_url)
+        self.url_text = Text(web_image_frame, height=3, width=30, wrap="none")
+        load_button = ttk.Button(web_image_frame, text="Load from file", command=lambda: self.load_urls(filedialog.askopenfilename(initialdir="./", filetypes=[("Text files", "*.txt"), ("All files", "*")])))
         web_image_label.grid(column=0, row=0, columnspan=2, sticky=(N,S,E,W))
-        url_entry.grid(column=0, row=1, columnspan=2, sticky=(N,S,E,W))
+        self.url_text.grid(column=0, row=1, columnspan=2, sticky=(N,S,E,W))
+        load_button.grid(column=0, row=2, columnspan=2, sticky=(N,S,E,W))
         web_image_frame.columnconfigure(0, weight=3)
         for child in web_image_frame.winfo_children():
             child.grid_configure(padx=2, pady=2)
         notebook.add(web_image_frame, text="Web Image")
 
+    def load_urls(self, file_path):
+        """
+        This method takes a path to a text file with URLs and puts them into the URL field, replacing what was there.
+        """
+        if not file_path:
+            return
+        with open(file_path, "r") as file:
+            urls = fetch_funcs.read_url_list(file.read())
+        self.url_text.delete("1.0", "end")
+        self.url_text.insert("1.0", "\n".join(urls))
+
+    def image_urls(self):
+        """
+        Returns a list of the URLs given in the 'Web Image' tab
+        """
+        return fetch_funcs.read_url_list(self.url_text.get("1.0", "end"))
+
 class PredictionEvaluation(LabelFrame):
     def __init__(self, parent, unique_labels, user_id, navigation_frame):
         breed_list = []
@@ -364,6 +648,7 @@ class PredictionEvaluation(LabelFrame):
         self.save_button.grid(column=0, row=5, columnspan=2, sticky=(N,S,E,W))
         self.navigation_frame = navigation_frame
         self.evaluated_idxs = []
+        self.upload_button = None
         self.columnconfigure(0, weight=3)
         self.columnconfigure(1, weight=3)
         self.columnconfigure(2, weight=3)
@@ -377,7 +662,8 @@ class PredictionEvaluation(LabelFrame):
         self.not_known_button.state(["!disabled"])
         date_data = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
         self.log_name = f"{self.user_id}_{date_data}_log"
-        self.log_file = pd.DataFrame(columns=["file_name", "image_array", "breed", "correct_prediction"])
+        # Every answer is appended to the journal (and synced to the disk) as it's given, see 'log_funcs.EvaluationJournal'
+        self.journal = log_funcs.EvaluationJournal("./user/evaluation_logs", self.log_name)
         self.evaluate(image_arrays, predicted_list)
 
     def activate_commands(self):
@@ -387,7 +673,7 @@ class PredictionEvaluation(LabelFrame):
         self.not_known_button.state(["!disabled"])
         
     def evaluate(self, image_arrays, predicted_list, idx=0):
-        self.navigation_controls(idx, "initial")
+        self.navigation_controls(idx)
         if idx not in self.evaluated_idxs:
             self.navigation_frame.next.state(["disabled"])
             # self.navigation_frame.previous.state(["disabled"])
@@ -401,7 +687,7 @@ class PredictionEvaluation(LabelFrame):
         
     def breed_correct(self, idx, log_name, image_array, breed_label):
         self.evaluated_idxs.append(idx)
-        self.log_file.loc[idx] = [f"{log_name}_{idx}", image_array, breed_label, 1]
+        self.append_answer(f"{log_name}_{idx}", image_array, breed_label, 1)
         self.evaluated_breed()
         self.navigation_controls(idx)
         try:
@@ -422,7 +708,7 @@ class PredictionEvaluation(LabelFrame):
         if self.breed_var.get().replace(" ", "") != "":
             user_breed = "US_" + self.breed_var.get().replace(" ", "_").lower()
             self.evaluated_idxs.append(idx)
-            self.log_file.loc[idx] = [f"{log_name}_{idx}", image_array, user_breed, 0]
+            self.append_answer(f"{log_name}_{idx}", image_array, user_breed, 0)
             self.evaluated_breed()
             self.navigation_controls(idx)
             try:
@@ -435,7 +721,7 @@ class PredictionEvaluation(LabelFrame):
 
     def breed_not_known(self, idx, log_name, image_array):
         self.evaluated_idxs.append(idx)
-        self.log_file.loc[idx] = [f"{log_name}_{idx}", image_array, "unknown", None]
+        self.append_answer(f"{log_name}_{idx}", image_array, "unknown", None)
         self.evaluated_breed()
         self.navigation_controls(idx)
         try:
@@ -443,6 +729,15 @@ class PredictionEvaluation(LabelFrame):
         except:
             print("All displayed")
 
+    def append_answer(self, file_name, image_array, breed, correct_prediction):
+        self.journal.append(file_name, image_array, breed, correct_prediction)
+        # The journal is written in the background, so a failed write shows up with one of the next answers
+        if self.journal.error is not None:
+            self.journal_warning(f"Your answers can't be saved to the disk ({self.journal.error}), they're kept until the app closes.")
+
+    def journal_warning(self, text):
+        ttk.Label(self, text=text, wraplength=250).grid(column=0, row=7, columnspan=2, sticky=(N,S,E,W))
+
     def evaluated_breed(self):
         self.question_label.state(["disabled"])
         self.yes_button.state(["disabled"])
@@ -452,14 +747,16 @@ class PredictionEvaluation(LabelFrame):
         self.breed_combobox.state(["disabled"])
         self.save_button.state(["disabled"])
     
-    def navigation_controls(self, idx, tag="non_initial"):
+    def navigation_controls(self, idx):
         if idx+1 == self.navigation_frame.y:
             if self.navigation_frame.y != 1:
                 self.navigation_frame.previous.state(["!disabled"])
             else:
                 self.navigation_frame.previous.state(["disabled"])
             self.navigation_frame.next.state(["disabled"])
-            if tag == "non_initial":
+            # While the predictions are still running the last one shown isn't the last one, uploading then would
+            # close the journal before the answers to the rest are in
+            if self.navigation_frame.finished and idx in self.evaluated_idxs and self.upload_button is None:
                 self.upload_button = ttk.Button(self, text="Upload log file", default="active", command=lambda: self.upload_log())
                 self.upload_button.grid(column=0, row=6, columnspan=2, sticky=(N,S,E,W))
         elif idx == 0:
@@ -470,8 +767,15 @@ class PredictionEvaluation(LabelFrame):
             self.navigation_frame.next.state(["!disabled"])
     
     def upload_log(self):
-        if f"{self.log_name}.csv" not in os.listdir("./user/evaluation_logs"):
-            self.log_file.to_csv(f"./user/evaluation_logs/{self.log_name}.csv", index=False)
+        # The journal gets replayed into a small .jsonl file with the metadata and a compressed .npz file with the pixels
+        if f"{self.log_name}.jsonl" not in os.listdir("./user/evaluation_logs"):
+            try:
+                self.journal.close()
+            except OSError as error:
+                self.journal_warning(f"The log file couldn't be written: {error}")
+                return
+            log_funcs.replay_journal("./user/evaluation_logs", self.log_name)
+            log_funcs.remove_journal("./user/evaluation_logs", self.log_name)
         else:
             pass
         webbrowser.open("https://aleksanderc.pythonanywhere.com/identibreed.html#upload_logs", new=0, autoraise=True)
@@ -1,78 +1,38 @@
-import tensorflow as tf
-import tensorflow_hub as hub
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
 import datetime
-import os
 import subprocess
+import threading
+import time
 import random, string
 
-from resources import model_funcs, app_classes
+from resources import app_classes, fetch_funcs, label_funcs, plot_funcs
 
-from IPython.display import Image
 from PIL import Image
 from tkinter import ttk, messagebox
-from urllib.request import urlopen
 
 
-def predict_user_images(file_paths, unique_labels, model):
-    """
-    This function takes a path to the user input directory and the unique_labels list.
-    It makes model create predictions of dog breeds present in user's images.
-    The function creates a list of dictionaries for each image. 
-    These dictionaries contain the image tensor, predicted breed, model's confidence, four other probable breeds and their confidences.
+# Settings that weren't in the first versions of 'config.ini'
+# The model the app predicts with, 'model_tools.py retrain' tells which file to put here to use a retrained one
+config_defaults = {**plot_funcs.DEFAULT_EXPORT_SETTINGS, "backend": "compiled", "model": label_funcs.DEFAULT_MODEL}
 
-    Returns list of image paths, list of image dictionaries and a folder_state string. 
-    """
+# Moment in which the app was launched, 'IdentiBreed.py' overwrites it with the time before any imports
+startup_times = {"launch": time.perf_counter()}
 
-    # Instantiating empty lists for image paths and image dictionaries
-    dir_list, predicted_files, image_arrays = [], [], []
-    folder_state = "empty"
-    print("Predicting dog breeds from images in './images' folder.")
-    print("This could take a moment...")
-
-    for file in os.listdir(file_paths):
-        try:
-            img_path = file_paths + "/" + file
-
-            # We turn each image into it's own minibatch and feed it into the model
-            img = model_funcs.minibatch_maker(X=[img_path], batch_size=32, test_data=True)
-            prediction = model.predict(img, verbose=0)
-
-            # Based on the highest probability we get the breed label and the next four with highest probability
-            pred_label = model_funcs.name_predicted_label(prediction, unique_labels)
-            top_5_preds = prediction.argsort()[0][-5:][::-1]
-
-            # We create a new `predicted_files` entry 
-            pred_dict = {
-                "image": model_funcs.turn_to_tensor(img_path), # Tensor for ease of displaying later
-                "prediction": pred_label, # The dog breed predicted by the model
-                "accuracy": ("%.3f" %(np.max(prediction[0]) * 100)), # Probability in percentage
-                "top_5_labels": unique_labels[top_5_preds], # Top 5 predicted labels
-                "top_5_confidences": prediction[0][top_5_preds] # Top 5 confidences
-            }
-
-            # We append the dictionary to the list and an image file path into another list
-            predicted_files.append(pred_dict)
-            dir_list.append(img_path)
-            image_file = Image.open(img_path)
-            image_file.load()
-            image_arrays.append(np.asarray(image_file, dtype="int32"))
-            folder_state = "filled"
-        except:
-            pass
-        # return_list = [dir_list, predicted_files]
-    print("Predicting completed")
-    # return return_list
-    return dir_list, predicted_files, image_arrays, folder_state
+def log_startup_time(event):
+    """
+    This function takes a name of an event (i.e. 'window shown', 'first prediction').
+    The first time each event happens it prints how long it took since the app was launched.
+    """
+    if event not in startup_times:
+        startup_times[event] = time.perf_counter()
+        print(f"Startup: {event} after {startup_times[event] - startup_times['launch']:.2f}s")
 
-def image_saver(image, breed_label, accuracy= None, data_expansion= False, prefix= None):
+def image_saver(image, breed_label, accuracy= None, data_expansion= False, prefix= None, export_settings= plot_funcs.DEFAULT_EXPORT_SETTINGS):
     """
     This function takes an image, breed label and optionally:
         - accuracy: Model's confidence of the prediction being correct
         - data_expansion: True if we want to save images as future dataset expansion submissions
         - prefix: string if we want to mark user submitted breed for future reference
+        - export_settings: dpi, format and quality of the saved predictions (see 'plot_funcs.export_settings')
 
     It saves the image either into './user/output' if data_expansion is False or './data/user_submissions' if data_expansion is True.
 
@@ -102,9 +62,8 @@ def image_saver(image, breed_label, accuracy= None, data_expansion= False, prefi
     # This block runs when user agreed to saving the images with predicted labels and top five predictions
     # The image here is really a matplotlib figure
     else:
-        prediction_date = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
-        filename = f"{breed_label}_{accuracy}%_{prediction_date}.jpg"
-        image.savefig(f"./user/output/{filename}", bbox_inches= "tight", dpi=900)
+        filename = plot_funcs.prediction_filename(breed_label, accuracy, export_settings)
+        plot_funcs.save_figure(image, f"./user/output/{filename}", export_settings)
         return f"Prediction saved to output folder under name: {filename}'"
 
 def open_directory(directory_name):
@@ -220,57 +179,6 @@ def data_expander(image_path, breed_label, unique_labels):
         else:
             print("Error, please try again.")
 
-def show_user_images(predicted_files, figure, axes, width_multiplier=1, height_multiplier=1, idx=0):
-    """
-    This function takes the predicted_files (as return by 'predict_user_images()') a matplotlib figure and axes.
-    Optionally you can give it both width and height multipliers and an idx, but really this is more of a mandatory argument
-    if you want to see more than just the first prediction.
-    """
-
-    # Let's start by resizing the figure, so that it looks good on different resolutions.
-    plot_width = 5 * width_multiplier
-    plot_height = 2.5 * height_multiplier
-    
-    # Here we go plotting results of the prediction.
-    # We use the figure and axes provided by the user to display predictions
-    # On the left of the figure we will be plotting a resized image with a title of 'I am X% sure it's a PREDICTION'
-    # On the right we will plot a bar graph containing top five predictions
-    figure, axes
-    figure.set_figwidth(plot_width)
-    figure.set_figheight(plot_height)
-    figure.tight_layout()
-    prediction_dict = predicted_files[idx]
-    ax1, ax2 = axes[0], axes[1]
-    ax1.imshow(prediction_dict["image"])
-    # For a nicer look we replace the '_' in the breed label with a space
-    breed_label = prediction_dict['prediction'].replace("_", " ")
-    ax1.set_title(f"I am {prediction_dict['accuracy']}% sure it's a {breed_label}", fontdict={"fontsize": 6})
-    ax1.set_yticks([])
-    ax1.set_xticks([])
-    ax2.bar(
-        x=np.arange(len(prediction_dict["top_5_labels"])),
-        height= prediction_dict["top_5_confidences"],
-        color= "tab:gray",
-
-    )
-    ax2.set_title("Top 5 probable breeds", fontdict={"fontsize": 6})
-    # Here we create an empty list, which will contain the top 5 predictions. 
-    # We then take those labels and replace the '_' with a line brake. 
-    # This way the xticks will look better on the final plot
-    labels=[]
-    for label in prediction_dict["top_5_labels"]:
-        labels.append(label.replace("_", "\n"))
-    ax2.tick_params(axis="y", labelsize= 6)
-    ax2.set_xticks(
-        np.arange(len(prediction_dict["top_5_labels"])),
-        labels= labels,
-        fontsize= 4
-    )
-    bars = ax2.containers[0]
-    ax2.bar_label(bars, labels = [f'{x.get_height():.3%}' for x in bars], fontsize= 5)
-
-    return figure, prediction_dict["prediction"], prediction_dict["accuracy"]
-
 def save_buttons_state(save_buttons, save_method=""):
     """
     This function takes a list of save buttons and a save_method argument. If the save_method is specified it enables the 
@@ -314,7 +222,7 @@ def save_button_command(save_method, method, width_multiplier, height_multiplier
 
 
 
-def predict_button_command(input_source_frame, save_method, prediction_frame, unique_labels, model, predict_label, button_list, navigation_frame, sidebar, app_version):
+def predict_button_command(input_source_frame, save_method, prediction_frame, unique_labels, model, predict_label, button_list, navigation_frame, sidebar, app_version, prediction_buttons):
     """
     This function takes a long list of arguments, we will discuss them shortly. It is a function that is performed, when the
     'predict_button' is pressed.
@@ -329,9 +237,11 @@ def predict_button_command(input_source_frame, save_method, prediction_frame, un
      - button_list - a list of save buttons
      - navigation_frame - a NavigationFrame object
      - sidebar - a tk Frame into which the PredictionEvaluation() object can be added.
+     - app_version - version of the app, used by the config reader
+     - prediction_buttons - a list of the 'Make Predictions' and 'Cancel' buttons
 
     This function checks which input method has been selected, checks whether there are images to make predictions on
-    and if all goes right makes predictions and activates the save buttons. If the user wants to evaluate the 
+    and if all goes right starts making predictions in the background and activates the save buttons. If the user wants to evaluate the 
     predictions and give their feedback the evaluation frame is activated.
     """
     config_dict = config_reader(app_version)
@@ -360,67 +270,107 @@ def predict_button_command(input_source_frame, save_method, prediction_frame, un
     save_method.set("n/a")
     input_source = input_source_frame.notebook.tab(input_source_frame.notebook.select(), "text")
     if input_source.lower() == "input folder":
-        folder_state = prediction_frame.prediction("./user/input", unique_labels, model)
-        if folder_state == "empty":
-            predict_label["text"] = "Input folder appears to be empty..."
-            save_buttons_state(button_list)
-            navigation_frame.deactivate()
-        else:
-            predict_label["text"] = "Predictions are ready!"
-            save_buttons_state(button_list, save_method.get())
-            navigation_frame.deactivate()
+        start_predictions("./user/input", unique_labels, model, prediction_frame, predict_label, button_list, navigation_frame, prediction_buttons)
     elif input_source.lower() == "specific":
         selected_mode = input_source_frame.selected_mode.get()
         match selected_mode:
             case "dir":
                 dir_path = input_source_frame.specific_directory.get()
-                folder_state = prediction_frame.prediction(dir_path, unique_labels, model)
-                if folder_state == "empty":
-                    predict_label["text"] = "Input folder appears to be empty..."
-                    save_buttons_state(button_list)
-                    navigation_frame.deactivate()
-                else:
-                    predict_label["text"] = "Predictions are ready!"
-                    save_buttons_state(button_list, save_method.get())
-                    navigation_frame.deactivate()
+                start_predictions(dir_path, unique_labels, model, prediction_frame, predict_label, button_list, navigation_frame, prediction_buttons)
             case "img":
-                temp_name = "local_image"
-                temp_path = f"./resources/images/temp"
+                # The image is predicted straight from the original file, see 'PredictionImage.predict_images'
                 image_path = input_source_frame.specific_file.get()
-                img = Image.open(image_path)
-                img.save(f"{temp_path}/{temp_name}.jpg")
-                prediction_frame.prediction(temp_path, unique_labels, model)
-                save_buttons_state(button_list, save_method.get())
-                navigation_frame.deactivate()
-                os.remove(f"{temp_path}/{temp_name}.jpg")
-                predict_label["text"] = "Predictions are ready!"
+                start_predictions([image_path], unique_labels, model, prediction_frame, predict_label, button_list, navigation_frame, prediction_buttons)
             case _:
                 predict_label["text"] = "Select either directory or file"
     elif input_source.lower() == "web image":
-        temp_name = "web_image"
-        temp_path = f"./resources/images/temp"
-        try:
-            image_url = input_source_frame.image_url.get()
-            img = Image.open(urlopen(image_url))
-            img.save(f"{temp_path}/{temp_name}.jpg")
-            prediction_frame.prediction(temp_path, unique_labels, model)
-            save_buttons_state(button_list, save_method.get())
-            navigation_frame.deactivate()
-            os.remove(f"{temp_path}/{temp_name}.jpg")
-            predict_label["text"] = "Predictions are ready!"
-        except:
+        image_urls = input_source_frame.image_urls()
+        if image_urls:
+            # The images are downloaded in the background thread and go into the predictions straight from memory
+            start_predictions(lambda cancel_event: web_images(image_urls, cancel_event), unique_labels, model, prediction_frame, predict_label, button_list, navigation_frame, prediction_buttons)
+        else:
             predict_label["text"] = "Wrong URL or empty field..."
+
+def web_images(image_urls, cancel_event=None):
+    """
+    This function takes a list of URLs and optionally a threading.Event that cancels the downloads.
+    It downloads the images concurrently (see 'fetch_funcs.fetch_urls') and prints why any of them failed.
+
+    Returns list of (url, bytes) tuples of the downloaded images
+    """
+    print(f"Downloading {len(image_urls)} images...")
+    downloaded = []
+    for url, content, error in fetch_funcs.fetch_urls(image_urls, cancel_event=cancel_event):
+        if content is None:
+            print(f"Could not download {url}: {error}")
+        else:
+            downloaded.append((url, content))
+    print(f"Downloaded {len(downloaded)} of {len(image_urls)} images")
+
+    return downloaded
+
+def start_predictions(file_paths, unique_labels, model, prediction_frame, predict_label, button_list, navigation_frame, prediction_buttons):
+    """
+    This function takes the path to the directory with images (or anything else 'PredictionImage.start_prediction' accepts), 
+    the list of unique labels, the model and the widgets that have to follow the progress of the predictions:
+     - prediction_frame - a 'PredictionImage' object that makes the predictions in the background
+     - predict_label - a tk Label that shows the progress
+     - button_list - a list of save buttons, they get enabled as soon as the first predictions are ready
+     - navigation_frame - a NavigationFrame object, its counter grows as new predictions arrive
+     - prediction_buttons - a list of the 'Make Predictions' and 'Cancel' buttons
+
+    The predictions run in a background thread, so the app stays responsive and the user can already pick the save method 
+    and browse the first predictions while the rest are still being made.
+    """
+    predict_button, cancel_button = prediction_buttons
+    save_buttons_state(button_list)
+    navigation_frame.deactivate()
+    navigation_frame.finished = False
+    predict_button.state(["disabled"])
+    cancel_button.state(["!disabled"])
+    predict_label["text"] = "Predicting..."
+
+    def on_progress(done, total):
+        predicted = len(prediction_frame.predicted_list)
+        predict_label["text"] = f"Predicting... {done}/{total} files checked, {predicted} dogs found"
+        if predicted > 0:
+            log_startup_time("first prediction")
+        if navigation_frame.active:
+            navigation_frame.update_count(predicted)
+        elif predicted > 0:
+            save_buttons_state(button_list, "n/a")
+
+    def on_done(folder_state, cancelled):
+        navigation_frame.finished = True
+        predict_button.state(["!disabled"])
+        cancel_button.state(["disabled"])
+        if folder_state == "empty":
+            predict_label["text"] = "Predicting cancelled..." if cancelled else "Input folder appears to be empty..."
+            save_buttons_state(button_list)
+            navigation_frame.deactivate()
+        else:
+            if cancelled:
+                predict_label["text"] = f"Predicting cancelled, {len(prediction_frame.predicted_list)} predictions are ready!"
+            else:
+                predict_label["text"] = "Predictions are ready!"
+            if navigation_frame.active:
+                navigation_frame.update_count(len(prediction_frame.predicted_list))
+            else:
+                save_buttons_state(button_list, "n/a")
+
+    if isinstance(file_paths, list):
+        prediction_frame.predict_images(file_paths, unique_labels, model, on_progress, on_done)
+    else:
+        prediction_frame.start_prediction(file_paths, unique_labels, model, on_progress, on_done)
     
     
-def manual_save(image, breed_label, accuracy, idx, manually_saved_idxs, manually_saved_texts, text_label, save_button):
+def manual_save(prediction_frame, idx, manually_saved_idxs, manually_saved_texts, text_label, save_button):
     """
     This function takes a long list of arguments, we will discuss them shortly. It is a function that becomes avaialble 
     if the user selected a 'manual' saving option and is performed when the manual save button is pressed. 
     
     Arguments:
-     - image - a matplotlib figure of the currently displayed prediction
-     - breed_label - a string od the predicted breed
-     - accuracy - the accuracy of the prediction
+     - prediction_frame - a PredictionImage object, which writer saves the prediction in the background
      - idx - the idx of the displayed image
      - manually_saved_idxs - a list that is stored by the NavigationFrame object
      - manually_saved_texts - a dictionary that is stored by the NavigationFrame object
@@ -432,27 +382,72 @@ def manual_save(image, breed_label, accuracy, idx, manually_saved_idxs, manually
     Next, the 'manually_saved_texts' gets a key value pair that contains the path to the saved image, the path gets 
     displayed and the save button gets disabled so that it can't be spammed.
     """
-    label_string = image_saver(image, breed_label, accuracy)
+    label_string = prediction_frame.image_writer.save(prediction_frame.predicted_list[idx], *prediction_frame.render_settings[1:])
     manually_saved_idxs.append(idx)
     manually_saved_texts[idx] = label_string
     text_label["text"] = label_string
     save_button.state(["disabled"])
     
 def config_reader(app_version):
+    """
+    This function takes the app_version and reads the './resources/config.ini' file. If there is no such file yet, it
+    gets created with a new user_id. Settings missing from older config files (the export settings, the 'model' file
+    and its 'backend', see 'backend_funcs.BACKENDS') are filled in with their defaults.
+
+    Returns a dictionary with the config
+    """
     config_dict = {}
     
     try:
         with open("./resources/config.ini", "r+") as file:
             for line in file.readlines():
-                key, value = line.replace("\n", "").split(":")
-                config_dict[key] = value
+                if ":" in line:
+                    key, value = line.replace("\n", "").split(":", 1)
+                    config_dict[key] = value
         file.close()
     except:
         user_id = "".join(random.choices(string.ascii_letters + string.digits, k=16))
+        export_lines = "".join(f"{key}:{value}\n" for key, value in config_defaults.items())
         with open("./resources/config.ini", "a+") as file:
-            file.writelines(f"app_version:{app_version}"+ f"user_id:{user_id}\n" + "evaluation:n/a\n")
+            file.writelines(f"app_version:{app_version}\n" + f"user_id:{user_id}\n" + "evaluation:n/a\n" + export_lines)
         file.close()
+        config_dict["app_version"] = app_version
         config_dict["user_id"] = user_id
         config_dict["evaluation"] = "n/a"
 
-    return config_dict
\ No newline at end of file
+    for key, value in config_defaults.items():
+        config_dict.setdefault(key, str(value))
+
+    return config_dict
+
+def export_all_command(prediction_frame, predict_label, export_button):
+    """
+    This function takes the PredictionImage object, a tk Label used for displaying messages and the export button.
+    It saves every prediction made so far into './user/output' at once. The figures are rendered in parallel processes
+    started from a background thread, while the tk main loop only checks every now and then if they are done.
+    """
+    predicted_list = list(getattr(prediction_frame, "predicted_list", []))
+    if not predicted_list:
+        predict_label["text"] = "There are no predictions to export yet..."
+        return
+
+    _, width_multiplier, height_multiplier = prediction_frame.render_settings
+    export_result = []
+    export_thread = threading.Thread(
+        target=lambda: export_result.extend(plot_funcs.export_predictions(
+            predicted_list, prediction_frame.image_writer.settings, width_multiplier or 1, height_multiplier or 1
+        )),
+        daemon=True
+    )
+    export_button.state(["disabled"])
+    predict_label["text"] = f"Exporting {len(predicted_list)} predictions..."
+    export_thread.start()
+
+    def check_export():
+        if export_thread.is_alive():
+            predict_label.after(200, check_export)
+        else:
+            predict_label["text"] = f"Exported {len(export_result)} predictions to the output folder"
+            export_button.state(["!disabled"])
+
+    predict_label.after(200, check_export)
\ No newline at end of file
@@ -0,0 +1,280 @@
+import numpy as np
+import json
+import os
+import shutil
+import time
+
+from resources import label_funcs
+
+
+# 'keras' is the full model from the .h5 file, the 'compiled' ones wrap it in a pre-traced function saved next to it on
+# the first launch and the 'tflite' ones are exported next to it by 'model_tools.py export-tflite'
+BACKENDS = ("keras", "compiled", "compiled-xla", "tflite-dynamic", "tflite-int8")
+# The one input shape the compiled function is traced for, any number of 224x224 RGB images
+INPUT_SHAPE = (None, 224, 224, 3)
+
+
+def backend_path(model_path, backend="keras"):
+    """
+    This function takes a path to the .h5 model file and a backend name (one of BACKENDS).
+
+    Returns a path to the file (or for the compiled backends the SavedModel directory) the backend loads the model from
+    """
+    if backend == "keras":
+        return model_path
+    if backend.startswith("compiled"):
+        return os.path.splitext(model_path)[0] + ("_compiled_xla" if backend == "compiled-xla" else "_compiled")
+    quantization = backend.split("-", 1)[1]
+    return os.path.splitext(model_path)[0] + f"_{quantization}.tflite"
+
+def results_path(model_path, backend="keras"):
+    """
+    This function takes a path to the .h5 model file and a backend name (one of BACKENDS).
+
+    Returns a path to the file the predictions of the backend come from - the compiled backends run the same model as
+    'keras', so they share its predictions (and the prediction cache), only the TFLite models give different ones
+    """
+    return backend_path(model_path, backend) if backend.startswith("tflite") else model_path
+
+def available_backend(model_path, backend="keras"):
+    """
+    This function takes a path to the .h5 model file and the backend picked in the config.
+    If the backend is unknown or its model file hasn't been exported yet, it falls back to 'keras'.
+
+    Returns the backend name that can actually be used
+    """
+    if backend not in BACKENDS:
+        print(f"Unknown backend '{backend}', using 'keras' instead.")
+        return "keras"
+    # The compiled backends create their SavedModel themselves on the first launch
+    if backend.startswith("tflite") and not os.path.exists(backend_path(model_path, backend)):
+        print(f"There is no {backend_path(model_path, backend)} yet (see 'python model_tools.py export-tflite'), using 'keras' instead.")
+        return "keras"
+    return backend
+
+def load_backend(model_path, backend="keras"):
+    """
+    This function takes a path to the .h5 model file and a backend name (one of BACKENDS).
+
+    Returns the model loaded with that backend, any of them has the same 'predict' method as a Keras model
+    """
+    if backend == "keras":
+        from resources import model_funcs
+        return model_funcs.load_model(model_path)
+    if backend.startswith("compiled"):
+        try:
+            return CompiledModel(model_path, jit_compile=backend == "compiled-xla")
+        except Exception as error:
+            # Whatever went wrong with tracing, XLA or the SavedModel, the plain Keras model still predicts the same
+            print(f"Could not prepare the {backend} model ({type(error).__name__}: {error}), using 'keras' instead.")
+            from resources import model_funcs
+            return model_funcs.load_model(model_path)
+    return TFLiteModel(backend_path(model_path, backend))
+
+def calibration_images(img_paths, n_images=200, seed=7821):
+    """
+    This function takes a list of image paths (i.e. the 'data/train' images), how many of them to use and a random seed.
+    It is meant as the 'representative_dataset' of the int8 quantization, which uses the images to pick the value
+    ranges of the quantized model.
+
+    Yields single image batches (in a list, as the TFLite converter wants them)
+    """
+    from resources import model_funcs
+
+    rng = np.random.default_rng(seed)
+    picked = rng.choice(len(img_paths), size=min(n_images, len(img_paths)), replace=False)
+    for idx in picked:
+        image_tensor = model_funcs.load_image(img_paths[idx])
+        yield [np.expand_dims(np.asarray(image_tensor, dtype="float32"), axis=0)]
+
+def export_tflite(model, output_path, quantization="dynamic", calibration_paths=None, n_calibration=200):
+    """
+    This function takes a loaded Keras model, a path for the .tflite file and the quantization:
+     - 'dynamic' - weights are stored as int8, activations stay float. No calibration needed
+     - 'int8' - weights and activations are int8 (the input is uint8 pixels), which needs 'calibration_paths' - a list
+       of image paths from which 'n_calibration' images are picked to calibrate the value ranges
+
+    Returns the path to the saved .tflite file
+    """
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == "int8":
+        if not calibration_paths:
+            raise ValueError("Full int8 quantization needs calibration images")
+        converter.representative_dataset = lambda: calibration_images(calibration_paths, n_calibration)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.uint8
+        converter.inference_output_type = tf.uint8
+    elif quantization != "dynamic":
+        raise ValueError(f"Unknown quantization '{quantization}', use 'dynamic' or 'int8'")
+
+    print(f"Converting the model to TFLite with {quantization} quantization...")
+    tflite_model = converter.convert()
+    with open(output_path, "wb") as file:
+        file.write(tflite_model)
+    print(f"Saved {output_path} ({len(tflite_model) / 1024 / 1024:.1f} MB)")
+
+    return output_path
+
+class TFLiteModel:
+    def __init__(self, tflite_path, num_threads=None):
+        """
+        This creates a model that runs a .tflite file with the TFLite interpreter. The small 'tflite-runtime' package is
+        used if it's installed, otherwise the interpreter that comes with TensorFlow.
+
+        Just like a Keras model it has a 'predict' method, which takes a batch of normalized 224x224 images and returns
+        the probabilities, so it can be used anywhere the model is expected. Quantized inputs and outputs are converted
+        from and to floats on the way.
+        """
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+
+        print(f"Loading TFLite model from: {tflite_path}...")
+        self.tflite_path = tflite_path
+        self.interpreter = Interpreter(model_path=tflite_path, num_threads=num_threads or os.cpu_count())
+        self.input_details = self.interpreter.get_input_details()[0]
+        self.output_details = self.interpreter.get_output_details()[0]
+        self.batch_size = None
+
+    def predict(self, images, verbose=0):
+        images = np.asarray(images, dtype="float32")
+        if self.batch_size != len(images):
+            # The interpreter is resized (and its memory allocated again) only when the number of images changes
+            self.interpreter.resize_tensor_input(self.input_details["index"], [len(images), *images.shape[1:]])
+            self.interpreter.allocate_tensors()
+            self.batch_size = len(images)
+
+        input_type = self.input_details["dtype"]
+        if input_type != np.float32:
+            scale, zero_point = self.input_details["quantization"]
+            info = np.iinfo(input_type)
+            images = np.clip(np.round(images / scale + zero_point), info.min, info.max).astype(input_type)
+        self.interpreter.set_tensor(self.input_details["index"], images)
+        self.interpreter.invoke()
+
+        probabilities = self.interpreter.get_tensor(self.output_details["index"])
+        if self.output_details["dtype"] != np.float32:
+            scale, zero_point = self.output_details["quantization"]
+            probabilities = (probabilities.astype("float32") - zero_point) * scale
+        return probabilities
+
+class CompiledModel:
+    def __init__(self, model_path, jit_compile=False, warmup_batch_size=32):
+        """
+        This creates a model that runs the .h5 model under 'model_path' through a single 'tf.function' with a fixed
+        (None, 224, 224, 3) float32 input signature, optionally compiled with XLA ('jit_compile').
+        Keras 'predict' sets up its predict loop (and for a new number of images traces its function again) on every call,
+        which the app pays for with each folder it predicts. This function is traced only once.
+
+        The traced function is saved as a SavedModel next to the .h5 file (see 'backend_path'), so later launches load
+        it straight away without rebuilding the Keras model or tracing anything. It is rebuilt whenever the .h5 file changes.
+        Finally it's warmed up with a batch of 'warmup_batch_size' blank images, so the first real prediction doesn't
+        pay for any setup either.
+        """
+        import tensorflow as tf
+
+        self.tf = tf
+        self.jit_compile = jit_compile
+        self.warmup_batch_size = warmup_batch_size
+        self.saved_dir = backend_path(model_path, "compiled-xla" if jit_compile else "compiled")
+        source = label_funcs.file_fingerprint(model_path)
+        # The SavedModel (or the module of a freshly compiled function) owns the variables the function uses, so it has
+        # to be kept for as long as the function is
+        self.loaded = None
+
+        start = time.perf_counter()
+        self.function = self.load_saved(source)
+        if self.function is not None:
+            try:
+                self.warm_up()
+            except Exception as error:
+                print(f"The compiled model in {self.saved_dir} doesn't work ({type(error).__name__}: {error}), compiling it again...")
+                self.function = None
+        if self.function is None:
+            self.function = self.compile(model_path, source)
+            self.warm_up()
+        print(f"Compiled model ready in {time.perf_counter() - start:.1f} s")
+
+    def load_saved(self, source):
+        """
+        This method loads the function saved by an earlier launch.
+
+        Returns the function, or None if there is none yet or it was made from a different .h5 file
+        """
+        try:
+            with open(os.path.join(self.saved_dir, "source.json"), "r") as file:
+                saved_source = json.load(file)
+        except (OSError, ValueError):
+            print(f"There is no compiled model in {self.saved_dir} yet, compiling it...")
+            return None
+        if saved_source != source:
+            print(f"The compiled model in {self.saved_dir} was made from a different .h5 file, compiling it again...")
+            return None
+
+        print(f"Loading compiled model from: {self.saved_dir}...")
+        try:
+            self.loaded = self.tf.saved_model.load(self.saved_dir)
+            return self.loaded.serve
+        except Exception as error:
+            # i.e. a SavedModel cut off halfway, which TensorFlow reports with errors of its own
+            print(f"Could not load the compiled model from {self.saved_dir} ({type(error).__name__}: {error}), compiling it again...")
+            return None
+
+    def compile(self, model_path, source):
+        """
+        This method loads the .h5 model, traces its inference function and saves it for the next launches.
+
+        Returns the function
+        """
+        from resources import model_funcs
+
+        tf = self.tf
+        model = model_funcs.load_model(model_path)
+
+        @tf.function(input_signature=[tf.TensorSpec(INPUT_SHAPE, tf.float32)], jit_compile=self.jit_compile)
+        def serve(images):
+            return model(images, training=False)
+
+        module = tf.Module()
+        module.model = model
+        module.serve = serve
+        self.loaded = module
+        print(f"Saving compiled model to: {self.saved_dir}...")
+        try:
+            # Written under a temporary name first, so a half written SavedModel is never loaded
+            temp_dir = self.saved_dir + ".tmp"
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            tf.saved_model.save(module, temp_dir)
+            with open(os.path.join(temp_dir, "source.json"), "w") as file:
+                json.dump(source, file)
+            shutil.rmtree(self.saved_dir, ignore_errors=True)
+            os.replace(temp_dir, self.saved_dir)
+        except Exception as error:
+            # The function still works, only the next launch has to trace it again
+            print(f"Could not save the compiled model: {error}")
+
+        return serve
+
+    def warm_up(self):
+        blank_images = np.zeros((self.warmup_batch_size, *INPUT_SHAPE[1:]), dtype="float32")
+        self.function(self.tf.constant(blank_images))
+
+    def predict(self, images, verbose=0):
+        images = np.asarray(images, dtype="float32")
+        if not self.jit_compile:
+            return self.function(self.tf.constant(images)).numpy()
+
+        # XLA compiles the function again for every new number of images, so the images go in batches of the warm up
+        # size, the last one padded with blank images
+        size = self.warmup_batch_size
+        probabilities = []
+        for start in range(0, len(images), size):
+            batch = images[start:start+size]
+            padded = np.concatenate([batch, np.zeros((size - len(batch), *batch.shape[1:]), dtype="float32")])
+            probabilities.append(self.function(self.tf.constant(padded)).numpy()[:len(batch)])
+        return np.concatenate(probabilities) if probabilities else np.zeros((0, 0), dtype="float32")
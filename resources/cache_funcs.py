@@ -0,0 +1,128 @@
+import numpy as np
+import hashlib
+import json
+import os
+import threading
+
+from resources import label_funcs
+
+
+def disk_size(stat):
+    """
+    This function takes the result of 'os.stat' of a file.
+
+    Returns how many bytes the file takes on the disk, which for a 600 byte entry is a whole block
+    """
+    blocks = getattr(stat, "st_blocks", None)
+    if blocks is not None:
+        return blocks * 512
+    # Windows doesn't report the blocks, 4096 bytes is the usual cluster size of NTFS
+    return -(-stat.st_size // 4096) * 4096
+
+class PredictionCache:
+    def __init__(self, cache_dir, model_path, max_bytes=64 * 1024 * 1024):
+        """
+        This creates a persistent cache of the model's probabilities, stored in 'cache_dir' as one small .npy file per image.
+        Images are identified by a hash of their content, so renamed or moved files still hit the cache, and the
+        probabilities are kept in a separate directory for every model file (and every version of it). The app, the
+        batch tool and the server can share 'cache_dir' while using different models or backends.
+
+        When all the directories together take over 'max_bytes' of the disk the least recently used entries are evicted,
+        whichever model they belong to, so the entries of models that aren't used anymore are the first to go.
+        The size of the cache is only measured when the first entry is put in, so creating it costs next to nothing.
+        """
+        model_fingerprint = json.dumps(label_funcs.file_fingerprint(model_path), sort_keys=True)
+        self.model_key = hashlib.sha256(model_fingerprint.encode()).hexdigest()[:16]
+        self.root_dir = cache_dir
+        self.cache_dir = os.path.join(cache_dir, self.model_key)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Measured by the first 'put', the app creates the cache before its window shows up
+        self.total_bytes = None
+
+    def entries(self):
+        """
+        Returns a list of (last used time, size, path) of every entry in the cache, of all the models
+        """
+        entries = []
+        for model_dir in os.scandir(self.root_dir):
+            if not model_dir.is_dir():
+                continue
+            try:
+                for entry in os.scandir(model_dir.path):
+                    if entry.name.endswith(".npy"):
+                        # Another process sharing the cache may remove an entry at any moment
+                        try:
+                            stat = entry.stat()
+                        except FileNotFoundError:
+                            continue
+                        entries.append((stat.st_mtime_ns, disk_size(stat), entry.path))
+            except FileNotFoundError:
+                continue
+        return entries
+
+    def key(self, content):
+        """
+        This method takes the raw bytes of an image file.
+
+        Returns the key under which the image's probabilities are cached
+        """
+        return hashlib.sha256(content).hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.cache_dir, key + ".npy")
+
+    def get(self, key):
+        """
+        This method takes a key made by the 'key' method.
+
+        Returns the cached probabilities, or None if the image hasn't been predicted with this model yet
+        """
+        try:
+            probabilities = np.load(self.entry_path(key))
+            # Touching the file marks it as recently used for the eviction
+            os.utime(self.entry_path(key))
+        except (OSError, ValueError):
+            return None
+        return probabilities
+
+    def put(self, key, probabilities):
+        """
+        This method takes a key made by the 'key' method and the probabilities predicted by the model for that image.
+        """
+        entry_path = self.entry_path(key)
+        temp_path = f"{entry_path}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, "wb") as file:
+                np.save(file, np.asarray(probabilities, dtype="float32"))
+            os.replace(temp_path, entry_path)
+            size = disk_size(os.stat(entry_path))
+        except OSError:
+            return
+        with self.lock:
+            if self.total_bytes is None:
+                # The new entry is already on the disk, so the scan counts it too
+                self.total_bytes = sum(entry_size for _, entry_size, _ in self.entries())
+            else:
+                self.total_bytes += size
+            over_budget = self.total_bytes > self.max_bytes
+        if over_budget:
+            self.evict()
+
+    def evict(self):
+        """
+        This method removes the least recently used entries, until the cache takes at most 90% of 'max_bytes'.
+        """
+        with self.lock:
+            entries = sorted(self.entries())
+            self.total_bytes = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if self.total_bytes <= self.max_bytes * 0.9:
+                    break
+                try:
+                    os.remove(path)
+                    self.total_bytes -= size
+                except OSError:
+                    pass
@@ -0,0 +1,255 @@
+import numpy as np
+import hashlib
+import json
+import os
+
+from resources import label_funcs
+
+
+# Size of the feature vector the MobileNetV2 backbone ('InputLayer') hands to the Dense 'OutputLayer'
+EMBEDDING_SIZE = 1280
+
+
+def content_hash(img_path):
+    """
+    This function takes a path to an image file.
+
+    Returns the sha256 of its content
+    """
+    digest = hashlib.sha256()
+    with open(img_path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def backbone_handle(model):
+    """
+    This function takes a model made by 'model_funcs.build_network' (or loaded from its .h5 file).
+
+    Returns the TF Hub handle of its backbone, which says what the stored embeddings were made with
+    """
+    return str(model.get_layer("InputLayer").get_config()["handle"])
+
+class EmbeddingStore:
+    def __init__(self, store_dir, backbone, capacity=1024):
+        """
+        This creates a store of backbone embeddings in 'store_dir', one 1280 float32 row per image:
+         - 'embeddings.npy' - the rows, memory-mapped, so only the rows that are read ever get loaded from the disk
+         - 'index.json' - which row belongs to which image id, together with the content hash it was computed from
+
+        'backbone' is the TF Hub handle of the backbone (see 'backbone_handle'). A store made with a different backbone
+        is emptied, since its embeddings mean nothing to the new one.
+        """
+        self.store_dir = store_dir
+        self.embeddings_path = os.path.join(store_dir, "embeddings.npy")
+        self.index_path = os.path.join(store_dir, "index.json")
+        os.makedirs(store_dir, exist_ok=True)
+
+        self.index = {"backbone": backbone, "rows": 0, "images": {}}
+        try:
+            with open(self.index_path, "r") as file:
+                index = json.load(file)
+            if index["backbone"] == backbone:
+                self.index = index
+            else:
+                print(f"The embeddings in {store_dir} come from a different backbone, starting over...")
+        except (OSError, ValueError, KeyError):
+            pass
+
+        try:
+            self.embeddings = np.load(self.embeddings_path, mmap_mode="r+")
+        except (OSError, ValueError):
+            self.embeddings = None
+        if self.embeddings is None or len(self.embeddings) < self.index["rows"]:
+            self.index = {"backbone": backbone, "rows": 0, "images": {}}
+            self.embeddings = np.lib.format.open_memmap(self.embeddings_path, mode="w+", dtype="float32", shape=(capacity, EMBEDDING_SIZE))
+
+    def lookup(self, image_id, image_hash):
+        """
+        This method takes an image id and the content hash of the image.
+
+        Returns the row of its embedding, or None if it isn't stored (or the image changed since)
+        """
+        entry = self.index["images"].get(image_id)
+        if entry is not None and entry["hash"] == image_hash:
+            return entry["row"]
+        return None
+
+    def add(self, image_ids, image_hashes, embeddings, fingerprints=None):
+        """
+        This method takes lists of image ids, their content hashes, an array of their embeddings and optionally their
+        file fingerprints (see 'label_funcs.file_fingerprint'), so that unchanged files don't have to be hashed again.
+        The rows are written to the memory-mapped file, which grows when it's full. Call 'save' to make them stick.
+        """
+        needed = self.index["rows"] + len(image_ids)
+        if needed > len(self.embeddings):
+            self.grow(needed)
+        for idx, (image_id, image_hash) in enumerate(zip(image_ids, image_hashes)):
+            row = self.index["rows"]
+            self.embeddings[row] = embeddings[idx]
+            self.index["images"][image_id] = {"hash": image_hash, "row": row,
+                                              "fingerprint": fingerprints[idx] if fingerprints else None}
+            self.index["rows"] += 1
+
+    def grow(self, needed):
+        # The file is rewritten with double the rows, which keeps the number of rewrites low
+        capacity = max(needed, 2 * len(self.embeddings))
+        temp_path = self.embeddings_path + ".tmp"
+        grown = np.lib.format.open_memmap(temp_path, mode="w+", dtype="float32", shape=(capacity, EMBEDDING_SIZE))
+        grown[:len(self.embeddings)] = self.embeddings
+        grown.flush()
+        del grown
+        self.embeddings = None
+        os.replace(temp_path, self.embeddings_path)
+        self.embeddings = np.load(self.embeddings_path, mmap_mode="r+")
+
+    def save(self):
+        """
+        This method writes the rows added so far to the disk and only then the index that points to them, so after a
+        crash the index never points to a row that isn't there.
+        """
+        self.embeddings.flush()
+        with open(self.index_path + ".tmp", "w") as file:
+            json.dump(self.index, file)
+        os.replace(self.index_path + ".tmp", self.index_path)
+
+    def get(self, rows):
+        """
+        This method takes a list of rows.
+
+        Returns their embeddings as a (len(rows), 1280) float32 array
+        """
+        return np.asarray(self.embeddings[np.asarray(rows, dtype="int64")])
+
+    def file_key(self, img_path):
+        """
+        This method takes a path to an image file. The id of the image is its file name without the extension (the
+        Kaggle id for the training images). The content is only hashed if the file changed since it was stored.
+
+        Returns the image id, the content hash and the file fingerprint
+        """
+        image_id = os.path.splitext(os.path.basename(img_path))[0]
+        fingerprint = label_funcs.file_fingerprint(img_path)
+        entry = self.index["images"].get(image_id)
+        if entry is not None and fingerprint is not None and entry.get("fingerprint") == fingerprint:
+            return image_id, entry["hash"], fingerprint
+        return image_id, content_hash(img_path), fingerprint
+
+def embed_files(store, model, img_paths, batch_size=64):
+    """
+    This function takes an EmbeddingStore, a model made by 'model_funcs.build_network', a list of image paths and a
+    batch size. Only the images that aren't in the store yet go through the backbone, the rest is read from the store.
+
+    Returns a (len(img_paths), 1280) float32 array of the embeddings, in the order of img_paths
+    """
+    from resources import model_funcs
+
+    rows, missing = [], []
+    keys = [store.file_key(img_path) for img_path in img_paths]
+    for idx, (image_id, image_hash, _) in enumerate(keys):
+        rows.append(store.lookup(image_id, image_hash))
+        if rows[-1] is None:
+            missing.append(idx)
+
+    if missing:
+        print(f"Running the backbone over {len(missing)} images ({len(img_paths) - len(missing)} already stored)...")
+        backbone = model.get_layer("InputLayer")
+        data_batch = model_funcs.minibatch_maker([img_paths[idx] for idx in missing], batch_size, test_data=True)
+        done = 0
+        for images in data_batch:
+            embeddings = backbone(images, training=False).numpy()
+            batch_idxs = missing[done:done+len(embeddings)]
+            store.add([keys[idx][0] for idx in batch_idxs], [keys[idx][1] for idx in batch_idxs], embeddings,
+                      [keys[idx][2] for idx in batch_idxs])
+            for idx in batch_idxs:
+                rows[idx] = store.lookup(keys[idx][0], keys[idx][1])
+            done += len(embeddings)
+            # Saving every now and then, so an interrupted run doesn't have to start over
+            if done % (batch_size * 20) < len(embeddings):
+                store.save()
+        store.save()
+
+    return store.get(rows)
+
+def embed_arrays(store, model, image_ids, image_hashes, image_arrays, batch_size=64):
+    """
+    This function takes an EmbeddingStore, a model made by 'model_funcs.build_network', lists of image ids, their
+    content hashes and their decoded pixels (i.e. the images kept in the evaluation logs). Just like 'embed_files' only
+    the images that aren't in the store yet go through the backbone.
+
+    Returns a (len(image_ids), 1280) float32 array of the embeddings, in the order of image_ids
+    """
+    from resources import model_funcs
+
+    rows = [store.lookup(image_id, image_hash) for image_id, image_hash in zip(image_ids, image_hashes)]
+    missing = [idx for idx, row in enumerate(rows) if row is None]
+    backbone = model.get_layer("InputLayer") if missing else None
+    for start in range(0, len(missing), batch_size):
+        batch_idxs = missing[start:start+batch_size]
+        images = np.stack([model_funcs.rgb_to_tensor(image_arrays[idx]) for idx in batch_idxs])
+        store.add([image_ids[idx] for idx in batch_idxs], [image_hashes[idx] for idx in batch_idxs],
+                  backbone(images, training=False).numpy())
+        for idx in batch_idxs:
+            rows[idx] = store.lookup(image_ids[idx], image_hashes[idx])
+    if missing:
+        store.save()
+
+    return store.get(rows)
+
+def build_head(output_shape, learning_rate=0.001):
+    """
+    This function takes the number of breeds to output and optionally the learning rate of the Adam optimizer.
+
+    Returns a compiled model with just the Dense 'OutputLayer' of 'model_funcs.build_network', trained and used on
+    embeddings instead of images
+    """
+    import tensorflow as tf
+
+    head = tf.keras.Sequential([
+        tf.keras.layers.Dense(units=output_shape, activation="softmax", name="OutputLayer")
+    ])
+    head.compile(
+        loss=tf.keras.losses.CategoricalCrossentropy(),
+        optimizer=tf.keras.optimizers.Adam(learning_rate=learning_rate),
+        metrics=["accuracy"]
+    )
+    head.build((None, EMBEDDING_SIZE))
+    return head
+
+def head_from_model(model, new_breeds=0, learning_rate=0.001):
+    """
+    This function takes a full model and optionally a number of new breeds to add and the learning rate of the head.
+    The new breeds get output units of their own after the existing ones, which start out with no weights and the
+    lowest bias of the existing units, so they're the least likely breeds until they get trained.
+
+    Returns a head (see 'build_head') with the weights of its 'OutputLayer'
+    """
+    kernel, bias = model.get_layer("OutputLayer").get_weights()
+    if new_breeds:
+        kernel = np.concatenate([kernel, np.zeros((kernel.shape[0], new_breeds), dtype=kernel.dtype)], axis=1)
+        bias = np.concatenate([bias, np.full(new_breeds, bias.min(), dtype=bias.dtype)])
+    head = build_head(len(bias), learning_rate)
+    head.get_layer("OutputLayer").set_weights([kernel, bias])
+    return head
+
+def attach_head(model, head):
+    """
+    This function takes a full model and a trained head.
+
+    Returns a new full model - the backbone of 'model' under the 'OutputLayer' of 'head', ready for 'model_funcs.save_model'
+    """
+    import tensorflow as tf
+
+    weights = head.get_layer("OutputLayer").get_weights()
+    full_model = tf.keras.Sequential([
+        model.get_layer("InputLayer"),
+        tf.keras.layers.Dense(units=weights[1].shape[0], activation="softmax", name="OutputLayer")
+    ])
+    full_model.compile(
+        loss=tf.keras.losses.CategoricalCrossentropy(),
+        optimizer=tf.keras.optimizers.Adam(),
+        metrics=["accuracy"]
+    )
+    full_model.build((None, 224, 224, 3))
+    full_model.get_layer("OutputLayer").set_weights(weights)
+    return full_model
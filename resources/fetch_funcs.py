@@ -0,0 +1,167 @@
+import http.client
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlsplit
+
+
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+USER_AGENT = "IdentiBreed"
+# Responses worth asking for again, everything else (i.e. 404) fails right away
+RETRY_STATUSES = (408, 429, 500, 502, 503, 504)
+
+
+class FetchError(Exception):
+    def __init__(self, reason, retryable=False):
+        """
+        Raised when an image couldn't be downloaded, the message says why. 'retryable' tells whether asking again might help.
+        """
+        Exception.__init__(self, reason)
+        self.retryable = retryable
+
+
+class ConnectionPool:
+    def __init__(self, timeout=10):
+        """
+        This creates a pool of keep-alive HTTP(S) connections. Every thread gets its own connection to each host, so
+        the threads never share a connection and consecutive downloads from the same host reuse it.
+        'timeout' is the number of seconds any single connect or read may take.
+        """
+        self.timeout = timeout
+        self.local = threading.local()
+        self.all_connections = []
+        self.lock = threading.Lock()
+
+    def connection(self, scheme, host):
+        connections = self.local.__dict__.setdefault("connections", {})
+        if (scheme, host) not in connections:
+            connection_class = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+            connections[(scheme, host)] = connection_class(host, timeout=self.timeout)
+            with self.lock:
+                self.all_connections.append(connections[(scheme, host)])
+        return connections[(scheme, host)]
+
+    def discard(self, scheme, host):
+        """
+        This method closes the connection of this thread to the host, the next request opens a new one.
+        """
+        connection = self.local.__dict__.get("connections", {}).pop((scheme, host), None)
+        if connection is not None:
+            connection.close()
+
+    def close(self):
+        with self.lock:
+            for connection in self.all_connections:
+                connection.close()
+            self.all_connections = []
+
+def fetch_url(pool, url, max_bytes=MAX_IMAGE_BYTES, retries=2, max_redirects=5):
+    """
+    This function takes a ConnectionPool, a URL and optionally:
+        - max_bytes: the largest download allowed, bigger files are refused without being downloaded any further
+        - retries: how many more times to try after a timeout, a dropped connection or a 5xx/429 response
+        - max_redirects: how many redirects to follow
+
+    Returns the content of the response as bytes. Raises FetchError if it couldn't be downloaded
+    """
+    attempt, redirects = 0, 0
+    while True:
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.netloc:
+            raise FetchError("not an http(s) URL")
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        try:
+            connection = pool.connection(parts.scheme, parts.netloc)
+            connection.request("GET", path, headers={"User-Agent": USER_AGENT, "Accept": "image/*"})
+            response = connection.getresponse()
+
+            if response.status in (301, 302, 303, 307, 308) and response.getheader("Location"):
+                response.read()
+                redirects += 1
+                if redirects > max_redirects:
+                    raise FetchError("too many redirects")
+                url = urljoin(url, response.getheader("Location"))
+                continue
+            if response.status != 200:
+                response.read()
+                raise FetchError(f"HTTP {response.status}", response.status in RETRY_STATUSES)
+
+            length = response.getheader("Content-Length", "")
+            # A malformed length is ignored, the size cap below is checked on the content itself anyway
+            if length.strip().isdigit() and int(length) > max_bytes:
+                # What's left of the response is never read, so the connection can't be reused
+                pool.discard(parts.scheme, parts.netloc)
+                raise FetchError(f"bigger than the {max_bytes} bytes limit")
+            content = response.read(max_bytes + 1)
+            if len(content) > max_bytes:
+                pool.discard(parts.scheme, parts.netloc)
+                raise FetchError(f"bigger than the {max_bytes} bytes limit")
+            if response.will_close:
+                pool.discard(parts.scheme, parts.netloc)
+            return content
+
+        except FetchError as error:
+            retryable = error.retryable
+            reason = str(error)
+        except (OSError, http.client.HTTPException) as error:
+            # A keep-alive connection closed by the server or a timeout, either way the connection is done for
+            pool.discard(parts.scheme, parts.netloc)
+            retryable = True
+            reason = f"{type(error).__name__}: {error}" if str(error) else type(error).__name__
+
+        if not retryable or attempt >= retries:
+            raise FetchError(reason)
+        attempt += 1
+        # Backing off a little more after every failed attempt
+        time.sleep(0.25 * 2 ** (attempt - 1))
+
+def fetch_urls(urls, max_workers=8, timeout=10, max_bytes=MAX_IMAGE_BYTES, retries=2, cancel_event=None):
+    """
+    This function takes a list of URLs and optionally:
+        - max_workers: how many downloads run at once
+        - timeout: seconds any single connect or read may take
+        - max_bytes, retries: see 'fetch_url'
+        - cancel_event: a threading.Event, if it gets set the downloads that haven't started yet are skipped
+
+    Downloads all the URLs concurrently, reusing the connections to the same hosts.
+
+    Returns a list of (url, content, error) tuples in the order of the URLs. Either the content (bytes) or the error
+    (a string with the reason) is None
+    """
+    pool = ConnectionPool(timeout)
+
+    def fetch(url):
+        if cancel_event is not None and cancel_event.is_set():
+            return url, None, "cancelled"
+        try:
+            return url, fetch_url(pool, url, max_bytes, retries), None
+        except FetchError as error:
+            return url, None, str(error)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(urls)))) as executor:
+            return list(executor.map(fetch, urls))
+    finally:
+        pool.close()
+
+def read_url_list(text):
+    """
+    This function takes text with URLs (i.e. pasted by the user or read from a file), one per line or separated by spaces.
+    Lines starting with '#' are ignored, as are repeated URLs.
+
+    Returns a list of the URLs in the order they were given
+    """
+    urls, seen = [], set()
+    for line in text.splitlines():
+        if line.strip().startswith("#"):
+            continue
+        for url in line.split():
+            if url not in seen:
+                seen.add(url)
+                urls.append(url)
+
+    return urls
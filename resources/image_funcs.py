@@ -0,0 +1,195 @@
+import numpy as np
+import io
+import os
+import PIL.Image
+
+
+# Magic bytes at the start of every supported image file and the format they belong to
+MAGIC_BYTES = [
+    (0, b"\xff\xd8\xff", "jpeg"),
+    (0, b"\x89PNG\r\n\x1a\n", "png"),
+    (0, b"GIF87a", "gif"),
+    (0, b"GIF89a", "gif"),
+    (0, b"BM", "bmp"),
+    (8, b"WEBP", "webp"),
+    (0, b"II*\x00", "tiff"),
+    (0, b"MM\x00*", "tiff"),
+]
+HEIC_BRANDS = (b"heic", b"heix", b"hevc", b"heim", b"heis", b"mif1", b"msf1", b"avif")
+SUPPORTED_FORMATS = ("jpeg", "png", "gif", "bmp", "webp", "tiff", "heic")
+heic_support = None
+
+
+class SkippedImage(ValueError):
+    """
+    Raised for files that can't be turned into an image, the message is the reason why (i.e. 'not an image').
+    """
+
+
+def sniff_format(header):
+    """
+    This function takes the first (at least 16) bytes of a file.
+
+    Returns the image format judging by the magic bytes, or None if it isn't any of the supported formats
+    """
+    for offset, magic, image_format in MAGIC_BYTES:
+        if header[offset:offset+len(magic)] == magic:
+            # 'RIFF....WEBP' - the offset check alone would also let through WAV and AVI files with a 'WEBP' in them
+            if image_format != "webp" or header[:4] == b"RIFF":
+                return image_format
+    # HEIC files are ISO media files, which say what they are in the 'ftyp' box
+    if header[4:8] == b"ftyp" and header[8:12] in HEIC_BRANDS:
+        return "heic"
+    return None
+
+def enable_heic():
+    """
+    This function registers the HEIC decoder of the optional 'pillow-heif' package with PIL (only the first time it's called).
+
+    Returns True if HEIC files can be opened
+    """
+    global heic_support
+    if heic_support is None:
+        try:
+            from pillow_heif import register_heif_opener
+            register_heif_opener()
+            heic_support = True
+        except ImportError:
+            heic_support = False
+    return heic_support
+
+def open_image(source):
+    """
+    This function takes an image path or the raw bytes of an image file. It checks the format before anything gets decoded.
+
+    Returns an opened (but not yet decoded) PIL Image and its format. Raises SkippedImage if it can't be opened
+    """
+    try:
+        if isinstance(source, bytes):
+            header = source[:16]
+            image_file = io.BytesIO(source)
+        else:
+            with open(source, "rb") as file:
+                header = file.read(16)
+            image_file = source
+    except OSError as error:
+        raise SkippedImage(f"unreadable ({error.strerror or error})")
+
+    image_format = sniff_format(header)
+    if image_format is None:
+        raise SkippedImage("not an image")
+    if image_format == "heic" and not enable_heic():
+        raise SkippedImage("HEIC needs the 'pillow-heif' package")
+
+    try:
+        return PIL.Image.open(image_file), image_format
+    except (OSError, ValueError, PIL.Image.DecompressionBombError):
+        raise SkippedImage(f"corrupt {image_format}")
+
+def decode_rgb(source, img_size=224):
+    """
+    This function takes an image path or the raw bytes of an image file and decodes it as cheaply as possible, for an
+    image that is about to be resized to img_size x img_size anyway.
+    JPEGs are decoded with a reduced-size DCT (PIL's draft mode), so a 12 MP photo is decoded straight into something
+    close to img_size pixels instead of its full resolution. Animated images give their first frame.
+
+    Returns a uint8 RGB NumPy array. Raises SkippedImage if the file can't be decoded
+    """
+    image_file, image_format = open_image(source)
+    with image_file:
+        try:
+            if image_format == "jpeg":
+                # Draft mode keeps the image at least img_size pixels in both dimensions, the resize takes it from there
+                image_file.draft("RGB", (img_size, img_size))
+            return np.asarray(image_file.convert("RGB"))
+        except (OSError, ValueError, SyntaxError):
+            raise SkippedImage(f"corrupt {image_format}")
+
+def decode_full(source):
+    """
+    This function takes an image path or the raw bytes of an image file.
+
+    Returns the image in its full resolution as a NumPy array. Only RGB and grayscale images keep their pixels as they
+    are, any other mode (CMYK, palette, alpha, 16 bit...) is turned into RGB, so the array always looks the way the
+    image does.
+    Raises SkippedImage if the file can't be decoded
+    """
+    image_file, image_format = open_image(source)
+    with image_file:
+        try:
+            image_file.load()
+            full_image = image_file if image_file.mode in ("RGB", "L") else image_file.convert("RGB")
+            return np.asarray(full_image)
+        except (OSError, ValueError, SyntaxError):
+            raise SkippedImage(f"corrupt {image_format}")
+
+# File extensions the scanner picks up, everything else is left alone without being opened
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".jfif", ".png", ".gif", ".bmp", ".webp", ".tif", ".tiff", ".heic", ".heif")
+
+
+def scan_images(directory, extensions=IMAGE_EXTENSIONS, min_bytes=1, max_bytes=200 * 1024 * 1024, recursive=True):
+    """
+    This function takes a directory and optionally:
+        - extensions: tuple of lowercase file extensions to pick up, None picks up every file
+        - min_bytes, max_bytes: files smaller or bigger than that are left out, before anything gets opened
+        - recursive: whether to go into subdirectories as well
+
+    Hidden files and directories (starting with a '.') are skipped. It is built on 'os.scandir', which gets the type of
+    every entry together with its name, so only the files that pass the extension filter ever need a 'stat' call for
+    their size. That keeps listing fast on folders with 100k entries and on network drives, where every call is a round trip.
+
+    Yields paths of the image files, sorted by name within each directory
+    """
+    pending = [directory]
+    while pending:
+        current = pending.pop()
+        try:
+            with os.scandir(current) as entries:
+                entries = sorted((entry for entry in entries if not entry.name.startswith(".")), key=lambda entry: entry.name)
+        except OSError:
+            continue
+
+        subdirectories = []
+        for entry in entries:
+            try:
+                if entry.is_dir():
+                    subdirectories.append(entry.path)
+                    continue
+                if not entry.is_file():
+                    continue
+                if extensions is not None and not entry.name.lower().endswith(extensions):
+                    continue
+                size = entry.stat().st_size
+            except OSError:
+                continue
+            if size >= min_bytes and (max_bytes is None or size <= max_bytes):
+                yield entry.path
+        if recursive:
+            # Reversed, so that the subdirectories are popped (and listed) in alphabetical order
+            pending.extend(reversed(subdirectories))
+
+def read_manifest(manifest_path, extensions=IMAGE_EXTENSIONS, min_bytes=1, max_bytes=200 * 1024 * 1024):
+    """
+    This function takes a path to a manifest - a text file with one image path per line - and the same filters as
+    'scan_images'. Empty lines and lines starting with '#' are ignored, relative paths are relative to the manifest.
+
+    Returns a list of paths of the image files that exist and pass the filters, in the order of the manifest
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    img_paths = []
+    with open(manifest_path, "r") as file:
+        for line in file:
+            img_path = line.strip()
+            if not img_path or img_path.startswith("#"):
+                continue
+            img_path = os.path.join(base_dir, os.path.expanduser(img_path))
+            if extensions is not None and not img_path.lower().endswith(extensions):
+                continue
+            try:
+                size = os.stat(img_path).st_size
+            except OSError:
+                continue
+            if size >= min_bytes and (max_bytes is None or size <= max_bytes):
+                img_paths.append(img_path)
+
+    return img_paths
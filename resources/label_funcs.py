@@ -0,0 +1,135 @@
+import numpy as np
+import csv
+import json
+import os
+
+
+# The model the app and the tools use, unless they're told to use another one
+DEFAULT_MODEL = "./models/20230511-14531683809630-full-image-set-MobileNetV2-Adam-v2.h5"
+
+
+def file_fingerprint(file_path):
+    """
+    This function takes a path to a file.
+
+    Returns a dictionary with the file name, size and modification time, or None if the file doesn't exist
+    """
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+
+    return {"file": os.path.basename(file_path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+def label_index_path(model_path):
+    """
+    This function takes a path to the model file.
+
+    Returns a path to the label index that belongs to this model (saved right next to it)
+    """
+    return os.path.splitext(model_path)[0] + "_labels.json"
+
+def model_output_units(model_path):
+    """
+    This function takes a path to the .h5 model file and reads the number of units of its 'OutputLayer' straight from
+    the saved model config, without loading the model (or TensorFlow).
+
+    Returns the number of breeds the model outputs, or None if it can't be told
+    """
+    try:
+        import h5py
+        with h5py.File(model_path, "r") as file:
+            model_config = file.attrs["model_config"]
+        model_config = json.loads(model_config.decode() if isinstance(model_config, bytes) else model_config)
+        for layer in model_config["config"]["layers"]:
+            if layer["config"].get("name") == "OutputLayer":
+                return int(layer["config"]["units"])
+    except Exception:
+        pass
+    return None
+
+def read_breeds(labels_csv_path="./data/labels.csv", labels_txt_path="./resources/unique_labels.txt"):
+    """
+    This function takes a path to the Kaggle 'labels.csv' file and a path to the 'unique_labels.txt' file as a backup.
+    It reads the 'breed' column with the csv module, so that pandas doesn't have to be imported.
+
+    Returns a sorted list of unique breeds, the same as 'model_funcs.unique_labels_maker'
+    """
+    if os.path.exists(labels_csv_path):
+        with open(labels_csv_path, newline="") as file:
+            return sorted({row["breed"] for row in csv.DictReader(file)})
+
+    with open(labels_txt_path, "r") as file:
+        return [line.strip() for line in file if line.strip()]
+
+def build_label_index(model_path, names, labels_csv_path="./data/labels.csv", source="labels_csv", details=None):
+    """
+    This function takes a path to the model file, a list of breed names the model outputs (in order of the output layer)
+    and a path to the 'labels.csv' they were made from. Optionally it takes:
+     - source - 'labels_csv' if the names come from 'labels.csv', or 'retrained' if the model was retrained with breeds
+       that aren't in it (then the index is never rebuilt from 'labels.csv')
+     - details - a dictionary of anything else worth keeping about the model (i.e. what it was retrained on)
+    It writes the label index next to the model file.
+
+    Returns the label index dictionary
+    """
+    names = [str(name) for name in names]
+    label_index = {
+        "model": file_fingerprint(model_path),
+        "labels_csv": file_fingerprint(labels_csv_path),
+        "source": source,
+        "details": details or {},
+        "names": names,
+        "display_names": [name.replace("_", " ") for name in names],
+        "index": {name: idx for idx, name in enumerate(names)}
+    }
+
+    try:
+        with open(label_index_path(model_path), "w") as file:
+            json.dump(label_index, file)
+    except OSError:
+        print(f"Could not save the label index next to {model_path}, it will be rebuilt on the next launch.")
+
+    return label_index
+
+def load_label_index(model_path, labels_csv_path="./data/labels.csv"):
+    """
+    This function takes a path to the model file and a path to the Kaggle 'labels.csv' file.
+    It loads the precomputed label index of the model. The index is rebuilt from 'labels.csv' only if it's missing or
+    stale, so if either the model file or the 'labels.csv' file changed since it was written. Indexes of retrained
+    models are never rebuilt, their breeds don't come from 'labels.csv'.
+    Raises ValueError if the number of breeds doesn't match the output layer of the model.
+
+    Returns the label index dictionary, in which 'names' is a NumPy array of unique labels
+    """
+    label_index = None
+    try:
+        with open(label_index_path(model_path), "r") as file:
+            label_index = json.load(file)
+    except (OSError, ValueError):
+        pass
+
+    if label_index is not None and label_index.get("source", "labels_csv") == "labels_csv":
+        model_changed = label_index["model"] != file_fingerprint(model_path)
+        csv_fingerprint = file_fingerprint(labels_csv_path)
+        csv_changed = csv_fingerprint is not None and label_index["labels_csv"] != csv_fingerprint
+        # Without the 'labels.csv' there is nothing to rebuild from, so even a stale index is better than none
+        if (model_changed or csv_changed) and csv_fingerprint is not None:
+            print("Label index is out of date, rebuilding it from 'labels.csv'...")
+            label_index = None
+
+    # A list of names that doesn't match the output layer would put the wrong names on the predictions (or point past
+    # the end of it), so the model isn't used with one
+    output_units = model_output_units(model_path)
+    if label_index is None:
+        names = read_breeds(labels_csv_path)
+        # i.e. a retrained model with more breeds than 'labels.csv', which lost its label index
+        if output_units is not None and output_units != len(names):
+            raise ValueError(f"{model_path} outputs {output_units} breeds, but 'labels.csv' has {len(names)}. Its label "
+                             f"index ({label_index_path(model_path)}) is missing, it has to be put back next to the model.")
+        label_index = build_label_index(model_path, names, labels_csv_path)
+    elif output_units is not None and output_units != len(label_index["names"]):
+        raise ValueError(f"{model_path} outputs {output_units} breeds, but its label index has {len(label_index['names'])}.")
+
+    label_index["names"] = np.array(label_index["names"])
+    return label_index
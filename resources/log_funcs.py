@@ -0,0 +1,259 @@
+import numpy as np
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+
+
+def pixels_key(image_array):
+    """
+    This function takes an image array.
+
+    Returns the image as a uint8 array and a hash of its pixels, under which the pixels are stored in the log
+    """
+    pixels = np.asarray(image_array)
+    # Older predictions kept the images as int32, the pixels themselves never go over 255 anyway
+    if pixels.dtype != "uint8":
+        pixels = np.clip(pixels, 0, 255).astype("uint8")
+    pixels = np.ascontiguousarray(pixels)
+    digest = hashlib.sha256()
+    digest.update(str(pixels.shape).encode())
+    digest.update(pixels.tobytes())
+    return pixels, digest.hexdigest()
+
+def metadata_line(record, key):
+    """
+    This function takes a record of the evaluation log and the hash of its pixels.
+
+    Returns the record as a line of JSON, with the hash in place of the image
+    """
+    correct_prediction = record["correct_prediction"]
+    # 'Don't know' answers have no correct_prediction. It's None when it comes from the app or a JSONL log, but a
+    # record built with pandas (i.e. an older .pkl log) has NaN instead, which is the only value not equal to itself
+    if correct_prediction is not None and correct_prediction != correct_prediction:
+        correct_prediction = None
+    return json.dumps({
+        "file_name": record["file_name"],
+        "image_hash": key,
+        "breed": str(record["breed"]),
+        "correct_prediction": None if correct_prediction is None else int(correct_prediction)
+    })
+
+def write_log(log_dir, log_name, records):
+    """
+    This function takes a directory, a name of the evaluation log and a list of records. Every record is a dictionary
+    with the 'file_name', 'image_array', 'breed' and 'correct_prediction' of one evaluated image.
+
+    It writes two files:
+     - '{log_name}.jsonl' - one line of metadata per record, with the hash of the image instead of the image itself
+     - '{log_name}.npz' - compressed uint8 pixels, every distinct image stored once under its hash
+
+    Returns paths to both files
+    """
+    lines, pixels_by_key = [], {}
+    for record in records:
+        pixels, key = pixels_key(record["image_array"])
+        pixels_by_key[key] = pixels
+        lines.append(metadata_line(record, key))
+
+    metadata_path = os.path.join(log_dir, f"{log_name}.jsonl")
+    pixels_path = os.path.join(log_dir, f"{log_name}.npz")
+    # Both files are written under temporary names first, so a half written log never looks finished
+    with open(pixels_path + ".tmp", "wb") as file:
+        np.savez_compressed(file, **pixels_by_key)
+    with open(metadata_path + ".tmp", "w") as file:
+        file.write("".join(line + "\n" for line in lines))
+    os.replace(pixels_path + ".tmp", pixels_path)
+    os.replace(metadata_path + ".tmp", metadata_path)
+
+    return metadata_path, pixels_path
+
+def read_log(log_dir, log_name):
+    """
+    This function takes a directory and a name of the evaluation log written by 'write_log'.
+
+    Returns a list of records, the same as were given to 'write_log', with the pixels restored as uint8 arrays
+    """
+    with open(os.path.join(log_dir, f"{log_name}.jsonl"), "r") as file:
+        records = [json.loads(line) for line in file if line.strip()]
+    with np.load(os.path.join(log_dir, f"{log_name}.npz")) as pixels:
+        for record in records:
+            record["image_array"] = pixels[record["image_hash"]]
+
+    return records
+
+class EvaluationJournal:
+    def __init__(self, log_dir, log_name, sync_every=8, sync_interval=2.0):
+        """
+        This creates an append-only journal of the evaluations made in one session, saved as '{log_name}.journal' in 
+        'log_dir'. Every answer becomes one JSON line and the pixels of the image go into 'log_dir/blobs', named by their
+        hash, so the same image is never written twice.
+
+        Answers are written by a background thread and synced to the disk in batches, after every 'sync_every' answers
+        or 'sync_interval' seconds, whichever comes first. Appending an answer costs the same no matter how long the
+        session is, and if the app crashes at most the last unsynced batch is lost.
+
+        If writing fails (i.e. the disk is full), the answers that couldn't be written are kept in memory and 'error'
+        is set, so the app can tell the user. 'close' tries to write them once more and raises OSError if it can't.
+        Once closed, the journal takes no more answers.
+        """
+        self.log_dir = log_dir
+        self.log_name = log_name
+        self.journal_path = os.path.join(log_dir, f"{log_name}.journal")
+        self.blob_dir = os.path.join(log_dir, "blobs")
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.records = queue.Queue()
+        self.error = None
+        self.unwritten = []
+        self.closed = False
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self.thread = threading.Thread(target=self.worker, daemon=True)
+        self.thread.start()
+
+    def append(self, file_name, image_array, breed, correct_prediction):
+        """
+        This method takes the same values as a row of the evaluation log. It returns right away, the answer gets written
+        by the background thread.
+        Raises ValueError if the journal is already closed, there is no thread left to write the answer.
+        """
+        if self.closed:
+            raise ValueError(f"The evaluation journal {self.journal_path} is already closed")
+        self.records.put({"file_name": file_name, "image_array": image_array, "breed": breed, "correct_prediction": correct_prediction})
+
+    def worker(self):
+        journal = None
+        closing = False
+        while not closing:
+            batch = []
+            deadline = time.monotonic() + self.sync_interval
+            while len(batch) < self.sync_every:
+                try:
+                    record = self.records.get(timeout=max(deadline - time.monotonic(), 0) if batch else None)
+                except queue.Empty:
+                    break
+                if record is None:
+                    closing = True
+                    break
+                batch.append(record)
+
+            try:
+                if journal is None:
+                    journal = open(self.journal_path, "a")
+                self.write(journal, batch)
+            except Exception as error:
+                # The batch is kept as a whole, an answer written twice does no harm since the last one counts
+                if self.error is None:
+                    print(f"Could not write the evaluation journal {self.journal_path}: {error}")
+                self.error = error
+                self.unwritten.extend(batch)
+        if journal is not None:
+            journal.close()
+
+    def write(self, journal, batch):
+        for record in batch:
+            pixels, key = pixels_key(record["image_array"])
+            write_blob(blob_path(self.blob_dir, key), pixels)
+            journal.write(metadata_line(record, key) + "\n")
+        if batch:
+            journal.flush()
+            os.fsync(journal.fileno())
+
+    def close(self):
+        """
+        This method writes and syncs every answer appended so far and stops the background thread.
+        Answers that couldn't be written before get one more try, if that fails too it raises OSError.
+        """
+        self.closed = True
+        if self.thread.is_alive():
+            self.records.put(None)
+            self.thread.join()
+        if self.unwritten:
+            try:
+                with open(self.journal_path, "a") as journal:
+                    self.write(journal, self.unwritten)
+            except Exception as error:
+                raise OSError(f"{len(self.unwritten)} answers couldn't be saved to {self.log_dir}: {error}")
+            self.unwritten = []
+            self.error = None
+
+def blob_path(blob_dir, key):
+    return os.path.join(blob_dir, f"{key}.npz")
+
+def write_blob(path, pixels):
+    """
+    This function takes a path made by 'blob_path' and a uint8 image array and writes the compressed pixels there,
+    unless a blob with the same content is already stored.
+    """
+    if os.path.exists(path):
+        return
+    with open(path + ".tmp", "wb") as file:
+        np.savez_compressed(file, pixels=pixels)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(path + ".tmp", path)
+
+def replay_journal(log_dir, log_name):
+    """
+    This function takes a directory and a name of the evaluation log, which journal was written by 'EvaluationJournal'.
+    It turns the journal into the usual '{log_name}.jsonl' and '{log_name}.npz' log (see 'write_log'). If an image was
+    answered more than once, the last answer counts. Lines cut off by a crash and answers which pixels are missing are skipped.
+
+    Returns paths to both files of the log
+    """
+    records = {}
+    with open(os.path.join(log_dir, f"{log_name}.journal"), "r") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+                with np.load(blob_path(os.path.join(log_dir, "blobs"), record["image_hash"])) as blob:
+                    record["image_array"] = blob["pixels"]
+            except (ValueError, KeyError, OSError):
+                continue
+            records.pop(record["file_name"], None)
+            records[record["file_name"]] = record
+
+    return write_log(log_dir, log_name, list(records.values()))
+
+def remove_journal(log_dir, log_name):
+    """
+    This function takes a directory and a name of the evaluation log that has already been replayed. It removes the
+    journal and all blobs that no other journal in 'log_dir' refers to.
+    """
+    os.remove(os.path.join(log_dir, f"{log_name}.journal"))
+    still_used = set()
+    for file in os.listdir(log_dir):
+        if file.endswith(".journal"):
+            with open(os.path.join(log_dir, file), "r") as journal:
+                for line in journal:
+                    try:
+                        still_used.add(json.loads(line)["image_hash"])
+                    except (ValueError, KeyError):
+                        pass
+    blob_dir = os.path.join(log_dir, "blobs")
+    for file in os.listdir(blob_dir):
+        if file.endswith(".npz") and file[:-len(".npz")] not in still_used:
+            os.remove(os.path.join(blob_dir, file))
+
+def recover_journals(log_dir):
+    """
+    This function takes the directory of the evaluation logs. Journals left behind by sessions that ended before their
+    log was written (i.e. the app crashed or was closed early) get replayed into logs, so no answer is lost.
+
+    Returns a list of names of the recovered logs
+    """
+    recovered = []
+    if not os.path.isdir(log_dir):
+        return recovered
+    for file in sorted(os.listdir(log_dir)):
+        log_name = file[:-len(".journal")]
+        if file.endswith(".journal") and not os.path.exists(os.path.join(log_dir, f"{log_name}.jsonl")):
+            replay_journal(log_dir, log_name)
+            remove_journal(log_dir, log_name)
+            recovered.append(log_name)
+    if recovered:
+        print(f"Recovered {len(recovered)} evaluation logs from the previous sessions.")
+
+    return recovered
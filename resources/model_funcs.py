@@ -2,13 +2,10 @@ import tensorflow as tf
 import tensorflow_hub as hub
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 import datetime
 import os
-import io
 
-from IPython.display import Image
-from sklearn.model_selection import train_test_split
+from resources import image_funcs, predict_funcs
 
 def turn_to_tensor(img_path, img_size=224):
   """
@@ -20,7 +17,8 @@ def turn_to_tensor(img_path, img_size=224):
 
   # Load in the image file and turn it into a numerical Tensor
   img = tf.io.read_file(img_path)
-  img = tf.image.decode_jpeg(img, channels=3)
+  # 'decode_image' handles JPEG, PNG, GIF and BMP files alike, animated GIFs give just their first frame
+  img = tf.image.decode_image(img, channels=3, expand_animations=False)
 
   # Normalizing the image and resizing it to a constant (244x244)
   img = tf.image.convert_image_dtype(img, tf.float32)
@@ -28,6 +26,41 @@ def turn_to_tensor(img_path, img_size=224):
 
   return img
 
+def load_image(img_path, img_size=224):
+  """
+  This function takes an image path (or the raw bytes of an image file) of any format 'image_funcs' supports
+  (JPEG, PNG, GIF, BMP, WebP, TIFF and HEIC) and decodes it at a reduced size whenever the format allows it, which
+  is a lot quicker for big photos. The full resolution image is never kept, the app re-reads it from the file when
+  it's needed (see 'image_funcs.decode_full').
+
+  Raises 'image_funcs.SkippedImage' with the reason, if the file can't be decoded.
+
+  Returns a normalized img_size x img_size Tensor, which is both the model input and the image displayed in the app
+  """
+
+  return rgb_to_tensor(image_funcs.decode_rgb(img_path, img_size), img_size)
+
+def rgb_to_tensor(rgb_array, img_size=224):
+  """
+  This function takes already decoded uint8 pixels. Grayscale images and images with an alpha channel (i.e. the
+  full resolution arrays kept in the evaluation logs) are turned into RGB first.
+
+  Returns a normalized img_size x img_size Tensor, the same as 'turn_to_tensor' makes
+  """
+  rgb_array = np.asarray(rgb_array)
+  if rgb_array.ndim == 2:
+    rgb_array = np.stack([rgb_array] * 3, axis=-1)
+  elif rgb_array.shape[-1] == 2:
+    rgb_array = np.stack([rgb_array[..., 0]] * 3, axis=-1)
+  elif rgb_array.shape[-1] == 4:
+    rgb_array = rgb_array[..., :3]
+
+  # Same normalization and resizing as in 'turn_to_tensor', just done on the already decoded pixels
+  img = tf.image.convert_image_dtype(rgb_array.astype("uint8"), tf.float32)
+  img = tf.image.resize(img, size=(img_size, img_size))
+
+  return img
+
 def create_tensor_img_tuple(img_path, label):
   """
   This function takes an image path and its corresponding label. 
@@ -40,7 +73,7 @@ def create_tensor_img_tuple(img_path, label):
   
   return image, label
 
-def minibatch_maker(X, batch_size, y=None, valid_data=False, test_data=False):
+def minibatch_maker(X, batch_size, y=None, valid_data=False, test_data=False, cache=None):
   """
   Creates data batches out of image and label pairs (X and y pairs).
   Unless specified otherwise thebatch_size equals 32
@@ -48,6 +81,11 @@ def minibatch_maker(X, batch_size, y=None, valid_data=False, test_data=False):
   Doesn't shuffle if it's validation data.
   Accepts the Kaggle test data.
 
+  Images are decoded in parallel on all available cores and the next batches are prepared while the model works on 
+  the current one. Optionally 'cache' can be set to:
+   - "memory" - decoded images are kept in memory after the first epoch
+   - a file path - decoded images are written to that file after the first epoch and read from it afterwards
+
   Returns a data batch
   """
 
@@ -55,21 +93,40 @@ def minibatch_maker(X, batch_size, y=None, valid_data=False, test_data=False):
     # I commented out the line below because it was really annoying when I started tossing single images at the model to test it IRL
     #print("Splitting test data into batches")
     data = tf.data.Dataset.from_tensor_slices((tf.constant(X)))
-    data_batch = data.map(turn_to_tensor).batch(batch_size)
-    return data_batch
+    data = data.map(turn_to_tensor, num_parallel_calls=tf.data.AUTOTUNE)
+    data = cache_dataset(data, cache)
   elif valid_data:
     print("Splitting validation data into batches")
     data = tf.data.Dataset.from_tensor_slices((tf.constant(X), tf.constant(y)))
-    data_batch = data.map(create_tensor_img_tuple).batch(batch_size)
-    return data_batch
+    data = data.map(create_tensor_img_tuple, num_parallel_calls=tf.data.AUTOTUNE)
+    data = cache_dataset(data, cache)
   else:
     # This one we want to shuffle
     np.random.seed(7821)
     print("Splitting training data into batches")
     data = tf.data.Dataset.from_tensor_slices((tf.constant(X), tf.constant(y)))
     data = data.shuffle(buffer_size=len(X))
-    data_batch = data.map(create_tensor_img_tuple).batch(batch_size)
-    return data_batch
+    data = data.map(create_tensor_img_tuple, num_parallel_calls=tf.data.AUTOTUNE)
+    if cache:
+      # Cached data would come out in the order of the first epoch, so we shuffle the decoded images once more.
+      # The buffer is kept small, since a buffer of the whole decoded dataset wouldn't fit into memory
+      data = cache_dataset(data, cache).shuffle(buffer_size=min(len(X), 1000))
+
+  data_batch = data.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+  return data_batch
+
+def cache_dataset(data, cache=None):
+  """
+  This function takes a tf.data Dataset and a 'cache' setting (None, "memory" or a path to the cache file).
+
+  Returns the Dataset, cached if 'cache' was specified
+  """
+  if not cache:
+    return data
+  elif cache == "memory":
+    return data.cache()
+  else:
+    return data.cache(filename=cache)
 
 def build_network(input_shape, output_shape, model_url):
   """
@@ -148,6 +205,8 @@ def display_prediction(prediction_probabilities, labels, images, n=0):
   It plots the result of models prediction - it displays the image of the dog with predicted breed, the probability and an actual label.
   If the prediction was right, the text will appear in green. Else it will be red
   """
+  # matplotlib is only needed in the notebook, so the headless tools don't have to import it
+  import matplotlib.pyplot as plt
 
   n = 0 if n > len(prediction_probabilities) else n
   probabilities, true_label, image = prediction_probabilities[n], labels[n], images[n]
@@ -175,14 +234,15 @@ def plot_k_confidences(prediction_probabilities, labels, k=5, n=0):
    - 'k' - a variable specifying how many highest probabilites to plot
    - 'n' - a specific index of an image to check for prediction and an actual label
   """
+  import matplotlib.pyplot as plt
+
   n = 0 if n > len(prediction_probabilities) else n
   pred_probabilities, true_label = prediction_probabilities[n], labels[n]
 
   # pred_label = name_predicted_label(pred_probabilities)
 
-  top_k_idx = pred_probabilities.argsort()[-k:][::-1]
-  top_k_confidences = pred_probabilities[top_k_idx]
-  top_k_labels = unique_labels[top_k_idx]
+  top_k = predict_funcs.top_k_predictions(pred_probabilities, unique_labels, k)[0]
+  top_k_confidences, top_k_labels = top_k["confidences"], top_k["labels"]
 
   top_k_plot = plt.bar(np.arange(len(top_k_labels)),
                      top_k_confidences,
@@ -210,6 +270,7 @@ def plot_k_predictions(prediction_probabilities, labels, images, i_multiplier=0,
    - n_cols - int specifying how many columns of predictions to describe
    - k - int specifying how many top prediction values to plot
   """
+  import matplotlib.pyplot as plt
 
   n_images = n_rows * n_cols
 
@@ -263,7 +324,7 @@ def load_model(model_path):
   return model
 
 def submission_maker(predictions):
-    """This function takes predictions array and along with the breed names and image names puts them into a Kaggle ready DataFrame """
+    """This function takes predictions array (float16 works as well) and along with the breed names and image names puts them into a Kaggle ready DataFrame """
     # We start by creating a list of all the test images names, without the extension which starts at index -4
     global unique_labels
     index_names = [name[:-4] for name in os.listdir("./data/test/")]
@@ -272,7 +333,8 @@ def submission_maker(predictions):
     except:
         print("No 'test.txt' located, preparing index_names...")
 
-    submission = pd.DataFrame(predictions, columns=unique_labels, index=index_names)
+    # Kaggle wants every probability of every image, so this one needs the whole matrix and not just the top k
+    submission = pd.DataFrame(np.asarray(predictions, dtype="float32"), columns=unique_labels, index=index_names)
 
     submission.index.name = "id"
     return submission
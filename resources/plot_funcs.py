@@ -0,0 +1,250 @@
+import numpy as np
+import datetime
+import os
+import pickle
+import queue
+import subprocess
+import sys
+import tempfile
+import threading
+
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+
+# How the saved predictions are written, 'config.ini' can override each of these
+DEFAULT_EXPORT_SETTINGS = {"export_dpi": 200, "export_format": "jpg", "export_quality": 90}
+EXPORT_FORMATS = {"jpg": "jpeg", "jpeg": "jpeg", "png": "png", "webp": "webp"}
+
+
+def show_user_images(predicted_files, figure, axes, width_multiplier=1, height_multiplier=1, idx=0):
+    """
+    This function takes the predicted_files (as return by 'predict_user_images()') a matplotlib figure and axes.
+    Optionally you can give it both width and height multipliers and an idx, but really this is more of a mandatory argument
+    if you want to see more than just the first prediction.
+
+    The first time the figure is used all the plots get created. Every next call only updates them in place (the image,
+    the titles, the bars and their labels), which is a lot quicker than building the whole figure from scratch.
+    """
+    prediction_dict = predicted_files[idx]
+    ax1, ax2 = axes[0], axes[1]
+    # For a nicer look we replace the '_' in the breed label with a space
+    breed_label = prediction_dict['prediction'].replace("_", " ")
+    # Here we create a list, which contains the top 5 predictions with the '_' replaced by a line brake.
+    # This way the xticks will look better on the final plot
+    labels = [label.replace("_", "\n") for label in prediction_dict["top_5_labels"]]
+    positions = np.arange(len(prediction_dict["top_5_labels"]))
+
+    # Here we go plotting results of the prediction.
+    # On the left of the figure we will be plotting a resized image with a title of 'I am X% sure it's a PREDICTION'
+    # On the right we will plot a bar graph containing top five predictions
+    if not ax1.images:
+        # Let's start by resizing the figure, so that it looks good on different resolutions.
+        figure.set_figwidth(5 * width_multiplier)
+        figure.set_figheight(2.5 * height_multiplier)
+        ax1.imshow(prediction_dict["image"])
+        ax1.set_yticks([])
+        ax1.set_xticks([])
+        ax2.bar(
+            x=positions,
+            height= prediction_dict["top_5_confidences"],
+            color= "tab:gray",
+        )
+        ax2.set_title("Top 5 probable breeds", fontdict={"fontsize": 6})
+        ax2.tick_params(axis="y", labelsize= 6)
+        bars = ax2.containers[0]
+        ax2.bar_label(bars, labels = [f'{x.get_height():.3%}' for x in bars], fontsize= 5)
+        figure.tight_layout()
+    else:
+        ax1.images[0].set_data(prediction_dict["image"])
+        bars = ax2.containers[0]
+        for bar, bar_text, confidence in zip(bars, ax2.texts, prediction_dict["top_5_confidences"]):
+            bar.set_height(confidence)
+            bar_text.xy = (bar.get_x() + bar.get_width() / 2, confidence)
+            bar_text.set_text(f'{confidence:.3%}')
+        ax2.relim()
+        ax2.autoscale_view()
+
+    ax1.set_title(f"I am {prediction_dict['accuracy']}% sure it's a {breed_label}", fontdict={"fontsize": 6})
+    ax2.set_xticks(
+        positions,
+        labels= labels,
+        fontsize= 4
+    )
+
+    return figure, prediction_dict["prediction"], prediction_dict["accuracy"]
+
+def new_figure():
+    """
+    Returns a new matplotlib figure (not known to pyplot) and its two axes, ready for 'show_user_images'
+    """
+    figure = Figure(figsize=(4, 2.5))
+    axes = figure.subplots(1, 2)
+    FigureCanvasAgg(figure)
+    return figure, axes
+
+def export_settings(config_dict):
+    """
+    This function takes the dictionary read from 'config.ini'.
+    Values that are missing or can't be understood are replaced with the defaults.
+
+    Returns a dictionary with the export dpi (int), format (i.e. 'jpg', 'png' or 'webp') and quality (int, 1-95)
+    """
+    settings = dict(DEFAULT_EXPORT_SETTINGS)
+    image_format = str(config_dict.get("export_format", "")).lower().lstrip(".")
+    if image_format in EXPORT_FORMATS:
+        settings["export_format"] = image_format
+    for key, low, high in (("export_dpi", 50, 900), ("export_quality", 1, 95)):
+        try:
+            settings[key] = min(max(int(config_dict[key]), low), high)
+        except (KeyError, ValueError):
+            pass
+
+    return settings
+
+def prediction_filename(breed_label, accuracy, settings, suffix=""):
+    """
+    This function takes a breed label, accuracy, the export settings and optionally a suffix for the file name.
+
+    Returns the file name under which the prediction gets saved
+    """
+    prediction_date = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    return f"{breed_label}_{accuracy}%_{prediction_date}{suffix}.{settings['export_format']}"
+
+def save_figure(figure, file_path, settings):
+    """
+    This function takes a matplotlib figure, a path (or a file object) and the export settings and writes the figure into it.
+    The quality only matters for JPEG and WebP files, PNG files are always lossless.
+    """
+    image_format = EXPORT_FORMATS[settings["export_format"]]
+    pil_kwargs = {"quality": settings["export_quality"]} if image_format in ("jpeg", "webp") else None
+    figure.savefig(file_path, format=image_format, bbox_inches="tight", dpi=settings["export_dpi"], pil_kwargs=pil_kwargs)
+
+class ImageWriter:
+    def __init__(self, settings=DEFAULT_EXPORT_SETTINGS, output_dir="./user/output"):
+        """
+        This creates a writer that saves predictions into 'output_dir'. Rendering a figure at the export dpi takes a lot
+        longer than showing it, so it's done by a separate Python process (see 'writer_worker'), started with the first
+        prediction saved and kept until the app closes. 'save' only hands the prediction over to a background thread,
+        which sends it to that process, so the tk main loop never waits for a file to be written.
+        """
+        self.settings = settings
+        self.output_dir = output_dir
+        self.jobs = queue.Queue()
+        self.thread = None
+        self.process = None
+
+    def save(self, pred_dict, width_multiplier=1, height_multiplier=1):
+        """
+        This method takes a prediction dictionary and the figure multipliers. It returns right away, the prediction gets
+        rendered and written later on.
+
+        Returns a 'label_string' with the name of the file, to be displayed in the navigation frame
+        """
+        filename = prediction_filename(pred_dict["prediction"], pred_dict["accuracy"], self.settings)
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.worker, daemon=True)
+            self.thread.start()
+        self.jobs.put({"pred_dict": pred_dict, "file_path": os.path.join(self.output_dir, filename),
+                       "settings": self.settings, "multipliers": (width_multiplier, height_multiplier)})
+
+        return f"Prediction saved to output folder under name: {filename}'"
+
+    def worker(self):
+        while True:
+            job = self.jobs.get()
+            try:
+                # The process is started again if it died, i.e. killed by the system
+                if self.process is None or self.process.poll() is not None:
+                    self.process = subprocess.Popen([sys.executable, "-m", "resources.plot_funcs", "--writer"],
+                                                    stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+                pickle.dump(job, self.process.stdin)
+                self.process.stdin.flush()
+                # The process answers once the file is written, which is what 'wait' waits for
+                status = self.process.stdout.readline().decode().strip() or "the writer process stopped"
+            except (OSError, pickle.PicklingError) as error:
+                status = str(error)
+            if status != "saved":
+                print(f"Could not save {job['file_path']}: {status}")
+            self.jobs.task_done()
+
+    def wait(self):
+        """
+        This method blocks until every prediction handed to the writer so far has been written.
+        """
+        self.jobs.join()
+
+def export_predictions(predicted_list, settings, width_multiplier=1, height_multiplier=1, output_dir="./user/output", processes=None):
+    """
+    This function takes a list of predictions, the export settings, the figure multipliers and optionally the output
+    directory and number of processes (all CPU cores by default).
+    It splits the predictions between separate Python processes, which render and write them in parallel.
+    This blocks until everything is written, so the app runs it in a background thread.
+
+    Returns a list of paths of the saved files
+    """
+    if not predicted_list:
+        return []
+    processes = max(1, min(processes or os.cpu_count() or 1, len(predicted_list)))
+    # Every file gets the number of its prediction, so that predictions with the same breed and accuracy don't collide
+    file_paths = [os.path.join(output_dir, prediction_filename(pred_dict["prediction"], pred_dict["accuracy"], settings, f"_{idx+1}"))
+                  for idx, pred_dict in enumerate(predicted_list)]
+    jobs = list(zip(predicted_list, file_paths))
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        workers = []
+        for worker_idx in range(processes):
+            job_path = os.path.join(temp_dir, f"export_{worker_idx}.pkl")
+            with open(job_path, "wb") as file:
+                pickle.dump({"jobs": jobs[worker_idx::processes], "settings": settings,
+                             "multipliers": (width_multiplier, height_multiplier)}, file)
+            # Plain subprocesses (and not multiprocessing), since spawning would run 'IdentiBreed.py' again in each of them
+            workers.append(subprocess.Popen([sys.executable, "-m", "resources.plot_funcs", job_path]))
+        failed = sum(worker.wait() != 0 for worker in workers)
+    if failed:
+        print(f"{failed} of {processes} export processes failed, some predictions weren't saved.")
+
+    return [file_path for file_path in file_paths if os.path.exists(file_path)]
+
+def export_worker(job_path):
+    """
+    This function takes a path to a job file written by 'export_predictions' and saves all the predictions in it.
+    """
+    with open(job_path, "rb") as file:
+        job = pickle.load(file)
+    figure, axes = new_figure()
+    width_multiplier, height_multiplier = job["multipliers"]
+    for pred_dict, file_path in job["jobs"]:
+        show_user_images([pred_dict], figure, axes, width_multiplier, height_multiplier)
+        save_figure(figure, file_path, job["settings"])
+
+def writer_worker():
+    """
+    This function runs in the process started by 'ImageWriter'. It reads the pickled predictions from stdin and saves
+    them one at a time, answering with a line for each, until the app closes its end of the pipe.
+    """
+    figures = {}
+    while True:
+        try:
+            job = pickle.load(sys.stdin.buffer)
+        except EOFError:
+            break
+        # Different multipliers change the size of the figure, so there is one figure per size
+        if job["multipliers"] not in figures:
+            figures[job["multipliers"]] = new_figure()
+        figure, axes = figures[job["multipliers"]]
+        try:
+            show_user_images([job["pred_dict"]], figure, axes, *job["multipliers"])
+            save_figure(figure, job["file_path"], job["settings"])
+            status = "saved"
+        except (OSError, ValueError) as error:
+            status = str(error).replace("\n", " ")
+        sys.stdout.write(status + "\n")
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    if sys.argv[1] == "--writer":
+        writer_worker()
+    else:
+        export_worker(sys.argv[1])
@@ -0,0 +1,318 @@
+import numpy as np
+import os
+import queue
+import threading
+
+from collections import Counter, OrderedDict
+from resources import image_funcs
+
+
+class ImageArrays:
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        """
+        This creates a list-like store of full resolution image arrays. Instead of keeping every array in memory it only
+        keeps where each image came from (a path or the raw bytes of the file) and decodes the array when it's asked for.
+        The most recently used arrays are kept in memory, as long as all of them together take at most 'max_bytes'.
+        """
+        self.sources = []
+        self.max_bytes = max_bytes
+        self.cached = OrderedDict()
+        self.cached_bytes = 0
+
+    def append(self, source):
+        self.sources.append(source)
+
+    def __len__(self):
+        return len(self.sources)
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        # This also handles negative indexes and raises an IndexError just like a list would
+        idx = range(len(self.sources))[idx]
+
+        if idx in self.cached:
+            self.cached.move_to_end(idx)
+            return self.cached[idx]
+
+        image_array = image_funcs.decode_full(self.sources[idx])
+
+        self.cached[idx] = image_array
+        self.cached_bytes += image_array.nbytes
+        while self.cached_bytes > self.max_bytes and len(self.cached) > 1:
+            self.cached_bytes -= self.cached.popitem(last=False)[1].nbytes
+
+        return image_array
+
+
+
+def predict_user_images(file_paths, unique_labels, model, batch_size=32, progress_callback=None, cancel_event=None, cache=None):
+    """
+    This function takes a path to the user input directory (or a manifest file, see 'list_directory') and the unique_labels list.
+    It makes model create predictions of dog breeds present in user's images.
+    The function creates a list of dictionaries for each image. 
+    These dictionaries contain the image tensor, predicted breed, model's confidence, four other probable breeds and their confidences.
+
+    Optionally it takes:
+        - batch_size: how many files are decoded and fed into the model at once
+        - progress_callback: a function called after every batch with the number of processed files, the number of all
+          files and a list of (image path, image dictionary, image source) tuples predicted in that batch. The image source
+          is what the image array can be decoded from again, it goes into an 'ImageArrays' store
+        - cancel_event: a threading.Event, if it gets set the function stops before the next batch
+        - cache: a 'cache_funcs.PredictionCache', images it already knows skip the model entirely
+
+    Returns list of image paths, list of image dictionaries and a folder_state string. 
+    """
+    return predict_image_paths(list_directory(file_paths), unique_labels, model, batch_size, progress_callback, cancel_event, cache=cache)
+
+def list_directory(file_paths):
+    """
+    This function takes a path to the user input directory, or to a manifest file listing the images one per line.
+    The directory is searched recursively (see 'image_funcs.scan_images'), so only files that look like images
+    ever get opened.
+
+    Returns list of paths to the image files
+    """
+    if os.path.isfile(file_paths):
+        return image_funcs.read_manifest(file_paths)
+    return list(image_funcs.scan_images(file_paths))
+
+def image_sources(images):
+    """
+    This function takes a path to an image, the raw bytes of an image file, or a list of those (and of (name, bytes) tuples).
+
+    Returns a list of image sources that 'iter_prediction_batches' accepts - paths, and (name, bytes) tuples for images
+    given as bytes, which get names like 'image_1'
+    """
+    if isinstance(images, (str, bytes, os.PathLike)):
+        images = [images]
+    sources = []
+    for idx, image in enumerate(images):
+        if isinstance(image, bytes):
+            sources.append((f"image_{idx+1}", image))
+        elif isinstance(image, tuple):
+            sources.append(image)
+        else:
+            sources.append(os.fspath(image))
+
+    return sources
+
+def top_k_predictions(probabilities, unique_labels, k=5, dtype="float32"):
+    """
+    This function takes an (N, number of breeds) matrix of probabilities made by the model (a single row works too),
+    the unique_labels list, how many of the most probable breeds to keep and the dtype of the returned confidences.
+    The probabilities can be stored as float16 to halve their memory, the entropy is always computed in float32.
+
+    Instead of sorting all the probabilities of every image, 'argpartition' picks the top k of the whole matrix at once
+    and only those k get sorted.
+
+    Returns a NumPy structured array with one record per image, with the fields:
+     - 'indices' - indices of the k most probable breeds, most probable first
+     - 'labels' - their names
+     - 'confidences' - their probabilities
+     - 'entropy' - entropy of all the probabilities, the higher it is the less sure the model was
+    """
+    probabilities = np.atleast_2d(np.asarray(probabilities))
+    k = min(k, probabilities.shape[1])
+    unique_labels = np.asarray(unique_labels)
+
+    top_k_idx = np.argpartition(probabilities, -k, axis=1)[:, -k:]
+    top_k_confidences = np.take_along_axis(probabilities, top_k_idx, axis=1)
+    order = np.argsort(-top_k_confidences, axis=1, kind="stable")
+    top_k_idx = np.take_along_axis(top_k_idx, order, axis=1)
+
+    probabilities_32 = probabilities.astype("float32", copy=False)
+    entropy = -np.sum(probabilities_32 * np.log(np.clip(probabilities_32, 1e-12, None)), axis=1)
+
+    results = np.empty(len(probabilities), dtype=[
+        ("indices", "int32", (k,)),
+        ("labels", unique_labels.dtype, (k,)),
+        ("confidences", dtype, (k,)),
+        ("entropy", dtype),
+    ])
+    results["indices"] = top_k_idx
+    results["labels"] = unique_labels[top_k_idx]
+    results["confidences"] = np.take_along_axis(top_k_confidences, order, axis=1)
+    results["entropy"] = entropy
+
+    return results
+
+def prediction_dicts(probabilities, unique_labels):
+    """
+    This function takes an (N, number of breeds) matrix of probabilities made by the model and the unique_labels list.
+
+    Returns a list of N dictionaries with the predicted breed, model's confidence, top 5 probable breeds and their confidences
+    """
+    top_5 = top_k_predictions(probabilities, unique_labels, k=5)
+
+    return [{
+        "prediction": record["labels"][0], # The dog breed predicted by the model
+        "accuracy": ("%.3f" %(record["confidences"][0] * 100)), # Probability in percentage
+        "top_5_labels": record["labels"], # Top 5 predicted labels
+        "top_5_confidences": record["confidences"] # Top 5 confidences
+    } for record in top_5]
+
+def iter_prediction_batches(img_paths, unique_labels, model, batch_size=32, cancel_event=None, keep_images=True, cache=None, decode_ahead=2):
+    """
+    This function takes a list of image paths and the same arguments as 'predict_image_paths'. Instead of a path, any
+    image can also be given as a (name, bytes) tuple, i.e. an image downloaded from a URL, which is decoded straight
+    from memory. It is a generator, which yields a (number of processed files, number of all files, batch results)
+    tuple as soon as each batch is predicted.
+    Batch results are a list of (image path, image dictionary, image source) tuples, where the image path is the name
+    for images given as bytes and the image source is the path or the bytes. Files that can't be opened as images are 
+    skipped. The summary printed at the end tells how many files were skipped and why.
+
+    The images are decoded in a background thread, at most 'decode_ahead' batches ahead of the model, so decoding and
+    predicting overlap while only a few batches are ever held in memory. The caller can stop at any time, either by
+    setting the 'cancel_event' or simply by not asking for more.
+    """
+
+    # Imported here and not at the top, so that TensorFlow doesn't have to load before the app window shows up
+    from resources import model_funcs
+
+    decoded_batches = queue.Queue(maxsize=decode_ahead)
+    stop_decoding = threading.Event()
+    # Why files were skipped (i.e. 'not an image', 'corrupt png') and how many of them
+    skipped = Counter()
+
+    def hand_over(item):
+        # The queue is bounded, so this waits while the model is behind, unless the generator was closed meanwhile
+        while not stop_decoding.is_set():
+            try:
+                decoded_batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def decoder():
+        try:
+            decode_batches()
+        except Exception as error:
+            # Anything unexpected is handed over to the generator, which raises it
+            hand_over(error)
+
+    def decode_batches():
+        for batch_start in range(0, len(img_paths), batch_size):
+            # We decode each file of the batch that can actually be opened as an image.
+            # The decoded model input is also what gets displayed later, the full resolution image isn't kept.
+            # With a cache the file is read once, hashed, and then decoded from the very same bytes
+            batch_paths, batch_sources, batch_tensors, batch_predictions, batch_keys = [], [], [], [], []
+            for item in img_paths[batch_start:batch_start+batch_size]:
+                img_path, image_source = item if isinstance(item, tuple) else (item, item)
+                try:
+                    source, cache_key, cached_prediction = image_source, None, None
+                    if cache is not None:
+                        if not isinstance(source, bytes):
+                            with open(img_path, "rb") as file:
+                                source = file.read()
+                        cache_key = cache.key(source)
+                        cached_prediction = cache.get(cache_key)
+                    if cached_prediction is not None and not keep_images:
+                        image_tensor = None
+                    else:
+                        image_tensor = model_funcs.load_image(source)
+                except image_funcs.SkippedImage as reason:
+                    skipped[str(reason)] += 1
+                    continue
+                except OSError as error:
+                    skipped[f"unreadable ({error.strerror or error})"] += 1
+                    continue
+                except Exception as error:
+                    skipped[f"failed to decode ({type(error).__name__})"] += 1
+                    continue
+                batch_paths.append(img_path)
+                batch_sources.append(image_source)
+                batch_tensors.append(image_tensor)
+                batch_predictions.append(cached_prediction)
+                batch_keys.append(cache_key)
+
+            done = min(batch_start+batch_size, len(img_paths))
+            if not hand_over((done, batch_paths, batch_sources, batch_tensors, batch_predictions, batch_keys)):
+                return
+        hand_over(None)
+
+    threading.Thread(target=decoder, daemon=True).start()
+
+    cache_hits, cache_misses, n_predicted = 0, 0, 0
+    try:
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                print("Predicting cancelled")
+                break
+            decoded_batch = decoded_batches.get()
+            if decoded_batch is None:
+                break
+            if isinstance(decoded_batch, Exception):
+                raise decoded_batch
+            done, batch_paths, batch_sources, batch_tensors, batch_predictions, batch_keys = decoded_batch
+
+            # Whole batch of images the cache doesn't know goes into the model at once, so it doesn't have to deal with one image at a time
+            missing = [idx for idx, prediction in enumerate(batch_predictions) if prediction is None]
+            if missing:
+                predictions = model.predict(np.stack([batch_tensors[idx] for idx in missing]), verbose=0)
+                for idx, prediction in zip(missing, predictions):
+                    batch_predictions[idx] = prediction
+                    if cache is not None:
+                        cache.put(batch_keys[idx], prediction)
+            if cache is not None:
+                cache_hits += len(batch_paths) - len(missing)
+                cache_misses += len(missing)
+
+            # The results of the whole batch are made at once, out of a single matrix of probabilities
+            pred_dicts = prediction_dicts(np.stack(batch_predictions), unique_labels) if batch_predictions else []
+            batch_results = []
+            for img_path, image_source, image_tensor, pred_dict in zip(batch_paths, batch_sources, batch_tensors, pred_dicts):
+                if keep_images:
+                    # A uint8 copy takes a quarter of the float32 Tensor's memory and displays just the same
+                    pred_dict["image"] = np.clip(np.rint(np.asarray(image_tensor) * 255), 0, 255).astype("uint8")
+                batch_results.append((img_path, pred_dict, image_source))
+            n_predicted += len(batch_results)
+
+            yield done, len(img_paths), batch_results
+    finally:
+        stop_decoding.set()
+
+    summary = f"Predicting completed - {n_predicted} images"
+    if skipped:
+        summary += f", {sum(skipped.values())} skipped (" + ", ".join(f"{count} {reason}" for reason, count in skipped.most_common()) + ")"
+    if cache is not None:
+        summary += f", {cache_hits} cache hits, {cache_misses} cache misses"
+    print(summary)
+
+def predict_image_paths(img_paths, unique_labels, model, batch_size=32, progress_callback=None, cancel_event=None, keep_images=True, cache=None):
+    """
+    This function works just like 'predict_user_images', but instead of a directory it takes a list of image paths.
+    Files that can't be opened as images are skipped.
+
+    The image dictionaries contain a small uint8 copy of the image (the 224x224 model input) for displaying and the
+    image arrays are an 'ImageArrays' store, which decodes the full resolution images again only when they're needed.
+    If 'keep_images' is False the image dictionaries don't contain the "image" at all and no image arrays are kept, 
+    which is what the headless tools want, since they never display the images.
+    With a 'cache' (a 'cache_funcs.PredictionCache') the images it already knows skip the model entirely.
+    It collects everything 'iter_prediction_batches' yields, which is the better choice if you don't need all results at once.
+
+    Returns list of image paths, list of image dictionaries and a folder_state string. 
+    """
+
+    # Instantiating empty lists for image paths and image dictionaries
+    dir_list, predicted_files, image_arrays = [], [], ImageArrays()
+    print("Predicting dog breeds from images in './images' folder.")
+    print("This could take a moment...")
+
+    for done, total, batch_results in iter_prediction_batches(img_paths, unique_labels, model, batch_size, cancel_event, keep_images, cache):
+        for img_path, pred_dict, image_source in batch_results:
+            # We append the dictionary to the list and an image file path into another list
+            predicted_files.append(pred_dict)
+            dir_list.append(img_path)
+            if keep_images:
+                image_arrays.append(image_source)
+        if progress_callback is not None:
+            progress_callback(done, total, batch_results)
+
+    folder_state = "filled" if dir_list else "empty"
+    return dir_list, predicted_files, image_arrays, folder_state
@@ -0,0 +1,137 @@
+import numpy as np
+import os
+import re
+
+from resources import log_funcs
+
+
+def parse_submission(file_name):
+    """
+    This function takes a file name of an image saved by 'app_funcs.image_saver(data_expansion=True)', so either
+    '{breed}_{date}.jpg' or '{prefix}_{breed}_{date}.jpg' (the prefix is 'US' for breeds the user submitted themselves).
+
+    Returns the breed and whether it was user submitted, or None if the name isn't one of those
+    """
+    match = re.fullmatch(r"(US_)?(.+)_(\d{8}-\d{6})\.jpg", file_name)
+    if match is None:
+        return None
+    # User submitted breeds are saved the way they were typed in, the rest are already in the style of 'labels.csv'
+    return match.group(2).strip().lower().replace(" ", "_"), match.group(1) is not None
+
+def submission_id(file_name):
+    """
+    This function takes a file name of a user submission.
+
+    Returns the id under which the retrained models remember it was trained on
+    """
+    return f"submissions/{file_name}"
+
+def submission_samples(submissions_dir, known_breeds, accepted_breeds=(), consumed=()):
+    """
+    This function takes the directory of the user submissions, a list of breeds the model already knows, a list of
+    new breeds accepted into the model and the ids of the samples the model was already trained on (see
+    'submission_id'), which are skipped. Images of breeds that are neither known nor accepted are left out (a user
+    submitted breed has to be looked at before it's let into the model).
+
+    Returns a list of image paths, a list of their breeds and a dictionary of the left out breeds and their image counts
+    """
+    img_paths, breeds, left_out = [], [], {}
+    if not os.path.isdir(submissions_dir):
+        return img_paths, breeds, left_out
+    allowed = set(known_breeds) | set(accepted_breeds)
+    consumed = set(consumed)
+    for file in sorted(os.listdir(submissions_dir)):
+        parsed = parse_submission(file)
+        if parsed is None or submission_id(file) in consumed:
+            continue
+        breed, _ = parsed
+        if breed in allowed:
+            img_paths.append(os.path.join(submissions_dir, file))
+            breeds.append(breed)
+        else:
+            left_out[breed] = left_out.get(breed, 0) + 1
+
+    return img_paths, breeds, left_out
+
+def evaluation_samples(log_dir, known_breeds, accepted_breeds=(), consumed=()):
+    """
+    This function takes the directory of the evaluation logs, a list of breeds the model knows, a list of new breeds
+    accepted into the model and the image ids the model was already trained on, which are skipped. Two kinds of answers
+    say what breed the dog really is:
+     - predictions the user confirmed as correct - the breed is the predicted one
+     - predictions the user corrected - the breed is the one they picked or typed in, which the app logs as 'US_{breed}'
+       (these never go to the user submissions, so the logs are the only place they are kept)
+    Corrections to breeds that are neither known nor accepted are left out, just like in 'submission_samples'.
+    'Don't know' answers say nothing and are skipped.
+
+    Returns lists of image ids ('{log_name}/{file_name}'), content hashes, breeds and the image arrays and a dictionary
+    of the left out breeds and their image counts
+    """
+    image_ids, image_hashes, breeds, image_arrays, left_out = [], [], [], [], {}
+    if not os.path.isdir(log_dir):
+        return image_ids, image_hashes, breeds, image_arrays, left_out
+    allowed = set(known_breeds) | set(accepted_breeds)
+    consumed = set(consumed)
+    for file in sorted(os.listdir(log_dir)):
+        log_name = file[:-len(".jsonl")]
+        if not file.endswith(".jsonl") or not os.path.exists(os.path.join(log_dir, f"{log_name}.npz")):
+            continue
+        try:
+            records = log_funcs.read_log(log_dir, log_name)
+        except (OSError, ValueError, KeyError):
+            print(f"Could not read the evaluation log {log_name}, skipping it.")
+            continue
+        for record in records:
+            if record["correct_prediction"] not in (0, 1) or f"{log_name}/{record['file_name']}" in consumed:
+                continue
+            breed = str(record["breed"])
+            if record["correct_prediction"] == 0:
+                breed = breed[len("US_"):] if breed.startswith("US_") else breed
+                breed = breed.strip().lower().replace(" ", "_")
+            if breed not in allowed:
+                left_out[breed] = left_out.get(breed, 0) + 1
+                continue
+            image_ids.append(f"{log_name}/{record['file_name']}")
+            image_hashes.append(record["image_hash"])
+            breeds.append(breed)
+            image_arrays.append(record["image_array"])
+
+    return image_ids, image_hashes, breeds, image_arrays, left_out
+
+def replay_indices(breeds, n_images, exclude=(), seed=7821):
+    """
+    This function takes the breeds of the original training images, how many of them to replay and indices to leave
+    out (i.e. the validation split). The images are picked evenly from every breed, so the retrained head keeps
+    seeing all of them and doesn't forget the breeds the new samples don't have.
+
+    Returns a sorted array of indices of the picked images
+    """
+    rng = np.random.default_rng(seed)
+    breeds = np.asarray(breeds)
+    candidates = np.setdiff1d(np.arange(len(breeds)), np.asarray(exclude, dtype="int64"))
+    if n_images >= len(candidates):
+        return candidates
+    unique_breeds = np.unique(breeds[candidates])
+    per_breed = max(1, n_images // len(unique_breeds))
+    picked = []
+    for breed in unique_breeds:
+        breed_idxs = candidates[breeds[candidates] == breed]
+        picked.append(rng.choice(breed_idxs, size=min(per_breed, len(breed_idxs)), replace=False))
+
+    return np.sort(np.concatenate(picked))
+
+def versioned_path(model_path):
+    """
+    This function takes a path to the model retraining starts from.
+
+    Returns a path for the retrained model next to it - '{name}-r1.h5' for the original model, then '-r2', '-r3' and
+    so on, skipping versions that already exist
+    """
+    stem, extension = os.path.splitext(model_path)
+    match = re.fullmatch(r"(.*)-r(\d+)", stem)
+    base, version = (match.group(1), int(match.group(2))) if match else (stem, 0)
+    version += 1
+    while os.path.exists(f"{base}-r{version}{extension}"):
+        version += 1
+
+    return f"{base}-r{version}{extension}"
@@ -0,0 +1,79 @@
+import numpy as np
+import os
+import tempfile
+import time
+import unittest
+
+from types import SimpleNamespace
+
+from resources import cache_funcs
+
+
+class PredictionCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.temp_dir.name, "cache")
+        self.model_path = self.model_file("model.h5", b"weights")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def model_file(self, name, content):
+        model_path = os.path.join(self.temp_dir.name, name)
+        with open(model_path, "wb") as file:
+            file.write(content)
+        return model_path
+
+    def test_put_and_get(self):
+        cache = cache_funcs.PredictionCache(self.cache_dir, self.model_path)
+        key = cache.key(b"image bytes")
+        self.assertIsNone(cache.get(key))
+        cache.put(key, [0.25, 0.75])
+        np.testing.assert_array_equal(cache.get(key), np.array([0.25, 0.75], dtype="float32"))
+        # Same content, same key, whatever the file is called
+        self.assertEqual(cache.key(b"image bytes"), key)
+
+    def test_models_dont_share_entries(self):
+        cache = cache_funcs.PredictionCache(self.cache_dir, self.model_path)
+        other = cache_funcs.PredictionCache(self.cache_dir, self.model_file("other.h5", b"other weights"))
+        cache.put("abc", [1.0])
+        self.assertIsNone(other.get("abc"))
+        self.assertNotEqual(cache.cache_dir, other.cache_dir)
+
+    def test_size_is_measured_by_the_first_put(self):
+        cache_funcs.PredictionCache(self.cache_dir, self.model_path).put("old", [1.0])
+        cache = cache_funcs.PredictionCache(self.cache_dir, self.model_path)
+        self.assertIsNone(cache.total_bytes)
+        cache.put("new", [1.0])
+        self.assertEqual(cache.total_bytes, sum(size for _, size, _ in cache.entries()))
+        self.assertEqual(len(cache.entries()), 2)
+
+    def test_least_recently_used_are_evicted_across_models(self):
+        cache = cache_funcs.PredictionCache(self.cache_dir, self.model_path)
+        other = cache_funcs.PredictionCache(self.cache_dir, self.model_file("other.h5", b"other weights"))
+        other.put("other", [1.0])
+        for key in ("first", "second", "third"):
+            cache.put(key, [1.0])
+        now = time.time_ns()
+        for path, seconds_ago in ((other.entry_path("other"), 40), (cache.entry_path("first"), 30),
+                                  (cache.entry_path("second"), 20), (cache.entry_path("third"), 10)):
+            os.utime(path, ns=(now - seconds_ago * 10**9, now - seconds_ago * 10**9))
+        # Reading 'first' makes it the most recently used one
+        self.assertIsNotNone(cache.get("first"))
+
+        entry_size = cache_funcs.disk_size(os.stat(cache.entry_path("first")))
+        cache.max_bytes = 3 * entry_size
+        cache.evict()
+        remaining = sorted(os.path.basename(path) for _, _, path in cache.entries())
+        self.assertEqual(remaining, ["first.npy", "third.npy"])
+        self.assertEqual(cache.total_bytes, 2 * entry_size)
+
+    def test_disk_size(self):
+        self.assertEqual(cache_funcs.disk_size(SimpleNamespace(st_blocks=8, st_size=600)), 4096)
+        # Without st_blocks (i.e. on Windows) the size is rounded up to whole 4096 byte clusters
+        self.assertEqual(cache_funcs.disk_size(SimpleNamespace(st_size=600)), 4096)
+        self.assertEqual(cache_funcs.disk_size(SimpleNamespace(st_size=4097)), 8192)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+import threading
+import unittest
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from resources import fetch_funcs
+
+
+IMAGE = b"\xff\xd8\xff" + b"x" * 1000
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    A local stand-in for the image hosts. Every path is one scenario, the number of requests per path is counted so
+    the retries can be checked.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.hits[self.path] = self.server.hits.get(self.path, 0) + 1
+            hits = self.server.hits[self.path]
+
+        if self.path == "/image.jpg":
+            self.send_body(200, IMAGE)
+        elif self.path == "/redirect":
+            self.send_response(302)
+            self.send_header("Location", "/image.jpg")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif self.path == "/redirect-loop":
+            self.send_response(302)
+            self.send_header("Location", "/redirect-loop")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif self.path == "/flaky":
+            # Fails twice with a 503 and then works, the default of 2 retries is just enough
+            self.send_body(503, b"") if hits <= 2 else self.send_body(200, IMAGE)
+        elif self.path == "/missing":
+            self.send_body(404, b"")
+        elif self.path == "/huge-declared":
+            self.send_body(200, IMAGE, content_length=str(100 * 1024 * 1024))
+        elif self.path == "/huge-streamed":
+            # No Content-Length at all, the size only shows while reading
+            self.send_body(200, IMAGE * 10, content_length=None)
+        elif self.path == "/bad-length":
+            self.send_body(200, IMAGE, content_length="12abc")
+        else:
+            self.send_body(404, b"")
+
+    def send_body(self, status, body, content_length="auto"):
+        self.send_response(status)
+        if content_length == "auto":
+            self.send_header("Content-Length", str(len(body)))
+        elif content_length is not None:
+            self.send_header("Content-Length", content_length)
+        if content_length != "auto":
+            # Without a usable length the end of the body is where the connection closes
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FetchTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+        cls.server.lock = threading.Lock()
+        cls.server.hits = {}
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        # Every test counts its own requests, whatever ran before it
+        with self.server.lock:
+            self.server.hits.clear()
+
+    def fetch(self, path, **kwargs):
+        (url, content, error), = fetch_funcs.fetch_urls([self.base_url + path], **kwargs)
+        return content, error
+
+    def test_image(self):
+        self.assertEqual(self.fetch("/image.jpg"), (IMAGE, None))
+
+    def test_redirect_is_followed(self):
+        self.assertEqual(self.fetch("/redirect"), (IMAGE, None))
+
+    def test_redirect_loop_gives_up(self):
+        self.assertEqual(self.fetch("/redirect-loop"), (None, "too many redirects"))
+
+    def test_retries_after_server_errors(self):
+        self.assertEqual(self.fetch("/flaky"), (IMAGE, None))
+        self.assertEqual(self.server.hits["/flaky"], 3)
+
+    def test_client_errors_are_not_retried(self):
+        self.assertEqual(self.fetch("/missing"), (None, "HTTP 404"))
+        self.assertEqual(self.server.hits["/missing"], 1)
+
+    def test_size_cap(self):
+        self.assertEqual(self.fetch("/huge-declared", max_bytes=5000), (None, "bigger than the 5000 bytes limit"))
+        self.assertEqual(self.fetch("/huge-streamed", max_bytes=5000), (None, "bigger than the 5000 bytes limit"))
+
+    def test_malformed_content_length(self):
+        self.assertEqual(self.fetch("/bad-length"), (IMAGE, None))
+        self.assertEqual(self.fetch("/bad-length", max_bytes=500), (None, "bigger than the 500 bytes limit"))
+
+    def test_one_bad_url_doesnt_fail_the_batch(self):
+        results = fetch_funcs.fetch_urls([self.base_url + "/missing", "ftp://example.com/dog.jpg", self.base_url + "/image.jpg"])
+        self.assertEqual([error for _, _, error in results], ["HTTP 404", "not an http(s) URL", None])
+        self.assertEqual(results[2][1], IMAGE)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import numpy as np
+import io
+import os
+import tempfile
+import unittest
+
+import PIL.Image
+
+from resources import image_funcs
+
+
+def encode(image, image_format, **kwargs):
+    content = io.BytesIO()
+    image.save(content, format=image_format, **kwargs)
+    return content.getvalue()
+
+
+class SniffFormatTest(unittest.TestCase):
+    def test_supported_formats(self):
+        image = PIL.Image.new("RGB", (8, 8), (200, 100, 50))
+        for pil_format, image_format in (("JPEG", "jpeg"), ("PNG", "png"), ("GIF", "gif"), ("BMP", "bmp"),
+                                         ("WEBP", "webp"), ("TIFF", "tiff")):
+            with self.subTest(image_format):
+                self.assertEqual(image_funcs.sniff_format(encode(image, pil_format)[:16]), image_format)
+
+    def test_heic_brands(self):
+        self.assertEqual(image_funcs.sniff_format(b"\x00\x00\x00\x18ftypheic\x00\x00\x00\x00"), "heic")
+        self.assertIsNone(image_funcs.sniff_format(b"\x00\x00\x00\x18ftypisom\x00\x00\x00\x00"))
+
+    def test_other_files(self):
+        self.assertIsNone(image_funcs.sniff_format(b"RIFF\x24\x00\x00\x00WAVEfmt "))
+        self.assertIsNone(image_funcs.sniff_format(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n"))
+        self.assertIsNone(image_funcs.sniff_format(b""))
+
+
+class DecodeTest(unittest.TestCase):
+    def test_modes_are_turned_into_rgb(self):
+        rgb = PIL.Image.new("RGB", (6, 4), (200, 100, 50))
+        for image, image_format in ((rgb.convert("CMYK"), "JPEG"), (rgb.convert("P"), "PNG"),
+                                    (rgb.convert("RGBA"), "PNG"), (rgb.convert("LA"), "PNG")):
+            with self.subTest(image.mode):
+                image_array = image_funcs.decode_full(encode(image, image_format))
+                self.assertEqual(image_array.shape, (4, 6, 3))
+                self.assertEqual(image_array.dtype, np.uint8)
+
+    def test_rgb_and_grayscale_keep_their_pixels(self):
+        rgb = PIL.Image.new("RGB", (6, 4), (200, 100, 50))
+        np.testing.assert_array_equal(image_funcs.decode_full(encode(rgb, "PNG")), np.asarray(rgb))
+        gray = rgb.convert("L")
+        np.testing.assert_array_equal(image_funcs.decode_full(encode(gray, "PNG")), np.asarray(gray))
+
+    def test_decode_rgb(self):
+        gray = PIL.Image.new("L", (10, 10), 128)
+        self.assertEqual(image_funcs.decode_rgb(encode(gray, "PNG")).shape, (10, 10, 3))
+        # JPEGs are decoded at a reduced size, but never below the size the model needs
+        photo = PIL.Image.new("RGB", (2000, 1000), (200, 100, 50))
+        height, width, _ = image_funcs.decode_rgb(encode(photo, "JPEG"), img_size=224).shape
+        self.assertLess(width, 2000)
+        self.assertGreaterEqual(min(height, width), 224)
+
+    def test_bad_files_are_skipped_with_a_reason(self):
+        with self.assertRaisesRegex(image_funcs.SkippedImage, "not an image"):
+            image_funcs.decode_full(b"just some text, not a picture")
+        with self.assertRaisesRegex(image_funcs.SkippedImage, "corrupt png"):
+            image_funcs.decode_full(encode(PIL.Image.new("RGB", (64, 64)), "PNG")[:60])
+        with self.assertRaisesRegex(image_funcs.SkippedImage, "unreadable"):
+            image_funcs.decode_rgb("/this/file/does/not/exist.jpg")
+
+
+class ScanTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.directory = self.temp_dir.name
+        for relative_path, size in (("b.jpg", 10), ("a.PNG", 10), ("notes.txt", 10), ("empty.jpg", 0), ("huge.jpg", 5000),
+                                    (".hidden.jpg", 10), ("sub/c.webp", 10), ("sub/deeper/d.jpeg", 10), (".cache/e.jpg", 10)):
+            file_path = os.path.join(self.directory, relative_path)
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, "wb") as file:
+                file.write(b"x" * size)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def relative(self, img_paths):
+        return [os.path.relpath(img_path, self.directory).replace(os.sep, "/") for img_path in img_paths]
+
+    def test_scan_images(self):
+        img_paths = image_funcs.scan_images(self.directory, max_bytes=1000)
+        self.assertEqual(self.relative(img_paths), ["a.PNG", "b.jpg", "sub/c.webp", "sub/deeper/d.jpeg"])
+
+    def test_scan_options(self):
+        self.assertEqual(self.relative(image_funcs.scan_images(self.directory, max_bytes=1000, recursive=False)), ["a.PNG", "b.jpg"])
+        self.assertEqual(self.relative(image_funcs.scan_images(self.directory, extensions=(".webp",))), ["sub/c.webp"])
+        self.assertEqual(self.relative(image_funcs.scan_images(self.directory, extensions=None, min_bytes=0, recursive=False)),
+                         ["a.PNG", "b.jpg", "empty.jpg", "huge.jpg", "notes.txt"])
+        self.assertEqual(list(image_funcs.scan_images(os.path.join(self.directory, "missing"))), [])
+
+    def test_read_manifest(self):
+        manifest_path = os.path.join(self.directory, "manifest.txt")
+        with open(manifest_path, "w") as file:
+            file.write("# images to classify\nsub/c.webp\n\nnotes.txt\nmissing.jpg\nempty.jpg\n"
+                       f"{os.path.join(self.directory, 'b.jpg')}\n")
+        self.assertEqual(self.relative(image_funcs.read_manifest(manifest_path)), ["sub/c.webp", "b.jpg"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+import numpy as np
+import os
+import tempfile
+import time
+import unittest
+
+from resources import log_funcs
+
+
+def image(value):
+    return np.full((4, 4, 3), value, dtype="uint8")
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class LogTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.log_dir = self.temp_dir.name
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_write_and_read(self):
+        log_funcs.write_log(self.log_dir, "session", [
+            {"file_name": "session_0", "image_array": image(1), "breed": "pug", "correct_prediction": 1},
+            {"file_name": "session_1", "image_array": image(1), "breed": "US_beagle", "correct_prediction": 0},
+            {"file_name": "session_2", "image_array": image(2).astype("int32"), "breed": "unknown", "correct_prediction": float("nan")}
+        ])
+        records = log_funcs.read_log(self.log_dir, "session")
+        self.assertEqual([record["breed"] for record in records], ["pug", "US_beagle", "unknown"])
+        self.assertEqual([record["correct_prediction"] for record in records], [1, 0, None])
+        # Older int32 images are stored as uint8, and the same image only once
+        self.assertEqual(records[2]["image_array"].dtype, np.uint8)
+        np.testing.assert_array_equal(records[2]["image_array"], image(2))
+        self.assertEqual(records[0]["image_hash"], records[1]["image_hash"])
+        with np.load(os.path.join(self.log_dir, "session.npz")) as pixels:
+            self.assertEqual(len(pixels.files), 2)
+
+
+class EvaluationJournalTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.log_dir = self.temp_dir.name
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def journal_lines(self, log_name="session"):
+        try:
+            with open(os.path.join(self.log_dir, f"{log_name}.journal"), "r") as file:
+                return file.read().splitlines()
+        except OSError:
+            return []
+
+    def test_answers_are_written_in_batches(self):
+        journal = log_funcs.EvaluationJournal(self.log_dir, "session", sync_every=2, sync_interval=60)
+        journal.append("session_0", image(0), "pug", 1)
+        journal.append("session_1", image(1), "pug", 1)
+        self.assertTrue(wait_for(lambda: len(self.journal_lines()) == 2))
+        # A batch that isn't full waits for the interval (or for 'close')
+        journal.append("session_2", image(2), "pug", 1)
+        time.sleep(0.2)
+        self.assertEqual(len(self.journal_lines()), 2)
+        journal.close()
+        self.assertEqual(len(self.journal_lines()), 3)
+
+    def test_batches_are_written_after_the_interval(self):
+        journal = log_funcs.EvaluationJournal(self.log_dir, "session", sync_every=8, sync_interval=0.05)
+        journal.append("session_0", image(0), "pug", 1)
+        self.assertTrue(wait_for(lambda: len(self.journal_lines()) == 1))
+        journal.close()
+
+    def test_replay_keeps_the_last_answer(self):
+        journal = log_funcs.EvaluationJournal(self.log_dir, "session")
+        journal.append("session_0", image(0), "pug", 1)
+        journal.append("session_1", image(1), "pug", 1)
+        journal.append("session_0", image(0), "US_beagle", 0)
+        journal.close()
+        # A line cut off by a crash is skipped
+        with open(os.path.join(self.log_dir, "session.journal"), "a") as file:
+            file.write('{"file_name": "session_2", "image_ha')
+
+        log_funcs.replay_journal(self.log_dir, "session")
+        records = log_funcs.read_log(self.log_dir, "session")
+        self.assertEqual([(record["file_name"], record["breed"]) for record in records],
+                         [("session_1", "pug"), ("session_0", "US_beagle")])
+
+    def test_recover_journals(self):
+        for log_name in ("crashed", "uploaded"):
+            journal = log_funcs.EvaluationJournal(self.log_dir, log_name)
+            journal.append(f"{log_name}_0", image(len(log_name)), "pug", 1)
+            journal.close()
+        log_funcs.replay_journal(self.log_dir, "uploaded")
+        log_funcs.remove_journal(self.log_dir, "uploaded")
+
+        self.assertEqual(log_funcs.recover_journals(self.log_dir), ["crashed"])
+        self.assertEqual([record["file_name"] for record in log_funcs.read_log(self.log_dir, "crashed")], ["crashed_0"])
+        # Nothing refers to the blobs anymore, so they're gone together with the journals
+        self.assertFalse(any(file.endswith(".journal") for file in os.listdir(self.log_dir)))
+        self.assertEqual(os.listdir(os.path.join(self.log_dir, "blobs")), [])
+        self.assertEqual(log_funcs.recover_journals(self.log_dir), [])
+
+    def test_unwritten_answers_are_kept(self):
+        # A directory in place of the journal file makes every write fail
+        os.makedirs(os.path.join(self.log_dir, "session.journal"))
+        journal = log_funcs.EvaluationJournal(self.log_dir, "session", sync_every=1)
+        journal.append("session_0", image(0), "pug", 1)
+        self.assertTrue(wait_for(lambda: journal.error is not None))
+        with self.assertRaises(OSError):
+            journal.close()
+        self.assertEqual([record["file_name"] for record in journal.unwritten], ["session_0"])
+
+        # Once the disk is fine again, closing writes them after all
+        os.rmdir(os.path.join(self.log_dir, "session.journal"))
+        journal.close()
+        self.assertIsNone(journal.error)
+        self.assertEqual(len(self.journal_lines()), 1)
+
+    def test_append_after_close_raises(self):
+        journal = log_funcs.EvaluationJournal(self.log_dir, "session")
+        journal.append("session_0", image(0), "pug", 1)
+        journal.close()
+        with self.assertRaises(ValueError):
+            journal.append("session_1", image(1), "pug", 1)
+
+        # The answer given before closing is in the journal, the one after it never got queued
+        log_funcs.replay_journal(self.log_dir, "session")
+        records = log_funcs.read_log(self.log_dir, "session")
+        self.assertEqual([record["file_name"] for record in records], ["session_0"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import numpy as np
+import unittest
+
+from resources import predict_funcs
+
+
+LABELS = np.array(["beagle", "boxer", "pug", "shih-tzu", "whippet", "vizsla", "saluki"])
+
+
+class TopKTest(unittest.TestCase):
+    def test_matches_a_full_sort(self):
+        rng = np.random.default_rng(7821)
+        probabilities = rng.dirichlet(np.ones(len(LABELS)), size=50).astype("float32")
+        results = predict_funcs.top_k_predictions(probabilities, LABELS, k=5)
+
+        expected_idx = np.argsort(-probabilities, axis=1)[:, :5]
+        np.testing.assert_array_equal(results["indices"], expected_idx)
+        np.testing.assert_array_equal(results["labels"], LABELS[expected_idx])
+        np.testing.assert_allclose(results["confidences"], np.take_along_axis(probabilities, expected_idx, axis=1))
+
+    def test_single_row_and_small_k(self):
+        results = predict_funcs.top_k_predictions([0.1, 0.6, 0.3], LABELS[:3], k=5)
+        self.assertEqual(len(results), 1)
+        self.assertEqual(list(results[0]["labels"]), ["boxer", "pug", "beagle"])
+
+    def test_entropy(self):
+        probabilities = np.array([np.full(4, 0.25), [1.0, 0.0, 0.0, 0.0]], dtype="float32")
+        entropy = predict_funcs.top_k_predictions(probabilities, LABELS[:4], k=2)["entropy"]
+        np.testing.assert_allclose(entropy, [np.log(4), 0.0], atol=1e-6)
+
+    def test_float16(self):
+        probabilities = np.array([[0.2, 0.5, 0.3]], dtype="float16")
+        results = predict_funcs.top_k_predictions(probabilities, LABELS[:3], k=2, dtype="float16")
+        self.assertEqual(results["confidences"].dtype, np.float16)
+        self.assertEqual(list(results[0]["labels"]), ["boxer", "pug"])
+
+    def test_prediction_dicts(self):
+        pred_dict, = predict_funcs.prediction_dicts(np.array([[0.05, 0.6, 0.15, 0.08, 0.07, 0.03, 0.02]]), LABELS)
+        self.assertEqual(pred_dict["prediction"], "boxer")
+        self.assertEqual(pred_dict["accuracy"], "60.000")
+        self.assertEqual(list(pred_dict["top_5_labels"]), ["boxer", "pug", "shih-tzu", "whippet", "beagle"])
+        self.assertEqual(len(pred_dict["top_5_confidences"]), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import numpy as np
+import os
+import tempfile
+import unittest
+
+from resources import log_funcs, retrain_funcs
+
+
+class SamplesTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.submissions_dir = os.path.join(self.temp_dir.name, "user_submissions")
+        self.log_dir = os.path.join(self.temp_dir.name, "evaluation_logs")
+        os.makedirs(self.submissions_dir)
+        os.makedirs(self.log_dir)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def submit(self, *file_names):
+        for file_name in file_names:
+            open(os.path.join(self.submissions_dir, file_name), "wb").close()
+
+    def test_submissions(self):
+        self.submit("pug_20230601-120000.jpg", "US_Swedish Vallhund_20230601-120100.jpg", "notes.txt")
+        img_paths, breeds, left_out = retrain_funcs.submission_samples(self.submissions_dir, ["pug"])
+        self.assertEqual(breeds, ["pug"])
+        self.assertEqual(left_out, {"swedish_vallhund": 1})
+
+        _, breeds, left_out = retrain_funcs.submission_samples(self.submissions_dir, ["pug"], ["swedish_vallhund"])
+        self.assertEqual(sorted(breeds), ["pug", "swedish_vallhund"])
+        self.assertEqual(left_out, {})
+
+    def test_consumed_submissions_are_skipped(self):
+        self.submit("pug_20230601-120000.jpg", "pug_20230602-120000.jpg")
+        consumed = [retrain_funcs.submission_id("pug_20230601-120000.jpg")]
+        img_paths, _, _ = retrain_funcs.submission_samples(self.submissions_dir, ["pug"], consumed=consumed)
+        self.assertEqual([os.path.basename(img_path) for img_path in img_paths], ["pug_20230602-120000.jpg"])
+
+    def test_evaluations(self):
+        image = np.zeros((4, 4, 3), dtype="uint8")
+        log_funcs.write_log(self.log_dir, "user_log", [
+            {"file_name": "user_log_0", "image_array": image, "breed": "pug", "correct_prediction": 1},
+            {"file_name": "user_log_1", "image_array": image + 1, "breed": "US_beagle", "correct_prediction": 0},
+            {"file_name": "user_log_2", "image_array": image + 2, "breed": "unknown", "correct_prediction": None},
+            {"file_name": "user_log_3", "image_array": image + 3, "breed": "US_swedish_vallhund", "correct_prediction": 0}
+        ])
+        image_ids, _, breeds, image_arrays, left_out = retrain_funcs.evaluation_samples(self.log_dir, ["pug", "beagle"])
+        # Confirmed predictions keep their breed, corrections get the breed the user gave, 'Don't know' says nothing
+        self.assertEqual(image_ids, ["user_log/user_log_0", "user_log/user_log_1"])
+        self.assertEqual(breeds, ["pug", "beagle"])
+        self.assertEqual(left_out, {"swedish_vallhund": 1})
+        np.testing.assert_array_equal(image_arrays[1], image + 1)
+
+        image_ids, _, _, _, _ = retrain_funcs.evaluation_samples(self.log_dir, ["pug", "beagle"], consumed=["user_log/user_log_0"])
+        self.assertEqual(image_ids, ["user_log/user_log_1"])
+
+    def test_versioned_path(self):
+        model_path = os.path.join(self.temp_dir.name, "model.h5")
+        self.assertEqual(retrain_funcs.versioned_path(model_path), os.path.join(self.temp_dir.name, "model-r1.h5"))
+        open(os.path.join(self.temp_dir.name, "model-r2.h5"), "wb").close()
+        self.assertEqual(retrain_funcs.versioned_path(os.path.join(self.temp_dir.name, "model-r1.h5")),
+                         os.path.join(self.temp_dir.name, "model-r3.h5"))
+
+
+if __name__ == "__main__":
+    unittest.main()